@@ -1,44 +1,101 @@
+import functools
 import json
 import logging
+import multiprocessing
+import os
+import signal
 from collections import defaultdict
-from prometheus_client import start_http_server, Counter
+from prometheus_client import Counter
 
-import auth.secrets as secrets
+import infrastructure
 import pika
-from time_bucket_list import TimeBucketList
-import re
+from anomaly_features import BucketFeatures, starts_with_valid_command
+from anomaly_scorers import get_scorer
+from anomaly_snapshots import SnapshotStore
+from diagnostics import record_startup, start_http_server
+from tracing import (
+    DETECTED_AT_HEADER,
+    PUBLISHED_AT_HEADER,
+    SENT_AT_HEADER,
+    TRACE_ID_HEADER,
+    Tracer,
+    now_milliseconds,
+)
 
 
 class AnomalyDetector:
-    def __init__(self):
-        self.message_queue_connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=secrets.get_cloudamqp_url())
-        )
+    def __init__(self, worker_index=0, worker_count=1):
+        self.message_queue_connection = infrastructure.connect_message_queue()
         self.channel = self.message_queue_connection.channel()
 
         # All chat messages are published to the chat exchange
         self.chat_exchange = "chat_fanout"
         self.channel.exchange_declare(self.chat_exchange, exchange_type="fanout")
 
-        self.chat_queue = "chat_anomaly_detection_queue"
-        self.channel.queue_declare(queue=self.chat_queue, durable=True)
+        # Chat is split into a fixed number of partitions by hashing the routing key, which is the
+        # broadcaster Id, on a consistent hash exchange. Each partition has its own queue, and each
+        # worker consumes a disjoint set of partitions, so a broadcaster's state only ever lives in one
+        # worker. The number of partitions caps the number of workers and shouldn't change, since that
+        # would move broadcasters between partitions.
+        self.partition_exchange = "chat_anomaly_partitions"
+        self.channel.exchange_declare(
+            self.partition_exchange, exchange_type="x-consistent-hash"
+        )
+        self.channel.exchange_bind(
+            destination=self.partition_exchange, source=self.chat_exchange
+        )
 
-        self.channel.queue_bind(exchange=self.chat_exchange, queue=self.chat_queue)
+        self.partition_count = int(os.environ.get("ANOMALY_PARTITIONS", 64))
+        self.partitions = [
+            partition
+            for partition in range(self.partition_count)
+            if partition % worker_count == worker_index
+        ]
+        if not self.partitions:
+            logging.error(
+                f"Worker {worker_index} has no partitions since there are more workers than the {self.partition_count} partitions"
+            )
+        for partition in self.partitions:
+            # Only one consumer receives from a partition at a time, so while workers are being added
+            # or removed a partition's new owner waits until the old one has let go of it
+            self.channel.queue_declare(
+                queue=self.get_partition_queue(partition),
+                durable=True,
+                arguments={"x-single-active-consumer": True},
+            )
+            # Every partition gets an equal share of the hash ring
+            self.channel.queue_bind(
+                exchange=self.partition_exchange,
+                queue=self.get_partition_queue(partition),
+                routing_key="1",
+            )
+
+        # A partition's state is snapshotted on an interval and when its worker lets go of it. It's
+        # restored by whichever worker picks it up, right before that worker handles the partition's
+        # first message, so a restart doesn't need 5 minutes of warm up before detecting anomalies.
+        self.snapshot_store = SnapshotStore(
+            os.environ.get("ANOMALY_SNAPSHOT_DIRECTORY", "anomaly_snapshots")
+        )
+        self.snapshot_interval_seconds = int(
+            os.environ.get("ANOMALY_SNAPSHOT_INTERVAL_SECONDS", 30)
+        )
+        self.restored_partitions = set()
+        self.partition_by_broadcaster = {}
 
         self.anomaly_exchange = "anomaly_fanout"
         self.channel.exchange_declare(self.anomaly_exchange, exchange_type="fanout")
 
-        def time_bucket_list_factory(bucket_size):
-            return TimeBucketList(bucket_size)
-
-        self.anomaly_detection_per_broadcaster = defaultdict(
-            lambda: time_bucket_list_factory(bucket_size=5)
-        )
+        # Features of every broadcaster's chat are extracted per 5 second bucket and scored together
+        # when the bucket closes. ANOMALY_SCORER picks how the features are combined.
+        self.scorer = get_scorer(os.environ.get("ANOMALY_SCORER", "message_count"))
+        self.bucket_features = BucketFeatures(bucket_size=5, features=self.scorer.FEATURES)
         self.broadcaster_anomaly_cooldown = 30
         self.last_broadcaster_anomaly = defaultdict(int)
 
         self.total_message_count = 0
 
+        self.tracer = Tracer("anomaly_detection")
+
         self.anomaly_counter = Counter(
             "streamer_anomaly_count",
             "Number of anomalies per streamer",
@@ -51,18 +108,115 @@ class AnomalyDetector:
     def shutdown(self):
         self.message_queue_connection.close()
 
+    def get_partition_queue(self, partition):
+        return f"chat_anomaly_detection_queue.{partition}"
+
     def start_consuming_chats(self):
         self.channel.basic_qos(prefetch_count=1)
-        self.channel.basic_consume(
-            queue=self.chat_queue, on_message_callback=self.handle_chat_message
+        for partition in self.partitions:
+            self.channel.basic_consume(
+                queue=self.get_partition_queue(partition),
+                on_message_callback=functools.partial(
+                    self.handle_chat_message, partition=partition
+                ),
+            )
+        self.message_queue_connection.call_later(
+            self.snapshot_interval_seconds, self.snapshot_on_interval
         )
-        logging.info("Start consuming chats from queue")
+        logging.info(f"Start consuming chats from partitions {self.partitions}")
         self.channel.start_consuming()
 
-    def handle_chat_message(self, ch, method, properties, body):
+    def snapshot_on_interval(self):
+        self.write_snapshots()
+        self.message_queue_connection.call_later(
+            self.snapshot_interval_seconds, self.snapshot_on_interval
+        )
+
+    def request_hand_over(self):
+        # Safe to call from a signal handler. The hand over runs on the connection's thread between
+        # messages, so the snapshots are consistent with what's been acked.
+        self.message_queue_connection.add_callback_threadsafe(self.hand_over)
+
+    def hand_over(self):
+        # Snapshots every partition before cancelling the consumers, since cancelling is what lets the
+        # next owner start receiving from them
+        self.write_snapshots()
+        self.channel.stop_consuming()
+
+    def write_snapshots(self):
+        bucket = self.bucket_features.open_bucket
+        if bucket is None:
+            return
+
+        broadcasters_by_partition = defaultdict(list)
+        for broadcaster_id, partition in self.partition_by_broadcaster.items():
+            broadcasters_by_partition[partition].append(broadcaster_id)
+
+        for partition in self.restored_partitions:
+            rows = [
+                (
+                    broadcaster_id,
+                    last_bucket,
+                    self.last_broadcaster_anomaly[broadcaster_id],
+                    states,
+                )
+                for broadcaster_id, last_bucket, states in self.scorer.get_snapshot(
+                    broadcasters_by_partition[partition]
+                )
+            ]
+            self.snapshot_store.write(partition, bucket, rows)
+            logging.debug(f"Snapshotted {len(rows)} broadcasters in partition {partition}")
+
+    def restore_partition(self, partition, timestamp):
+        # timestamp is when the partition's first message since the snapshot was sent, in milliseconds
+        snapshot_bucket, rows = self.snapshot_store.read(partition)
+
+        # The buckets between the snapshot and now weren't seen, so rather than treat every broadcaster
+        # as having gone quiet for them, fast forward their history to the current bucket. Otherwise a
+        # restart longer than 5 minutes would look like every stream starting over.
+        bucket = timestamp // 1000 // self.bucket_features.bucket_size
+        skipped_buckets = max(bucket - snapshot_bucket, 0) if rows else 0
+        self.scorer.restore(
+            (broadcaster_id, last_bucket + skipped_buckets, states)
+            for broadcaster_id, last_bucket, _, states in rows
+        )
+        for broadcaster_id, _, last_anomaly, _ in rows:
+            self.last_broadcaster_anomaly[broadcaster_id] = last_anomaly
+            self.partition_by_broadcaster[broadcaster_id] = partition
+
+        logging.info(
+            f"Restored {len(rows)} broadcasters in partition {partition}, skipping {skipped_buckets} buckets"
+        )
+        self.restored_partitions.add(partition)
+
+    def handle_chat_message(self, ch, method, properties, body, partition=None):
+        consumed_at = now_milliseconds()
+        headers = properties.headers or {}
+        self.tracer.observe("queue_dwell", headers.get(PUBLISHED_AT_HEADER), consumed_at)
+
+        with self.tracer.time_stage("processing"):
+            self.process_chat_message(body, partition)
+
+        if self.tracer.is_sampled(properties.message_id):
+            self.tracer.export(
+                properties.message_id,
+                {
+                    "sent": headers.get(SENT_AT_HEADER),
+                    "published": headers.get(PUBLISHED_AT_HEADER),
+                    "consumed": consumed_at,
+                },
+            )
+
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+    def process_chat_message(self, body, partition=None):
         message_fields = json.loads(body.decode())
 
         broadcaster_id = message_fields["broadcaster_id"]
+        if partition is not None:
+            if partition not in self.restored_partitions:
+                self.restore_partition(partition, message_fields["timestamp"])
+            self.partition_by_broadcaster[broadcaster_id] = partition
 
         if self.total_message_count % 100000 == 0:
             logging.info(f"Messages received {self.total_message_count}")
@@ -70,56 +224,83 @@ class AnomalyDetector:
         self.total_message_count += 1
 
         logging.debug(
-            f"Message, {message_fields['message_id']}, received in {broadcaster_id}'s chat room"
+            "Message, %s, received in %s's chat room",
+            message_fields["message_id"],
+            broadcaster_id,
         )
 
-        def starts_with_valid_command(s):
-            # '!' followed by an alphanumeric string and then any other character
-            pattern = r"^![a-zA-Z0-9]+.*$"
-            return bool(re.match(pattern, s))
-
         # Don't count commands in anomaly detection. We don't want to clip streamers doing giveaways, predictions, etc.
-        message_text = json.loads(message_fields["message"])
-        if starts_with_valid_command(message_text["text"]):
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+        message = json.loads(message_fields["message"])
+        if starts_with_valid_command(message["text"]):
             return
 
-        timestamp = message_fields["timestamp"] // 1000
-        self.anomaly_detection_per_broadcaster[broadcaster_id].append(timestamp)
-
-        # Only check for anomalies if we have at least 5 minutes (60 buckets * 5 second bucket size) of data
+        closed_buckets = self.bucket_features.append(
+            broadcaster_id, message_fields["timestamp"], message
+        )
+        for bucket, broadcaster_ids, columns, latest_messages in closed_buckets:
+            scores = self.scorer.score(bucket, broadcaster_ids, columns)
+            for broadcaster_id, score, (latest_timestamp, latest_message_id) in zip(
+                broadcaster_ids, scores, latest_messages
+            ):
+                if score >= 1:
+                    self.handle_anomaly(
+                        broadcaster_id, score, latest_timestamp, latest_message_id
+                    )
+
+    def handle_anomaly(self, broadcaster_id, score, sent_timestamp, message_id):
+        # sent_timestamp is when the latest message in the anomalous bucket was sent, in milliseconds,
+        # and message_id is that message's Id
+        timestamp = sent_timestamp // 1000
         if (
-            self.anomaly_detection_per_broadcaster[broadcaster_id].size() > 60
-            and self.anomaly_detection_per_broadcaster[
-                broadcaster_id
-            ].check_for_anomaly()
+            timestamp - self.last_broadcaster_anomaly[broadcaster_id]
+            <= self.broadcaster_anomaly_cooldown
         ):
-            if (
-                timestamp - self.last_broadcaster_anomaly[broadcaster_id]
-                > self.broadcaster_anomaly_cooldown
-            ):
-                logging.info(f"Anomaly detected in {broadcaster_id}'s chat room")
-                self.last_broadcaster_anomaly[broadcaster_id] = timestamp
+            logging.debug(
+                f"Anomaly detected in {broadcaster_id}'s chat room, but we're in the cooldown period"
+            )
+            return
 
-                message = json.dumps(
-                    {"broadcaster_id": broadcaster_id, "timestamp": timestamp}
-                )
-                self.channel.basic_publish(
-                    exchange=self.anomaly_exchange,
-                    routing_key="",
-                    body=message,
-                    properties=pika.BasicProperties(
-                        delivery_mode=pika.DeliveryMode.Persistent
-                    ),
-                )
+        logging.info(f"Anomaly detected in {broadcaster_id}'s chat room with score {score:.2f}")
+        self.last_broadcaster_anomaly[broadcaster_id] = timestamp
+
+        message = json.dumps({"broadcaster_id": broadcaster_id, "timestamp": timestamp})
+        detected_at = now_milliseconds()
+        self.channel.basic_publish(
+            exchange=self.anomaly_exchange,
+            routing_key="",
+            body=message,
+            properties=pika.BasicProperties(
+                delivery_mode=pika.DeliveryMode.Persistent,
+                headers={
+                    SENT_AT_HEADER: sent_timestamp,
+                    DETECTED_AT_HEADER: detected_at,
+                    TRACE_ID_HEADER: message_id,
+                },
+            ),
+        )
+        self.tracer.observe("detection", sent_timestamp, detected_at)
 
-                self.anomaly_counter.labels(broadcaster_id=broadcaster_id).inc()
-            else:
-                logging.debug(
-                    f"Anomaly detected in {broadcaster_id}'s chat room, but we're in the cooldown period"
-                )
+        self.anomaly_counter.labels(broadcaster_id=broadcaster_id).inc()
 
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+def run_worker(worker_index, worker_count):
+    logging.basicConfig(
+        filemode="w",
+        level=logging.INFO,
+        format=f"%(asctime)s - %(name)s - worker {worker_index} - %(levelname)s - %(message)s",
+        # Workers are forked after the parent configured logging, so replace its handler
+        force=True,
+    )
+
+    # Each worker serves its own metrics, on the port after the previous worker's
+    start_http_server(9200 + worker_index)
+
+    session = AnomalyDetector(worker_index, worker_count)
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signal_number, lambda signum, frame: session.request_hand_over())
+    record_startup("anomaly_detection")
+    session.start_consuming_chats()
+    session.shutdown()
 
 
 def main():
@@ -129,10 +310,30 @@ def main():
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     )
 
-    start_http_server(9200)
-
-    session = AnomalyDetector()
-    session.start_consuming_chats()
+    # ANOMALY_WORKERS processes run on this machine, one per core by default. When workers are spread
+    # over several machines, ANOMALY_WORKER_COUNT is the total and ANOMALY_FIRST_WORKER is the index
+    # of this machine's first worker.
+    local_worker_count = int(os.environ.get("ANOMALY_WORKERS", os.cpu_count()))
+    worker_count = int(os.environ.get("ANOMALY_WORKER_COUNT", local_worker_count))
+    first_worker = int(os.environ.get("ANOMALY_FIRST_WORKER", 0))
+
+    workers = [
+        multiprocessing.Process(target=run_worker, args=(worker_index, worker_count))
+        for worker_index in range(first_worker, first_worker + local_worker_count)
+    ]
+    for worker in workers:
+        worker.start()
+    logging.info(f"Started workers {first_worker} to {first_worker + local_worker_count - 1} of {worker_count}")
+
+    # Workers snapshot their partitions when they're terminated, so pass the signal on and wait
+    def terminate_workers(signum, frame):
+        for worker in workers:
+            worker.terminate()
+
+    signal.signal(signal.SIGTERM, terminate_workers)
+    signal.signal(signal.SIGINT, terminate_workers)
+    for worker in workers:
+        worker.join()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,192 @@
+import re
+from collections import Counter
+
+# '!' followed by an alphanumeric string and then any other character
+COMMAND_PATTERN = re.compile(r"^![a-zA-Z0-9]+.*$")
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Signals computed for every broadcaster's bucket, in the order scorers receive them
+FEATURES = (
+    "message_count",
+    "unique_chatters",
+    "emote_only_ratio",
+    "similar_message_cluster_size",
+    "bits",
+)
+
+# Copypasta is compared on its first words, so small additions at the end still land in one cluster
+FINGERPRINT_LENGTH = 64
+
+
+def starts_with_valid_command(text):
+    return COMMAND_PATTERN.match(text) is not None
+
+
+def is_emote_only(text, emotes):
+    # emotes maps each emote Id to the positions it was used at. The message is emote only when the
+    # emotes cover every character other than the spaces between them.
+    if not emotes:
+        return False
+    emote_characters = sum(
+        int(position["end_position"]) - int(position["start_position"]) + 1
+        for positions in emotes.values()
+        for position in positions
+    )
+    return emote_characters >= len(text) - text.count(" ")
+
+
+def get_fingerprint(text):
+    # Case, punctuation and spacing are ignored when grouping similar messages
+    return " ".join(TOKEN_PATTERN.findall(text.lower()))[:FINGERPRINT_LENGTH]
+
+
+# Accumulates the open bucket of every broadcaster in columns, one row per broadcaster. Each message
+# only updates its broadcaster's row. The features themselves are computed once per bucket for every
+# broadcaster together when the bucket closes, so adding a feature costs per bucket rather than per
+# message.
+#
+# Every broadcaster shares the same bucket boundaries, and a bucket closes once a message from a later
+# bucket arrives. Timestamps come from Twitch, so they agree across chat rooms. A late message is
+# counted in the open bucket.
+#
+# Only the features passed in are accumulated and extracted, so a scorer that just looks at message
+# count doesn't pay for matching emotes and fingerprinting text on every message.
+class BucketFeatures:
+    def __init__(self, bucket_size=5, max_idle_buckets=60, features=FEATURES):
+        self.bucket_size = bucket_size
+        self.features = features
+        self.counts_chatters = "unique_chatters" in features
+        self.counts_bits = "bits" in features
+        self.fingerprints_text = "similar_message_cluster_size" in features
+        # Emote only messages aren't fingerprinted, so fingerprinting needs the emote check too
+        self.checks_emotes = "emote_only_ratio" in features or self.fingerprints_text
+        # Broadcasters keep a row, and get a zero row for every bucket they're quiet in, until they've
+        # been quiet for this many buckets
+        self.max_idle_buckets = max_idle_buckets
+        self.open_bucket = None
+
+        # broadcaster_id -> row
+        self.rows = {}
+        self.broadcaster_ids = []
+        self.last_active_buckets = []
+        # (timestamp, message Id) of each broadcaster's latest message in the bucket
+        self.latest_messages = []
+        self.message_counts = []
+        self.chatters = []
+        self.emote_only_counts = []
+        self.fingerprints = []
+        self.bits = []
+
+    def add_row(self, broadcaster_id):
+        row = self.rows[broadcaster_id] = len(self.broadcaster_ids)
+        self.broadcaster_ids.append(broadcaster_id)
+        self.last_active_buckets.append(self.open_bucket)
+        self.latest_messages.append((0, None))
+        self.message_counts.append(0)
+        self.chatters.append(set() if self.counts_chatters else None)
+        self.emote_only_counts.append(0)
+        self.fingerprints.append(Counter() if self.fingerprints_text else None)
+        self.bits.append(0)
+        return row
+
+    def append(self, broadcaster_id, timestamp, message):
+        # timestamp is in milliseconds and message is the deserialized output of
+        # twitch_proxy.serialize_message. Returns a (bucket, broadcaster_ids, columns,
+        # latest_messages) tuple for every bucket this message closed, where columns maps each
+        # feature to its value for each broadcaster.
+        bucket = timestamp // 1000 // self.bucket_size
+        closed = []
+        if self.open_bucket is None:
+            self.open_bucket = bucket
+        elif bucket > self.open_bucket:
+            closed = self.close_buckets(bucket)
+
+        row = self.rows.get(broadcaster_id)
+        if row is None:
+            row = self.add_row(broadcaster_id)
+
+        self.last_active_buckets[row] = self.open_bucket
+        if timestamp >= self.latest_messages[row][0]:
+            self.latest_messages[row] = (timestamp, message["id"])
+        self.message_counts[row] += 1
+
+        if self.counts_bits:
+            self.bits[row] += message["bits"] or 0
+
+        if self.counts_chatters:
+            user_id = message["user"]["id"]
+            if user_id is not None:
+                self.chatters[row].add(user_id)
+
+        if self.checks_emotes:
+            text = message["text"]
+            if is_emote_only(text, message["emotes"]):
+                self.emote_only_counts[row] += 1
+            elif self.fingerprints_text:
+                fingerprint = get_fingerprint(text)
+                if fingerprint:
+                    self.fingerprints[row][fingerprint] += 1
+
+        return closed
+
+    def close_buckets(self, bucket):
+        closed = [self.extract()]
+        # Buckets nobody chatted in are still closed so quiet broadcasters get zero rows, but only as
+        # many as it takes for every row to go idle
+        skipped = min(bucket - self.open_bucket - 1, self.max_idle_buckets)
+        for skipped_bucket in range(bucket - skipped, bucket):
+            self.open_bucket = skipped_bucket
+            self.reset_rows()
+            closed.append(self.extract())
+
+        self.open_bucket = bucket
+        self.reset_rows()
+        return closed
+
+    def extract(self):
+        message_counts = self.message_counts
+        columns = {"message_count": list(message_counts)}
+        if self.counts_chatters:
+            columns["unique_chatters"] = [len(chatters) for chatters in self.chatters]
+        if "emote_only_ratio" in self.features:
+            columns["emote_only_ratio"] = [
+                emote_only_count / message_count if message_count else 0.0
+                for emote_only_count, message_count in zip(self.emote_only_counts, message_counts)
+            ]
+        if self.fingerprints_text:
+            columns["similar_message_cluster_size"] = [
+                max(fingerprints.values()) if fingerprints else 0
+                for fingerprints in self.fingerprints
+            ]
+        if self.counts_bits:
+            columns["bits"] = list(self.bits)
+        return (
+            self.open_bucket,
+            list(self.broadcaster_ids),
+            columns,
+            list(self.latest_messages),
+        )
+
+    def reset_rows(self):
+        # Drops broadcasters that have gone idle and zeroes everyone else for the next bucket
+        cutoff = self.open_bucket - self.max_idle_buckets
+        kept = [
+            row
+            for row, last_active_bucket in enumerate(self.last_active_buckets)
+            if last_active_bucket >= cutoff
+        ]
+        broadcaster_ids = [self.broadcaster_ids[row] for row in kept]
+        last_active_buckets = [self.last_active_buckets[row] for row in kept]
+
+        self.rows = {broadcaster_id: row for row, broadcaster_id in enumerate(broadcaster_ids)}
+        self.broadcaster_ids = broadcaster_ids
+        self.last_active_buckets = last_active_buckets
+        self.latest_messages = [(0, None)] * len(kept)
+        self.message_counts = [0] * len(kept)
+        # Sets and counters are only made for the features being accumulated
+        self.chatters = [set() for _ in kept] if self.counts_chatters else [None] * len(kept)
+        self.emote_only_counts = [0] * len(kept)
+        self.fingerprints = (
+            [Counter() for _ in kept] if self.fingerprints_text else [None] * len(kept)
+        )
+        self.bits = [0] * len(kept)
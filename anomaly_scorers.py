@@ -0,0 +1,161 @@
+import abc
+
+from anomaly_features import FEATURES
+from time_bucket_list import RunningVariance
+
+
+# Scorers keep a running mean and variance of every feature per broadcaster and score each closed
+# bucket against them. A score of 1 or more is an anomaly. Broadcasters that come back after a long
+# gap start over, since that's usually a new stream.
+#
+# FEATURES lists the features a scorer reads, and only those are extracted from chat. Snapshots still
+# hold a state for every feature, empty for the ones a scorer doesn't read, so switching scorers
+# doesn't invalidate them.
+class FeatureHistoryScorer(abc.ABC):
+    FEATURES = FEATURES
+
+    def __init__(self, min_history_buckets=60, max_gap_buckets=60):
+        # We need at least 5 minutes (60 buckets * 5 second bucket size) of data before scoring
+        self.min_history_buckets = min_history_buckets
+        self.max_gap_buckets = max_gap_buckets
+        # broadcaster_id -> [last bucket, {feature: RunningVariance}]
+        self.history = {}
+
+    def get_history(self, broadcaster_id, bucket):
+        history = self.history.get(broadcaster_id)
+        if history is None or bucket - history[0] > self.max_gap_buckets:
+            history = self.history[broadcaster_id] = [
+                bucket,
+                {feature: RunningVariance() for feature in self.FEATURES},
+            ]
+        history[0] = bucket
+        return history[1]
+
+    def score(self, bucket, broadcaster_ids, columns):
+        # Returns a score for every broadcaster in the bucket
+        rows = zip(*(columns[feature] for feature in self.FEATURES))
+        scores = [
+            self.score_row(
+                self.get_history(broadcaster_id, bucket), dict(zip(self.FEATURES, row))
+            )
+            for broadcaster_id, row in zip(broadcaster_ids, rows)
+        ]
+
+        cutoff = bucket - self.max_gap_buckets
+        self.history = {
+            broadcaster_id: history
+            for broadcaster_id, history in self.history.items()
+            if history[0] >= cutoff
+        }
+        return scores
+
+    def get_snapshot(self, broadcaster_ids):
+        # Returns (broadcaster_id, last bucket, [(count, mean, squared differences) per feature]) for
+        # each of the broadcasters that has history
+        empty_state = RunningVariance().get_state()
+        rows = []
+        for broadcaster_id in broadcaster_ids:
+            history = self.history.get(broadcaster_id)
+            if history is not None:
+                last_bucket, variances = history
+                rows.append(
+                    (
+                        broadcaster_id,
+                        last_bucket,
+                        [
+                            variances[feature].get_state() if feature in variances else empty_state
+                            for feature in FEATURES
+                        ],
+                    )
+                )
+        return rows
+
+    def restore(self, rows):
+        # rows are in the form returned by get_snapshot
+        for broadcaster_id, last_bucket, states in rows:
+            self.history[broadcaster_id] = [
+                last_bucket,
+                {
+                    feature: RunningVariance.from_state(*state)
+                    for feature, state in zip(FEATURES, states)
+                    if feature in self.FEATURES
+                },
+            ]
+
+    @abc.abstractmethod
+    def score_row(self, variances, values):
+        # Appends the row's values to its broadcaster's history and returns its score
+        pass
+
+
+class MessageCountScorer(FeatureHistoryScorer):
+    # The original rule, which only looks at message count: an anomaly is a bucket with more than 20
+    # standard deviations worth of messages
+    FEATURES = ("message_count",)
+
+    def __init__(self, multiplier=20, **kwargs):
+        super().__init__(**kwargs)
+        self.multiplier = multiplier
+
+    def score_row(self, variances, values):
+        variance = variances["message_count"]
+        variance.append(values["message_count"])
+        standard_deviation = variance.standard_deviation()
+        if variance.number_of_buckets() <= self.min_history_buckets or not standard_deviation:
+            return 0.0
+        return values["message_count"] / (self.multiplier * standard_deviation)
+
+
+class WeightedZScoreScorer(FeatureHistoryScorer):
+    # Sums how many standard deviations above its mean each feature is, weighted per feature. Emote
+    # spam, copypasta waves and bits bursts each push up their own feature, so they're caught even
+    # when the message count barely moves.
+    DEFAULT_WEIGHTS = {
+        "message_count": 1.0,
+        "unique_chatters": 1.0,
+        "emote_only_ratio": 0.5,
+        "similar_message_cluster_size": 1.0,
+        "bits": 0.5,
+    }
+
+    # A feature that's been constant would otherwise score infinitely on its first change
+    MIN_STANDARD_DEVIATIONS = {
+        "message_count": 1.0,
+        "unique_chatters": 1.0,
+        "emote_only_ratio": 0.05,
+        "similar_message_cluster_size": 1.0,
+        "bits": 100.0,
+    }
+
+    def __init__(self, threshold=8, weights=None, **kwargs):
+        super().__init__(**kwargs)
+        self.threshold = threshold
+        self.weights = weights or self.DEFAULT_WEIGHTS
+
+    def score_row(self, variances, values):
+        # Score against the history before this bucket so a spike doesn't dampen itself
+        has_history = variances["message_count"].number_of_buckets() > self.min_history_buckets
+        total = 0.0
+        for feature, weight in self.weights.items():
+            variance = variances[feature]
+            value = values[feature]
+            if has_history:
+                standard_deviation = max(
+                    variance.standard_deviation(), self.MIN_STANDARD_DEVIATIONS[feature]
+                )
+                total += weight * max((value - variance.mean()) / standard_deviation, 0.0)
+            variance.append(value)
+        return total / self.threshold
+
+
+SCORERS = {
+    "message_count": MessageCountScorer,
+    "weighted_z_score": WeightedZScoreScorer,
+}
+
+
+def get_scorer(name):
+    scorer = SCORERS.get(name)
+    if scorer is None:
+        raise ValueError(f"Unknown anomaly scorer {name}, expected one of {', '.join(SCORERS)}")
+    return scorer()
@@ -0,0 +1,76 @@
+import logging
+import os
+import struct
+
+from anomaly_features import FEATURES
+
+# Snapshots of the anomaly detector's per-broadcaster state, one file per partition, so a partition's
+# history moves with it when it's handed to another worker and survives restarts. Each file is a header,
+# which includes the bucket the detector was in when it was taken, followed by a fixed size record per
+# broadcaster:
+#   broadcaster_id, last bucket, last anomaly timestamp, then (count, mean, squared differences) for
+#   every feature in FEATURES order
+SNAPSHOT_MAGIC = b"ANOM"
+SNAPSHOT_VERSION = 2
+HEADER = struct.Struct("<4sHHqI")
+RECORD = struct.Struct("<qqq" + "qdd" * len(FEATURES))
+
+
+def encode_snapshot(bucket, rows):
+    # rows are (broadcaster_id, last_bucket, last_anomaly, [(count, mean, squared differences)])
+    buffer = bytearray(
+        HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(FEATURES), bucket, len(rows))
+    )
+    for broadcaster_id, last_bucket, last_anomaly, states in rows:
+        buffer += RECORD.pack(
+            broadcaster_id,
+            last_bucket,
+            last_anomaly,
+            *(value for state in states for value in state),
+        )
+    return bytes(buffer)
+
+
+def decode_snapshot(data):
+    # Returns the bucket the snapshot was taken in along with its rows
+    magic, version, feature_count, bucket, count = HEADER.unpack_from(data, 0)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or feature_count != len(FEATURES):
+        raise ValueError("Snapshot was written by an incompatible version of the anomaly detector")
+
+    rows = []
+    for values in RECORD.iter_unpack(data[HEADER.size : HEADER.size + count * RECORD.size]):
+        broadcaster_id, last_bucket, last_anomaly = values[:3]
+        states = [tuple(values[index : index + 3]) for index in range(3, len(values), 3)]
+        rows.append((broadcaster_id, last_bucket, last_anomaly, states))
+    return bucket, rows
+
+
+class SnapshotStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get_path(self, partition):
+        return os.path.join(self.directory, f"partition-{partition}.snapshot")
+
+    def write(self, partition, bucket, rows):
+        # Written to a temporary file and renamed so a reader never sees half a snapshot
+        path = self.get_path(partition)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(encode_snapshot(bucket, rows))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, path)
+
+    def read(self, partition):
+        # Returns (bucket, rows), or no rows if the partition has never been snapshotted or the
+        # snapshot is unreadable
+        try:
+            with open(self.get_path(partition), "rb") as f:
+                return decode_snapshot(f.read())
+        except FileNotFoundError:
+            return None, []
+        except (ValueError, struct.error) as e:
+            logging.error(f"Ignoring the snapshot of partition {partition}: {e}")
+            return None, []
@@ -1,5 +1,7 @@
 import json
 import os
+import threading
+import time
 
 # Constants for paths
 SECRETS_BASE_PATH = "secrets"
@@ -9,105 +11,93 @@ REDIS_BASE_PATH = os.path.join(SECRETS_BASE_PATH, "redis")
 NEON_BASE_PATH = os.path.join(SECRETS_BASE_PATH, "neon")
 CLOUDAMQP_BASE_PATH = os.path.join(SECRETS_BASE_PATH, "cloudamqp")
 
+TWITCH_API_SECRETS_PATH = os.path.join(TWITCH_API_BASE_PATH, "twitch-api-app-secret.json")
+TWITCH_TOKENS_PATH = os.path.join(TWITCH_API_BASE_PATH, "access-and-refresh-token.json")
+ASTRA_SECRETS_PATH = os.path.join(ASTRA_BASE_PATH, "live_stream_data-token.json")
+ASTRA_BUNDLE_PATH = os.path.join(ASTRA_BASE_PATH, "secure-connect-live-stream-data.zip")
+REDIS_SECRETS_PATH = os.path.join(REDIS_BASE_PATH, "redis-secret.json")
+NEON_SECRETS_PATH = os.path.join(NEON_BASE_PATH, "neon-secret.json")
+CLOUDAMQP_SECRETS_PATH = os.path.join(CLOUDAMQP_BASE_PATH, "cloudamqp-secret.json")
+
 
 def load_secrets(filepath):
     with open(filepath) as f:
         return json.load(f)
 
 
-def load_secrets_once(func):
-    def wrapper(*args, **kwargs):
-        if not hasattr(func, "has_run"):
-            func.secrets = func(*args, **kwargs)
-            func.has_run = True
-        return func.secrets
-
-    return wrapper
-
-
-@load_secrets_once
-def load_twitch_api_secrets():
-    return load_secrets(
-        os.path.join(TWITCH_API_BASE_PATH, "twitch-api-app-secret.json")
-    )
-
-
-@load_secrets_once
-def load_twitch_tokens():
-    return load_secrets(
-        os.path.join(TWITCH_API_BASE_PATH, "access-and-refresh-token.json")
-    )
-
-
-@load_secrets_once
-def load_astra_secrets():
-    cloud_config = {
-        "secure_connect_bundle": os.path.join(
-            ASTRA_BASE_PATH, "secure-connect-live-stream-data.zip"
-        )
-    }
-    secrets = load_secrets(os.path.join(ASTRA_BASE_PATH, "live_stream_data-token.json"))
-    return secrets, cloud_config
-
-
-@load_secrets_once
-def load_redis_secrets():
-    return load_secrets(os.path.join(REDIS_BASE_PATH, "redis-secret.json"))
+# Every secrets file is read the first time it's needed and then served from memory. Files are
+# watched for changes, so a rotated secret or refreshed Twitch token is picked up without a restart.
+# Watching means checking the file's modification time, at most once per check interval, so looking
+# up a secret on a hot path doesn't touch the disk.
+class SecretsConfig:
+    def __init__(self, check_interval_seconds=5):
+        self.check_interval_seconds = check_interval_seconds
+        self.lock = threading.Lock()
+        # path -> (modification time, contents)
+        self.files = {}
+        # path -> when its modification time was last checked
+        self.checked_at = {}
 
+    def get(self, path):
+        now = time.monotonic()
+        with self.lock:
+            cached = self.files.get(path)
+            if cached is not None and now - self.checked_at[path] < self.check_interval_seconds:
+                return cached[1]
 
-@load_secrets_once
-def load_neon_secrets():
-    return load_secrets(os.path.join(NEON_BASE_PATH, "neon-secret.json"))
+            self.checked_at[path] = now
+            modified_at = os.stat(path).st_mtime_ns
+            if cached is None or cached[0] != modified_at:
+                cached = self.files[path] = (modified_at, load_secrets(path))
+            return cached[1]
 
 
-@load_secrets_once
-def load_cloudamqp_secrets():
-    return load_secrets(os.path.join(CLOUDAMQP_BASE_PATH, "cloudamqp-secret.json"))
+CONFIG = SecretsConfig()
 
 
 def get_twitch_api_client_id():
-    return load_twitch_api_secrets()["clientId"]
+    return CONFIG.get(TWITCH_API_SECRETS_PATH)["clientId"]
 
 
 def get_twitch_api_secret():
-    return load_twitch_api_secrets()["secret"]
+    return CONFIG.get(TWITCH_API_SECRETS_PATH)["secret"]
 
 
 def get_twitch_access_token():
-    return load_twitch_tokens()["access_token"]
+    return CONFIG.get(TWITCH_TOKENS_PATH)["access_token"]
 
 
 def get_twitch_refresh_token():
-    return load_twitch_tokens()["refresh_token"]
+    return CONFIG.get(TWITCH_TOKENS_PATH)["refresh_token"]
 
 
 def get_astra_client_id():
-    return load_astra_secrets()[0]["clientId"]
+    return CONFIG.get(ASTRA_SECRETS_PATH)["clientId"]
 
 
 def get_astra_secret():
-    return load_astra_secrets()[0]["secret"]
+    return CONFIG.get(ASTRA_SECRETS_PATH)["secret"]
 
 
 def get_astra_cloud_config():
-    return load_astra_secrets()[1]
+    return {"secure_connect_bundle": ASTRA_BUNDLE_PATH}
 
 
 def get_redis_host_url():
-    return load_redis_secrets()["host"]
+    return CONFIG.get(REDIS_SECRETS_PATH)["host"]
 
 
 def get_redis_host_port():
-    return load_redis_secrets()["port"]
+    return CONFIG.get(REDIS_SECRETS_PATH)["port"]
 
 
 def get_redis_host_password():
-    return load_redis_secrets()["password"]
+    return CONFIG.get(REDIS_SECRETS_PATH)["password"]
 
 
 def get_neon_url():
-    return load_neon_secrets()["neonURL"]
+    return CONFIG.get(NEON_SECRETS_PATH)["neonURL"]
 
 
 def get_cloudamqp_url():
-    return "127.0.0.1"  # load_cloudamqp_secrets()["cloudAMQPURL"]
+    return "127.0.0.1"  # CONFIG.get(CLOUDAMQP_SECRETS_PATH)["cloudAMQPURL"]
@@ -0,0 +1,63 @@
+import json
+import time
+import uuid
+
+from bench.synthetic_chat import SyntheticChat
+from chat_message_codec import decode_message, encode_message
+
+# Reports how much smaller encoded messages are than the JSON text we used to store, and how fast
+# they are to encode and decode. Run with: python -m bench.chat_message_codec
+
+
+def main(message_count=20000):
+    chat = SyntheticChat()
+    timestamp = 1706408359963
+    corpus = []
+    for i in range(message_count):
+        fields = chat.message_fields(24538518, "sneakylol", timestamp + i * 37)
+        corpus.append(
+            (
+                fields["broadcaster_id"],
+                fields["timestamp"],
+                uuid.UUID(fields["message_id"]),
+                fields["message"],
+            )
+        )
+
+    start = time.perf_counter()
+    encoded = [encode_message(*row) for row in corpus]
+    encode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = [
+        decode_message(broadcaster_id, timestamp, message_id, message_blob)
+        for (broadcaster_id, timestamp, message_id, _), message_blob in zip(
+            corpus, encoded
+        )
+    ]
+    decode_seconds = time.perf_counter() - start
+
+    mismatches = sum(
+        original[3] != message for original, message in zip(corpus, decoded)
+    )
+    text_bytes = sum(len(row[3].encode()) for row in corpus)
+    encoded_bytes = sum(len(message_blob) for message_blob in encoded)
+
+    print(
+        json.dumps(
+            {
+                "messages": message_count,
+                "text_bytes_per_message": text_bytes / message_count,
+                "encoded_bytes_per_message": encoded_bytes / message_count,
+                "compression_ratio": text_bytes / encoded_bytes,
+                "encode_messages_per_second": message_count / encode_seconds,
+                "decode_messages_per_second": message_count / decode_seconds,
+                "round_trip_mismatches": mismatches,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import bisect
+import itertools
+from collections import defaultdict
+from types import SimpleNamespace
+
+from chat_batch_planner import plan_chat_batches
+from datetime_helpers import get_month
+
+# In-process stand-ins for the infrastructure the services talk to, so the services' own code can be
+# benchmarked without RabbitMQ, Cassandra or Twitch. They implement only what the services use.
+
+
+class FakeChannel:
+    def __init__(self):
+        self.published = []
+        self.acked = 0
+
+    def confirm_delivery(self):
+        pass
+
+    def exchange_declare(self, exchange, exchange_type=None):
+        pass
+
+    def exchange_bind(self, destination, source, routing_key=""):
+        pass
+
+    def queue_declare(self, queue, durable=False, arguments=None):
+        pass
+
+    def queue_bind(self, exchange, queue, routing_key=None):
+        pass
+
+    def basic_qos(self, prefetch_count=0):
+        pass
+
+    def basic_consume(self, queue, on_message_callback):
+        pass
+
+    def stop_consuming(self):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.published.append((exchange, body, properties))
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acked = delivery_tag if multiple else self.acked + 1
+
+    def basic_nack(self, delivery_tag, multiple=False, requeue=True):
+        pass
+
+
+# Replaces pika.BlockingConnection
+class FakeBlockingConnection:
+    def __init__(self, parameters=None):
+        self.fake_channel = FakeChannel()
+
+    def channel(self):
+        return self.fake_channel
+
+    def call_later(self, delay, callback):
+        pass
+
+    def add_callback_threadsafe(self, callback):
+        callback()
+
+    def close(self):
+        pass
+
+
+# Replaces chat_database_connection.DatabaseConnection. Rows are kept sorted per partition so reads
+# behave like slices of a Cassandra partition.
+class FakeChatDatabase:
+    def __init__(self, keyspace, write_profile=None, read_profile=None):
+        self.partitions = defaultdict(list)
+        self.user_partitions = defaultdict(list)
+        self.threads = defaultdict(list)
+        self.chat_stats = {}
+        self.max_batch_bytes = 5 * 1024
+
+    def close(self):
+        pass
+
+    def insert_chats(self, messages):
+        batches, single_rows = plan_chat_batches(messages, self.max_batch_bytes)
+        for rows in itertools.chain((rows for rows, _ in batches), [single_rows]):
+            for broadcaster_id, timestamp, message_id, message_blob in rows:
+                bisect.insort(
+                    self.partitions[(broadcaster_id, get_month(timestamp))],
+                    (timestamp, message_id, message_blob),
+                )
+        return True, [], []
+
+    def insert_user_chats(self, messages):
+        for broadcaster_id, user_id, timestamp, message_id, message_blob in messages:
+            self.user_partitions[(broadcaster_id, user_id, get_month(timestamp))].append(
+                (timestamp, message_id, message_blob)
+            )
+        return True, [], []
+
+    def insert_thread_replies(self, replies):
+        for broadcaster_id, thread_id, timestamp, message_id in replies:
+            self.threads[(broadcaster_id, thread_id)].append((timestamp, message_id))
+        return True, [], []
+
+    def get_chats(self, broadcaster_id, start, end, limit):
+        rows = []
+        partition = self.partitions[(broadcaster_id, get_month(start))]
+        index = bisect.bisect_left(partition, (start,))
+        for timestamp, message_id, message_blob in partition[index:]:
+            if timestamp > end or len(rows) == limit:
+                break
+            rows.append((broadcaster_id, timestamp, message_id, None, message_blob))
+        return True, rows
+
+    def insert_chat_stats(self, stats):
+        for broadcaster_id, day, resolution, timestamp, *values in stats:
+            self.chat_stats[(broadcaster_id, day, resolution, timestamp)] = values
+        return True, []
+
+    def get_chat_stats(self, broadcaster_id, day, resolution):
+        return True, []
+
+    def get_chatter_sketches_by_bucket(self, buckets):
+        return True, {
+            bucket: self.chat_stats[bucket][-1] if bucket in self.chat_stats else None
+            for bucket in buckets
+        }
+
+
+# Replaces twitch_proxy.TwitchAPIConnection with a fixed directory of live channels
+class FakeTwitchAPIConnection:
+    def __init__(self, channel_count=1000):
+        self.streams = [
+            SimpleNamespace(user_id=str(10000000 + rank), user_login=f"channel{rank}")
+            for rank in range(channel_count)
+        ]
+        self.clips = {}
+
+    async def authenticate(self):
+        pass
+
+    async def initialize_chat(self):
+        pass
+
+    async def join_chat_room(self, streamer_name):
+        pass
+
+    async def leave_chat_room(self, streamer_name):
+        pass
+
+    async def get_online_streamers(self, batch_size):
+        async def streams():
+            for stream in self.streams[: min(batch_size, 100)]:
+                yield stream
+
+        return streams()
+
+    async def crawl_online_streamers(self, pages, page_size=100):
+        for i in range(0, len(self.streams), page_size):
+            await pages.put(self.streams[i : i + page_size])
+        await pages.put(None)
+
+    async def create_clip(self, broadcaster_id):
+        clip_id = f"clip{len(self.clips)}"
+        self.clips[clip_id] = broadcaster_id
+        return clip_id
+
+    async def get_clip(self, clip_id):
+        return clip_id, f"https://clips.twitch.tv/embed?clip={clip_id}", ""
+
+    def close(self):
+        pass
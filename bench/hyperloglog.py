@@ -0,0 +1,122 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timezone
+
+from hyperloglog import HyperLogLog, hash_value
+
+# Reports the bytes per sketch and the measured error of the unique chatter sketches at each precision,
+# for buckets from a handful of chatters up to a whole stream's worth. Before anything is measured,
+# merged and reduced sketches are checked against sketches built directly from the same chatters.
+#
+# Run with: python -m bench.hyperloglog
+
+
+def build_sketch(precision, hashes):
+    sketch = HyperLogLog(precision)
+    for value_hash in hashes:
+        sketch.add_hash(value_hash)
+    return sketch
+
+
+def registers(sketch):
+    return sorted(sketch.items())
+
+
+def check_merge_and_reduce(rng):
+    hashes = [hash_value(rng.getrandbits(40)) for _ in range(20000)]
+    for first, second in ((10, 20000), (300, 500), (5000, 15000)):
+        left = build_sketch(12, hashes[:first])
+        right = build_sketch(12, hashes[first:second])
+        left.merge(right)
+        assert registers(left) == registers(build_sketch(12, hashes[:second])), "merge"
+
+        for precision in (8, 10):
+            reduced = build_sketch(12, hashes[:second]).reduce(precision)
+            assert registers(reduced) == registers(build_sketch(precision, hashes[:second])), "reduce"
+
+        round_tripped = HyperLogLog.deserialize(build_sketch(12, hashes[:second]).serialize())
+        assert registers(round_tripped) == registers(build_sketch(12, hashes[:second])), "serialize"
+
+
+def measure(precision, cardinality, trials, rng):
+    errors = []
+    sizes = []
+    add_seconds = 0
+    for _ in range(trials):
+        hashes = [hash_value(rng.getrandbits(40)) for _ in range(cardinality)]
+        start = time.perf_counter()
+        sketch = build_sketch(precision, hashes)
+        add_seconds += time.perf_counter() - start
+        errors.append(abs(sketch.estimate() - cardinality) / cardinality)
+        sizes.append(len(sketch.serialize()))
+
+    return {
+        "bytes": statistics.mean(sizes),
+        "mean_relative_error": statistics.mean(errors),
+        "max_relative_error": max(errors),
+        "ns_per_add": add_seconds / (trials * cardinality) * 1e9,
+    }
+
+
+def time_merge(precision, sketch_count, rng):
+    # Merging an hour of minute sketches is the common case when counting over a range
+    sketches = [
+        build_sketch(precision, [hash_value(rng.getrandbits(40)) for _ in range(2000)]).serialize()
+        for _ in range(sketch_count)
+    ]
+    start = time.perf_counter()
+    merged = HyperLogLog.deserialize(sketches[0])
+    for sketch in sketches[1:]:
+        merged.merge(HyperLogLog.deserialize(sketch))
+    merged.estimate()
+    return (time.perf_counter() - start) * 1000
+
+
+def run(precisions, cardinalities, trials):
+    rng = random.Random(0)
+    check_merge_and_reduce(rng)
+
+    results = {}
+    for precision in precisions:
+        result = {
+            "registers": 1 << precision,
+            "expected_relative_error": HyperLogLog(precision).relative_error(),
+            "merge_60_sketches_ms": time_merge(precision, 60, rng),
+        }
+        for cardinality in cardinalities:
+            result[f"chatters_{cardinality}"] = measure(precision, cardinality, trials, rng)
+        results[f"precision_{precision}"] = result
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Unique chatter sketch size and error")
+    parser.add_argument("--precisions", type=int, nargs="+", default=[8, 10, 12, 14, 16])
+    parser.add_argument(
+        "--cardinalities", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000]
+    )
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--output", help="Where to save the results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.precisions, args.cardinalities, args.trials)
+    print(json.dumps(results, indent=2))
+
+    output = args.output or os.path.join(
+        "bench",
+        "results",
+        f"hyperloglog-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json",
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import pika
+from bench.fakes import FakeTwitchAPIConnection
+from bench.synthetic_chat import SyntheticChat
+from tracing import PUBLISHED_AT_HEADER, SENT_AT_HEADER
+
+# Runs the chat ingestion, anomaly detection, search indexing and emote analytics services together in
+# one process on the in-process message queue and chat database from local_infrastructure.py, publishes
+# synthetic chat to the chat exchange the way the listener does, and reports how long the pipeline takes
+# to ingest it and how quickly the chat database facade answers queries against the result. Unlike
+# bench/throughput.py, messages really flow between the services, so this catches wiring problems as
+# well as measuring them.
+#
+# Run with: python -m bench.local_pipeline [--messages 50000]
+
+
+def start_services(directory):
+    os.environ["LOCAL_INFRASTRUCTURE"] = "true"
+    os.environ["CHAT_SPOOL_DIRECTORY"] = os.path.join(directory, "chat_spool")
+    os.environ["ANOMALY_SNAPSHOT_DIRECTORY"] = os.path.join(directory, "anomaly_snapshots")
+    os.environ.setdefault("TRACE_EXPORT_PATH", os.path.join(directory, "traces.jsonl"))
+
+    import anomaly_detection_service
+    import chat_ingestion_service
+    import chat_search_service
+    import emote_analytics_service
+
+    services = {
+        "chat_ingestion": chat_ingestion_service.ChatIngestor(),
+        "anomaly_detection": anomaly_detection_service.AnomalyDetector(),
+        "chat_search": chat_search_service.ChatSearchIndexer(),
+        "emote_analytics": emote_analytics_service.EmoteAnalyzer(),
+    }
+    threads = [
+        threading.Thread(target=service.start_consuming_chats, daemon=True)
+        for service in services.values()
+    ]
+    for thread in threads:
+        thread.start()
+
+    return services, threads
+
+
+def stop_services(services, threads):
+    for service in services.values():
+        service.message_queue_connection.add_callback_threadsafe(service.channel.stop_consuming)
+    for thread in threads:
+        thread.join()
+
+    # Flush whatever each service is still holding the way it would on its next interval
+    ingestor = services["chat_ingestion"]
+    ingestor.sync_spool()
+    ingestor.spool.seal()
+    while ingestor.spool.list_sealed_segments():
+        time.sleep(0.01)
+    services["chat_search"].flush_postings()
+    services["emote_analytics"].checkpoint()
+
+
+def publish_chat(channels, args):
+    import local_infrastructure
+
+    # Stays on the anomaly exchange, since clip creation would call Twitch
+    channel = local_infrastructure.LocalBlockingConnection().channel()
+    channel.exchange_declare("anomaly_fanout", exchange_type="fanout")
+    channel.queue_declare("anomaly_queue", durable=True)
+    channel.queue_bind(exchange="anomaly_fanout", queue="anomaly_queue")
+
+    chat = SyntheticChat(args.seed)
+    messages = list(chat.stream(channels, args.messages, 1706408359963, args.messages_per_second))
+
+    start = time.perf_counter()
+    for message_fields in messages:
+        channel.basic_publish(
+            exchange="chat_fanout",
+            routing_key=str(message_fields["broadcaster_id"]),
+            body=json.dumps(message_fields).encode(),
+            properties=pika.BasicProperties(
+                message_id=message_fields["message_id"],
+                headers={
+                    SENT_AT_HEADER: message_fields["timestamp"],
+                    PUBLISHED_AT_HEADER: message_fields["timestamp"],
+                },
+            ),
+        )
+    publish_seconds = time.perf_counter() - start
+
+    while not local_infrastructure.BROKER.is_drained():
+        time.sleep(0.01)
+    consume_seconds = time.perf_counter() - start
+
+    return messages, publish_seconds, consume_seconds
+
+
+def query_chat_database(channels, messages, request_count):
+    import chat_database_facade
+    import gen.grpc.chat_database.chat_database_pb2 as chat_database_pb2
+
+    servicer = chat_database_facade.ChatDatabaseServicer()
+    start_timestamp = messages[0]["timestamp"]
+    end_timestamp = messages[-1]["timestamp"]
+
+    requests = [
+        (
+            servicer.GetChats,
+            chat_database_pb2.GetChatsRequest(
+                broadcaster_id=channels[i % 10][0],
+                start=start_timestamp,
+                end=end_timestamp,
+                limit=100,
+            ),
+        )
+        if i % 2 == 0
+        else (
+            servicer.SearchChats,
+            chat_database_pb2.SearchChatsRequest(
+                broadcaster_id=channels[i % 10][0],
+                query="clip it",
+                start=start_timestamp,
+                end=end_timestamp,
+                limit=100,
+            ),
+        )
+        for i in range(request_count)
+    ]
+
+    start = time.perf_counter()
+    responses = [method(request, None) for method, request in requests]
+    seconds = time.perf_counter() - start
+
+    return {
+        "requests": request_count,
+        "requests_per_second": request_count / seconds,
+        "chats_returned": sum(len(response.chats) for response in responses),
+    }
+
+
+def run(args):
+    import local_infrastructure
+
+    twitch = FakeTwitchAPIConnection(args.channels)
+    channels = [(int(stream.user_id), stream.user_login) for stream in twitch.streams]
+
+    with tempfile.TemporaryDirectory() as directory:
+        services, threads = start_services(directory)
+        messages, publish_seconds, consume_seconds = publish_chat(channels, args)
+        stop_services(services, threads)
+
+        database = local_infrastructure.get_chat_database()
+        (stored_messages,) = database.execute("SELECT COUNT(*) FROM chats")[0]
+        queries = query_chat_database(channels, messages, args.requests)
+
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "parameters": {
+            "messages": args.messages,
+            "channels": args.channels,
+            "messages_per_second": args.messages_per_second,
+            "requests": args.requests,
+            "seed": args.seed,
+        },
+        "pipeline": {
+            "messages": len(messages),
+            "publish_seconds": publish_seconds,
+            "consume_seconds": consume_seconds,
+            "messages_per_second": len(messages) / consume_seconds,
+            "stored_messages": stored_messages,
+            "anomalies": local_infrastructure.BROKER.message_count("anomaly_queue"),
+        },
+        "chat_database": queries,
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="In-process end-to-end pipeline benchmark")
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--channels", type=int, default=1000)
+    parser.add_argument("--messages-per-second", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Where to save the results as JSON")
+    args = parser.parse_args()
+
+    results = run(args)
+    print(json.dumps({key: results[key] for key in ("pipeline", "chat_database")}, indent=2))
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
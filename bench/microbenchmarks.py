@@ -0,0 +1,312 @@
+import argparse
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import base62
+import utilities
+from anomaly_features import BucketFeatures
+from anomaly_scorers import SCORERS, get_scorer
+from bench.synthetic_chat import SyntheticChat
+from chat_database_utilities import get_cursor, get_primary_key_elements
+from datetime_helpers import get_day, get_month
+from time_bucket_list import TimeBucketList
+from twitch_proxy import is_valid_message, serialize_message
+
+# Times the functions that run once per chat message against fixed corpora. Where a function has
+# been replaced by a faster version, the version it replaced is kept below and both are checked for
+# identical results over the corpus before anything is timed.
+#
+# Run with: python -m bench.microbenchmarks
+
+
+def reference_get_month(timestamp):
+    return int(datetime.utcfromtimestamp(timestamp // 1000).strftime("%Y%m"))
+
+
+def reference_get_day(timestamp):
+    return int(datetime.utcfromtimestamp(timestamp // 1000).strftime("%Y%m%d"))
+
+
+def reference_is_guid(string):
+    try:
+        uuid.UUID(string)
+        return True
+    except ValueError:
+        return False
+
+
+def reference_serialize_message(msg):
+    room = {
+        "name": msg.room.name,
+        "is_emote_only": msg.room.is_emote_only,
+        "is_subs_only": msg.room.is_subs_only,
+        "is_followers_only": msg.room.is_followers_only,
+        "is_unique_only": msg.room.is_unique_only,
+        "follower_only_delay": msg.room.follower_only_delay,
+        "room_id": msg.room.room_id,
+        "slow": msg.room.slow,
+    }
+
+    user = {
+        "name": msg.user.name,
+        "badge_info": msg.user.badge_info,
+        "badges": msg.user.badges,
+        "color": msg.user.color,
+        "display_name": msg.user.display_name,
+        "mod": msg.user.mod,
+        "subscriber": msg.user.subscriber,
+        "turbo": msg.user.turbo,
+        "id": msg.user.id,
+        "user_type": msg.user.user_type,
+        "vip": msg.user.vip,
+    }
+
+    message = {
+        "text": msg.text,
+        "is_me": msg.is_me,
+        "bits": msg.bits,
+        "sent_timestamp": msg.sent_timestamp,
+        "reply_parent_msg_id": msg.reply_parent_msg_id,
+        "reply_parent_user_id": msg.reply_parent_user_id,
+        "reply_parent_user_login": msg.reply_parent_user_login,
+        "reply_parent_display_name": msg.reply_parent_display_name,
+        "reply_parent_msg_body": msg.reply_parent_msg_body,
+        "reply_thread_parent_msg_id": msg.reply_thread_parent_msg_id,
+        "reply_thread_parent_user_login": msg.reply_thread_parent_user_login,
+        "emotes": msg.emotes,
+        "id": msg.id,
+    }
+
+    message["room"] = room
+    message["user"] = user
+
+    return json.dumps(message)
+
+
+def reference_base62_encode(string):
+    return base62.encodebytes(string.encode())
+
+
+def reference_base62_decode(string):
+    return base62.decodebytes(string).decode()
+
+
+def build_timestamps(rng, count):
+    # Mostly a few days of consecutive chat, plus month, year and leap day boundaries and the edges
+    # of the range Python's datetime supports
+    start = 1706408359963
+    timestamps = [start + i * 37 for i in range(count - 1000)]
+    timestamps += [rng.randrange(-2208988800000, 4102444800000) for _ in range(980)]
+    for boundary in (0, 951782400000, 951868800000, 1704067200000, 1709164800000):
+        timestamps += [boundary - 1, boundary, boundary + 1, boundary + 86399999]
+    return timestamps
+
+
+def build_guids(rng, count):
+    guids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(count - 20)]
+    guids += [
+        guids[0].upper(),
+        guids[0].replace("-", ""),
+        "{" + guids[0] + "}",
+        "urn:uuid:" + guids[0],
+        guids[0][:-1],
+        guids[0] + "0",
+        guids[0].replace("a", "g"),
+        guids[0][:8] + "_" + guids[0][9:],
+        "",
+        "not a guid",
+        " " + guids[0],
+        guids[0] + "\n",
+        "-" + guids[0][1:],
+        "+" + guids[0].replace("-", "")[1:],
+        "0" * 32,
+        "f" * 32,
+        "g" * 32,
+        "0-" * 16,
+        "0" * 36,
+        "{" + guids[0],
+    ]
+    return guids
+
+
+def build_messages(count):
+    chat = SyntheticChat()
+    messages = [
+        chat.build_message(24538518, "sneakylol", 1706408359963 + i * 37)
+        for i in range(count)
+    ]
+    # A few malformed messages so the validation failure paths are compared too
+    messages[1].id = "not a guid"
+    messages[2].sent_timestamp = 0
+    messages[3].room.room_id = "0"
+    messages[4].user = None
+    messages[5].room = None
+    return messages
+
+
+def build_chat_stream(count, channel_count=200, messages_per_second=50):
+    # (broadcaster_id, timestamp, message) for enough chat across enough channels that buckets close
+    # and get scored, with each message deserialized as the anomaly detector does
+    chat = SyntheticChat()
+    channels = [(100000 + i, f"channel{i}") for i in range(channel_count)]
+    return [
+        (fields["broadcaster_id"], fields["timestamp"], json.loads(fields["message"]))
+        for fields in chat.stream(channels, count, 1706408359963, messages_per_second)
+    ]
+
+
+def reference_detect_anomalies(stream):
+    # The message count check the anomaly detector ran on every message before it extracted features
+    # per bucket
+    time_buckets = defaultdict(lambda: TimeBucketList(bucket_size=5))
+    for broadcaster_id, timestamp, _ in stream:
+        broadcaster_buckets = time_buckets[broadcaster_id]
+        broadcaster_buckets.append(timestamp // 1000)
+        if broadcaster_buckets.size() > 60:
+            broadcaster_buckets.check_for_anomaly()
+
+
+def detect_anomalies(stream, scorer_name):
+    scorer = get_scorer(scorer_name)
+    bucket_features = BucketFeatures(bucket_size=5, features=scorer.FEATURES)
+    for broadcaster_id, timestamp, message in stream:
+        for bucket, broadcaster_ids, columns, _ in bucket_features.append(
+            broadcaster_id, timestamp, message
+        ):
+            scorer.score(bucket, broadcaster_ids, columns)
+
+
+def time_anomaly_detection(stream, repeat):
+    # Per-message cost of extracting features and scoring the buckets each message closes, for every
+    # scorer, against the check it replaced
+    reference_ns = time_function(reference_detect_anomalies, [stream], repeat) / len(stream)
+    results = {}
+    for scorer_name in SCORERS:
+        ns = time_function(
+            lambda stream: detect_anomalies(stream, scorer_name), [stream], repeat
+        ) / len(stream)
+        results[f"anomaly_detection.{scorer_name}"] = {
+            "ns_per_call": ns,
+            "reference_ns_per_call": reference_ns,
+            "speedup": reference_ns / ns,
+        }
+    return results
+
+
+def check_equivalent(name, function, reference, corpus):
+    for item in corpus:
+        expected = reference(item)
+        actual = function(item)
+        if actual != expected:
+            raise AssertionError(
+                f"{name} returned {actual!r} instead of {expected!r} for {item!r}"
+            )
+
+
+def time_function(function, corpus, repeat):
+    # Best of several passes, which is the least noisy estimate on a shared machine
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in corpus:
+            function(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(corpus) * 1e9
+
+
+def build_benchmarks(count):
+    # Returns {name: (function, reference or None, corpus)}. tests/test_microbenchmarks.py checks the
+    # same corpora, so a replacement that changes results fails there before it's ever timed.
+    rng = random.Random(0)
+    timestamps = build_timestamps(rng, count)
+    guids = build_guids(rng, count)
+    messages = build_messages(count)
+    valid_messages = [message for message in messages if is_valid_message(message)]
+    cursors = [
+        get_cursor((24538518, get_month(timestamp), timestamp, uuid.UUID(guid)))
+        for timestamp, guid in zip(timestamps[: count - 1000], guids)
+    ]
+
+    # Cursor text plus strings that exercise the leading null byte and empty input encodings
+    cursor_texts = [reference_base62_decode(cursor) for cursor in cursors]
+    cursor_texts += ["", "\0", "\0" * 61, "\0" * 62, "\0" * 130 + "x", "0", "00", "z"]
+    encoded_texts = [reference_base62_encode(text) for text in cursor_texts]
+
+    def append_to_time_buckets(timestamp, time_buckets=TimeBucketList(bucket_size=5)):
+        time_buckets.append(timestamp // 1000)
+
+    return {
+        "get_month": (get_month, reference_get_month, timestamps),
+        "get_day": (get_day, reference_get_day, timestamps),
+        "is_guid": (utilities.is_guid, reference_is_guid, guids),
+        "is_valid_message": (is_valid_message, None, messages),
+        "serialize_message": (
+            serialize_message,
+            reference_serialize_message,
+            valid_messages,
+        ),
+        "base62_encode": (utilities.base62_encode, reference_base62_encode, cursor_texts),
+        "base62_decode": (utilities.base62_decode, reference_base62_decode, encoded_texts),
+        "get_cursor": (
+            get_cursor,
+            None,
+            [get_primary_key_elements(cursor) for cursor in cursors],
+        ),
+        "get_primary_key_elements": (get_primary_key_elements, None, cursors),
+        "TimeBucketList.append": (append_to_time_buckets, None, sorted(timestamps)),
+    }
+
+
+def run(count, repeat):
+    benchmarks = build_benchmarks(count)
+
+    # A faster version that returns something different isn't worth timing
+    for name, (function, reference, corpus) in benchmarks.items():
+        if reference is not None:
+            check_equivalent(name, function, reference, corpus)
+
+    results = {}
+    for name, (function, reference, corpus) in benchmarks.items():
+        result = {"ns_per_call": time_function(function, corpus, repeat)}
+        if reference is not None:
+            result["reference_ns_per_call"] = time_function(reference, corpus, repeat)
+            result["speedup"] = result["reference_ns_per_call"] / result["ns_per_call"]
+        results[name] = result
+
+    results.update(time_anomaly_detection(build_chat_stream(count), repeat))
+
+    return results
+
+
+def main():
+    # is_valid_message logs a warning for every malformed message in the corpus
+    logging.basicConfig(level=logging.ERROR)
+
+    parser = argparse.ArgumentParser(description="Per-message function microbenchmarks")
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Where to save the results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.count, args.repeat)
+    print(json.dumps(results, indent=2))
+
+    output = args.output or os.path.join(
+        "bench",
+        "results",
+        f"microbenchmarks-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json",
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
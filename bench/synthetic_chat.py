@@ -0,0 +1,133 @@
+import random
+import uuid
+from types import SimpleNamespace
+
+from twitch_proxy import serialize_message
+
+WORDS = (
+    "lol KEKW pog PogChamp gg wp no way that was insane clip it LUL monkaS what is he doing "
+    "chat is this real OMEGALUL W L ratio first time here hello streamer catJAM EZ Clap "
+    "copium hopium rigged nice shot bro how did he miss that 5Head Sadge peepoHappy"
+).split()
+EMOTE_IDS = [f"emotesv2_{uuid.UUID(int=i).hex}" for i in range(1, 40)] + [
+    "25",
+    "88",
+    "305954156",
+]
+COLORS = ["#8A2BE2", "#1E90FF", "#00FF7F", "#FF69B4", "#FF4500", "#DAA520", None]
+BADGES = [
+    None,
+    {"subscriber": "12"},
+    {"premium": "1"},
+    {"vip": "1", "subscriber": "36"},
+    {"moderator": "1", "subscriber": "24"},
+    {"subscriber": "3", "sub-gifter": "5"},
+]
+
+
+# Builds chat messages with the same shape as twitchAPI's ChatMessage so they can be passed through
+# twitch_proxy.serialize_message, which keeps the payloads identical to what the listener publishes.
+class SyntheticChat:
+    def __init__(self, seed=0, user_count=50000):
+        self.random = random.Random(seed)
+        self.user_count = user_count
+        self.recent_message_ids = []
+
+    def zipf_index(self, n, s=1.1):
+        # Inverse transform sampling of a bounded power law. Cheap and good enough for picking users.
+        u = self.random.random()
+        return min(int((n ** (1 - s) * u + (1 - u)) ** (1 / (1 - s))) - 1, n - 1)
+
+    def build_message(self, broadcaster_id, broadcaster_login, timestamp):
+        user_index = self.zipf_index(self.user_count)
+        user_name = f"viewer{user_index}"
+
+        words = [self.random.choice(WORDS) for _ in range(self.random.randint(1, 12))]
+        emotes = None
+        if self.random.random() < 0.3:
+            emote_id = self.random.choice(EMOTE_IDS)
+            position = len(" ".join(words))
+            words.append("emote")
+            emotes = {
+                emote_id: [
+                    {
+                        "start_position": str(position + 1),
+                        "end_position": str(position + 5),
+                    }
+                ]
+            }
+        text = " ".join(words)
+
+        reply_parent = None
+        if self.recent_message_ids and self.random.random() < 0.05:
+            reply_parent = self.random.choice(self.recent_message_ids)
+
+        message_id = str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+        self.recent_message_ids = (self.recent_message_ids + [message_id])[-100:]
+
+        badges = BADGES[user_index % len(BADGES)]
+        room = SimpleNamespace(
+            name=broadcaster_login,
+            is_emote_only=False,
+            is_subs_only=False,
+            is_followers_only=True,
+            is_unique_only=False,
+            follower_only_delay=0,
+            room_id=str(broadcaster_id),
+            slow=0,
+        )
+        user = SimpleNamespace(
+            name=user_name,
+            badge_info=(
+                {"subscriber": badges["subscriber"]}
+                if badges and "subscriber" in badges
+                else None
+            ),
+            badges=badges,
+            color=COLORS[user_index % len(COLORS)],
+            display_name=user_name.capitalize(),
+            mod=bool(badges and "moderator" in badges),
+            subscriber=bool(badges and "subscriber" in badges),
+            turbo=False,
+            id=str(100000000 + user_index),
+            user_type=None,
+            vip=bool(badges and "vip" in badges),
+        )
+        return SimpleNamespace(
+            text=text,
+            is_me=False,
+            bits=100 if self.random.random() < 0.01 else 0,
+            sent_timestamp=timestamp,
+            reply_parent_msg_id=reply_parent,
+            reply_parent_user_id="39988164" if reply_parent else None,
+            reply_parent_user_login="uhblivean24" if reply_parent else None,
+            reply_parent_display_name="Uhblivean24" if reply_parent else None,
+            reply_parent_msg_body="figure\\sit\\sout" if reply_parent else None,
+            reply_thread_parent_msg_id=reply_parent,
+            reply_thread_parent_user_login="uhblivean24" if reply_parent else None,
+            emotes=emotes,
+            id=message_id,
+            room=room,
+            user=user,
+        )
+
+    def message_fields(self, broadcaster_id, broadcaster_login, timestamp):
+        # The same dictionary TwitchAPIConnection.on_message publishes to the chat exchange
+        msg = self.build_message(broadcaster_id, broadcaster_login, timestamp)
+        return {
+            "broadcaster_id": broadcaster_id,
+            "timestamp": msg.sent_timestamp,
+            "message_id": msg.id,
+            "message": serialize_message(msg),
+        }
+
+    def stream(self, channels, message_count, start_timestamp, messages_per_second):
+        # channels is a list of (broadcaster_id, broadcaster_login) ordered from most to least popular.
+        # Chat rates across channels follow a Zipf distribution, so the top few channels produce most
+        # of the messages, like they do on Twitch.
+        weights = [1 / (rank + 1) ** 1.1 for rank in range(len(channels))]
+        picks = self.random.choices(channels, weights=weights, k=message_count)
+
+        for i, (broadcaster_id, broadcaster_login) in enumerate(picks):
+            timestamp = start_timestamp + i * 1000 // messages_per_second
+            yield self.message_fields(broadcaster_id, broadcaster_login, timestamp)
@@ -0,0 +1,242 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+import pika
+from bench.fakes import FakeBlockingConnection, FakeChatDatabase, FakeTwitchAPIConnection
+from bench.synthetic_chat import SyntheticChat
+from tracing import PUBLISHED_AT_HEADER, SENT_AT_HEADER
+
+# Pushes synthetic chat through the chat ingestion, anomaly detection and chat database services
+# in-process, with RabbitMQ, Cassandra and Twitch replaced by the stand-ins in bench/fakes.py, and
+# reports throughput, latency and CPU time for each stage. The numbers cover our code only, not the
+# network or the database, which is what we want when comparing two versions of the services.
+#
+# Run with: python -m bench.throughput [--baseline bench/results/<earlier run>.json]
+
+
+def summarize(latencies, wall_seconds, cpu_seconds, message_count):
+    latencies = sorted(latencies)
+    return {
+        "messages": message_count,
+        "messages_per_second": message_count / wall_seconds,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) * 99 // 100, len(latencies) - 1)] * 1000,
+        "cpu_us_per_message": cpu_seconds / message_count * 1e6,
+    }
+
+
+# Calls handler for each item, returning the stage summary and the handler results
+def run_stage(handler, items, message_count=None):
+    latencies = []
+    results = []
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for item in items:
+        start = time.perf_counter()
+        results.append(handler(item))
+        latencies.append(time.perf_counter() - start)
+    cpu_seconds = time.process_time() - cpu_start
+    wall_seconds = time.perf_counter() - wall_start
+
+    return (
+        summarize(latencies, wall_seconds, cpu_seconds, message_count or len(items)),
+        results,
+    )
+
+
+def build_deliveries(message_count, channel_count, messages_per_second, seed):
+    twitch = FakeTwitchAPIConnection(channel_count)
+    channels = [(int(stream.user_id), stream.user_login) for stream in twitch.streams]
+    chat = SyntheticChat(seed)
+
+    deliveries = []
+    for delivery_tag, message_fields in enumerate(
+        chat.stream(channels, message_count, 1706408359963, messages_per_second), 1
+    ):
+        properties = pika.BasicProperties(
+            message_id=message_fields["message_id"],
+            headers={
+                SENT_AT_HEADER: message_fields["timestamp"],
+                PUBLISHED_AT_HEADER: message_fields["timestamp"],
+            },
+        )
+        method = SimpleNamespace(delivery_tag=delivery_tag)
+        deliveries.append((method, properties, json.dumps(message_fields).encode()))
+
+    return channels, deliveries
+
+
+def bench_chat_ingestion(deliveries, spool_directory):
+    import chat_ingestion_service
+
+    os.environ["CHAT_SPOOL_DIRECTORY"] = spool_directory
+    ingestor = chat_ingestion_service.ChatIngestor()
+
+    def consume(delivery):
+        method, properties, body = delivery
+        ingestor.handle_chat_message(ingestor.channel, method, properties, body)
+
+    consume_stats, _ = run_stage(consume, deliveries)
+    ingestor.sync_spool()
+    ingestor.spool.seal()
+
+    # Write each sealed segment the way the drainer thread would
+    segments = ingestor.spool.list_sealed_segments()
+    write_stats, _ = run_stage(
+        lambda segment: ingestor.insert_messages(ingestor.spool.read_segment(segment)),
+        segments,
+        message_count=len(deliveries),
+    )
+    write_stats["batches"] = len(segments)
+
+    return ingestor.database, {
+        "chat_ingestion.consume": consume_stats,
+        "chat_ingestion.write": write_stats,
+    }
+
+
+def bench_anomaly_detection(deliveries):
+    import anomaly_detection_service
+
+    detector = anomaly_detection_service.AnomalyDetector()
+
+    def consume(delivery):
+        method, properties, body = delivery
+        detector.handle_chat_message(detector.channel, method, properties, body)
+
+    stats, _ = run_stage(consume, deliveries)
+    stats["anomalies"] = len(detector.channel.published)
+
+    return {"anomaly_detection": stats}
+
+
+def bench_chat_database(database, channels, deliveries, request_count):
+    import chat_database_facade
+    import gen.grpc.chat_database.chat_database_pb2 as chat_database_pb2
+
+    servicer = chat_database_facade.ChatDatabaseServicer()
+    servicer.database = database
+
+    # Page through the busiest channels' chat from the start of the run, like the REST API does
+    first_timestamp = json.loads(deliveries[0][2])["timestamp"]
+    last_timestamp = json.loads(deliveries[-1][2])["timestamp"]
+    requests = [
+        chat_database_pb2.GetChatsRequest(
+            broadcaster_id=channels[i % 10][0],
+            start=first_timestamp,
+            end=last_timestamp,
+            limit=100,
+        )
+        for i in range(request_count)
+    ]
+
+    stats, responses = run_stage(lambda request: servicer.GetChats(request, None), requests)
+
+    # Latencies are per request, but throughput and CPU time are per chat returned
+    chats_returned = sum(len(response.chats) for response in responses)
+    stats["requests"] = request_count
+    stats["messages"] = chats_returned
+    stats["messages_per_second"] *= chats_returned / request_count
+    stats["cpu_us_per_message"] *= request_count / chats_returned
+
+    return {"chat_database.get_chats": stats}
+
+
+def run(args):
+    channels, deliveries = build_deliveries(
+        args.messages, args.channels, args.messages_per_second, args.seed
+    )
+
+    stages = {}
+    with tempfile.TemporaryDirectory() as directory, mock.patch(
+        "pika.BlockingConnection", FakeBlockingConnection
+    ), mock.patch("chat_database_connection.DatabaseConnection", FakeChatDatabase):
+        os.environ.setdefault("TRACE_EXPORT_PATH", os.path.join(directory, "traces.jsonl"))
+
+        database, ingestion_stages = bench_chat_ingestion(
+            deliveries, os.path.join(directory, "chat_spool")
+        )
+        stages.update(ingestion_stages)
+        stages.update(bench_anomaly_detection(deliveries))
+        stages.update(bench_chat_database(database, channels, deliveries, args.requests))
+
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "parameters": {
+            "messages": args.messages,
+            "channels": args.channels,
+            "messages_per_second": args.messages_per_second,
+            "requests": args.requests,
+            "seed": args.seed,
+        },
+        "stages": stages,
+    }
+
+
+# Returns the stages whose throughput dropped by more than the allowed fraction
+def find_regressions(results, baseline, max_regression):
+    regressions = []
+    for stage, stats in results["stages"].items():
+        previous = baseline["stages"].get(stage)
+        if previous is None:
+            continue
+
+        change = stats["messages_per_second"] / previous["messages_per_second"] - 1
+        if change < -max_regression:
+            regressions.append((stage, change))
+
+    return regressions
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="End-to-end throughput benchmark")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--channels", type=int, default=1000)
+    # Spreads the messages over enough time for the anomaly detector to build up history
+    parser.add_argument("--messages-per-second", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Where to save the results as JSON")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = run(args)
+    print(json.dumps(results["stages"], indent=2))
+
+    output = args.output or os.path.join(
+        "bench",
+        "results",
+        f"throughput-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json",
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = find_regressions(results, baseline, args.max_regression)
+        for stage, change in regressions:
+            print(f"{stage} throughput regressed by {-change:.1%}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,22 @@
 import logging
 import os
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional
 
 import gen.grpc.chat_database.chat_database_pb2 as chat_database_pb2
 import gen.grpc.chat_database.chat_database_pb2_grpc as chat_database_pb2_grpc
 import grpc
+import utilities
 from chat_database_utilities import (
     get_cursor,
     get_primary_key_elements,
     serialize_chat_database_rows,
+    serialize_chat_stats_rows,
     serialize_clip_database_rows,
+    serialize_emote_counts,
 )
-from datetime_helpers import get_month
+from chat_rollup import HOUR, MINUTE
+from datetime_helpers import MILLISECONDS_PER_DAY, get_month
 from flask import Flask, jsonify, render_template
 from flask_parameter_validation import Query, Route, ValidateParameters
 
@@ -27,6 +31,16 @@ grpc_channel = grpc.insecure_channel(f"{database_grpc_ip}:50051")
 grpc_client = chat_database_pb2_grpc.ChatDatabaseStub(grpc_channel)
 
 
+# The chat database reads ranges one UTC day at a time and answers nothing for a range touching more
+# than this many days, so ranges are checked the same way here to return an error instead
+MAX_RANGE_DAYS = 31
+
+
+def count_days(start_milliseconds, end_milliseconds):
+    # Number of UTC days the range touches, including partial days at either end
+    return end_milliseconds // MILLISECONDS_PER_DAY - start_milliseconds // MILLISECONDS_PER_DAY + 1
+
+
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -107,11 +121,154 @@ def get_chats(
         logging.error(f"gRPC error: {status_code} {details}")
         return 500, f"gRPC error: {status_code} {details}"
 
+    return build_chats_page(list_of_rows, limit)
+
+
+# Returns the messages a given user sent in a broadcaster's chat room between two timestamps
+@app.route("/v1.0/<int:broadcaster_id>/chat/user/<int:user_id>", methods=["GET"])
+@ValidateParameters()
+def get_chats_by_user(
+    broadcaster_id: int = Route(),
+    user_id: int = Route(),
+    start: datetime = Query(),
+    end: datetime = Query(),
+    after: Optional[str] = Query(),
+    limit: Optional[int] = Query(min_int=1, max_int=100, default=20),
+):
+    logging.info(
+        f"broadcaster_id: {broadcaster_id}, user_id: {user_id}, start: {start}, end: {end}, after: {after}, limit: {limit}"
+    )
+
+    start_milliseconds = int(start.timestamp() * 1000)
+    end_milliseconds = int(end.timestamp() * 1000)
+
+    if after is not None:
+        valid, *result = validate_cursor(after, broadcaster_id)
+        if valid:
+            start_milliseconds = result[0]
+        else:
+            return result
+
+    list_of_rows = []
+    try:
+        # Ask for 1 more row than the caller wants so we can build the cursor from it
+        response = grpc_client.GetChatsByUser(
+            chat_database_pb2.GetChatsByUserRequest(
+                broadcaster_id=broadcaster_id,
+                user_id=user_id,
+                start=start_milliseconds,
+                end=end_milliseconds,
+                limit=limit + 1,
+            )
+        )
+        list_of_rows = list(response.chats)
+    except grpc.RpcError as rpc_error:
+        status_code = rpc_error.code()
+        details = rpc_error.details()
+        logging.error(f"gRPC error: {status_code} {details}")
+        return 500, f"gRPC error: {status_code} {details}"
+
+    return build_chats_page(list_of_rows, limit)
+
+
+# Returns the message that started a reply thread, if its timestamp is given, followed by its replies
+@app.route("/v1.0/<int:broadcaster_id>/chat/thread/<thread_id>", methods=["GET"])
+@ValidateParameters()
+def get_thread(
+    broadcaster_id: int = Route(),
+    thread_id: str = Route(),
+    thread_timestamp: Optional[int] = Query(min_int=1),
+    limit: Optional[int] = Query(min_int=1, max_int=1000, default=100),
+):
+    logging.info(
+        f"broadcaster_id: {broadcaster_id}, thread_id: {thread_id}, thread_timestamp: {thread_timestamp}, limit: {limit}"
+    )
+
+    if not utilities.is_guid(thread_id):
+        error = {"InvalidRequest": "Invalid thread Id"}
+        return error, 400
+
+    list_of_rows = []
+    try:
+        response = grpc_client.GetThread(
+            chat_database_pb2.GetThreadRequest(
+                broadcaster_id=broadcaster_id,
+                thread_id=thread_id,
+                thread_timestamp=thread_timestamp or 0,
+                limit=limit,
+            )
+        )
+        list_of_rows = list(response.chats)
+    except grpc.RpcError as rpc_error:
+        status_code = rpc_error.code()
+        details = rpc_error.details()
+        logging.error(f"gRPC error: {status_code} {details}")
+        return 500, f"gRPC error: {status_code} {details}"
+
+    logging.info(f"Returning {len(list_of_rows)} chats")
+    return jsonify({"messages": serialize_chat_database_rows(list_of_rows)}), 200
+
+
+# Returns the messages in a given broadcaster's chat room matching a search query. Quoted phrases must
+# appear as written and every other word must appear somewhere in the message.
+@app.route("/v1.0/<int:broadcaster_id>/chat/search", methods=["GET"])
+@ValidateParameters()
+def search_chats(
+    broadcaster_id: int = Route(),
+    q: str = Query(min_str_length=1, max_str_length=200),
+    start: datetime = Query(),
+    end: datetime = Query(),
+    after: Optional[str] = Query(),
+    limit: Optional[int] = Query(min_int=1, max_int=100, default=20),
+):
+    logging.info(
+        f"broadcaster_id: {broadcaster_id}, q: {q}, start: {start}, end: {end}, after: {after}, limit: {limit}"
+    )
+
+    start_milliseconds = int(start.timestamp() * 1000)
+    end_milliseconds = int(end.timestamp() * 1000)
+
+    if count_days(start_milliseconds, end_milliseconds) > MAX_RANGE_DAYS:
+        error = {"InvalidRequest": f"Searches can cover at most {MAX_RANGE_DAYS} UTC days"}
+        return error, 400
+
+    if after is not None:
+        valid, *result = validate_cursor(after, broadcaster_id)
+        if valid:
+            start_milliseconds = result[0]
+        else:
+            return result
+
+    list_of_rows = []
+    try:
+        # Ask for 1 more row than the caller wants so we can build the cursor from it
+        response = grpc_client.SearchChats(
+            chat_database_pb2.SearchChatsRequest(
+                broadcaster_id=broadcaster_id,
+                query=q,
+                start=start_milliseconds,
+                end=end_milliseconds,
+                limit=limit + 1,
+            )
+        )
+        list_of_rows = list(response.chats)
+    except grpc.RpcError as rpc_error:
+        status_code = rpc_error.code()
+        details = rpc_error.details()
+        logging.error(f"gRPC error: {status_code} {details}")
+        return 500, f"gRPC error: {status_code} {details}"
+
+    return build_chats_page(list_of_rows, limit)
+
+
+# Builds the response for a page of chats. list_of_rows holds one more row than the limit when
+# there's another page, and that row becomes the cursor for it.
+def build_chats_page(list_of_rows, limit):
     if len(list_of_rows) <= limit:
         logging.info(f"Returning {len(list_of_rows)} chats")
         return jsonify({"messages": serialize_chat_database_rows(list_of_rows)}), 200
     else:
-        # GetChats returns one more element than asked for when we need to do pagination,
+        # The RPCs return one more element than asked for when we need to do pagination,
         # so omit the last row so we return the number of messages that were asked for.
         logging.info(f"Returning {len(list_of_rows[:-1])} chats")
 
@@ -135,6 +292,127 @@ def get_chats(
         )
 
 
+# Returns a histogram of chat activity in a broadcaster's chat room over a single UTC day
+@app.route("/v1.0/<int:broadcaster_id>/chat/stats", methods=["GET"])
+@ValidateParameters()
+def get_chat_stats(
+    broadcaster_id: int = Route(),
+    day: date = Query(),
+    resolution: Optional[str] = Query(default="minute", pattern="^(minute|hour)$"),
+):
+    logging.info(
+        f"broadcaster_id: {broadcaster_id}, day: {day}, resolution: {resolution}"
+    )
+
+    stats = []
+    try:
+        response = grpc_client.GetChatStats(
+            chat_database_pb2.GetChatStatsRequest(
+                broadcaster_id=broadcaster_id,
+                day=int(day.strftime("%Y%m%d")),
+                resolution=MINUTE if resolution == "minute" else HOUR,
+            )
+        )
+        stats = list(response.stats)
+    except grpc.RpcError as rpc_error:
+        status_code = rpc_error.code()
+        details = rpc_error.details()
+        logging.error(f"gRPC error: {status_code} {details}")
+        return 500, f"gRPC error: {status_code} {details}"
+
+    return (
+        jsonify(
+            {
+                "stats": serialize_chat_stats_rows(stats),
+            }
+        ),
+        200,
+    )
+
+
+# Returns the most used emotes in a broadcaster's chat room between two timestamps
+@app.route("/v1.0/<int:broadcaster_id>/chat/emotes", methods=["GET"])
+@ValidateParameters()
+def get_top_emotes(
+    broadcaster_id: int = Route(),
+    start: datetime = Query(),
+    end: datetime = Query(),
+    limit: Optional[int] = Query(min_int=1, max_int=100, default=10),
+):
+    logging.info(
+        f"broadcaster_id: {broadcaster_id}, start: {start}, end: {end}, limit: {limit}"
+    )
+
+    start_milliseconds = int(start.timestamp() * 1000)
+    end_milliseconds = int(end.timestamp() * 1000)
+
+    if count_days(start_milliseconds, end_milliseconds) > MAX_RANGE_DAYS:
+        error = {"InvalidRequest": f"Top emotes can cover at most {MAX_RANGE_DAYS} UTC days"}
+        return error, 400
+
+    emotes = []
+    try:
+        response = grpc_client.GetTopEmotes(
+            chat_database_pb2.GetTopEmotesRequest(
+                broadcaster_id=broadcaster_id,
+                start=start_milliseconds,
+                end=end_milliseconds,
+                limit=limit,
+            )
+        )
+        emotes = list(response.emotes)
+    except grpc.RpcError as rpc_error:
+        status_code = rpc_error.code()
+        details = rpc_error.details()
+        logging.error(f"gRPC error: {status_code} {details}")
+        return 500, f"gRPC error: {status_code} {details}"
+
+    return jsonify({"emotes": serialize_emote_counts(emotes)}), 200
+
+
+# Returns an estimate of the number of distinct users who chatted in a broadcaster's chat room between
+# two timestamps
+@app.route("/v1.0/<int:broadcaster_id>/chat/chatters", methods=["GET"])
+@ValidateParameters()
+def get_unique_chatters(
+    broadcaster_id: int = Route(),
+    start: datetime = Query(),
+    end: datetime = Query(),
+):
+    logging.info(f"broadcaster_id: {broadcaster_id}, start: {start}, end: {end}")
+
+    start_milliseconds = int(start.timestamp() * 1000)
+    end_milliseconds = int(end.timestamp() * 1000)
+
+    if count_days(start_milliseconds, end_milliseconds) > MAX_RANGE_DAYS:
+        error = {"InvalidRequest": f"Unique chatters can cover at most {MAX_RANGE_DAYS} UTC days"}
+        return error, 400
+
+    try:
+        response = grpc_client.GetUniqueChatters(
+            chat_database_pb2.GetUniqueChattersRequest(
+                broadcaster_id=broadcaster_id,
+                start=start_milliseconds,
+                end=end_milliseconds,
+            )
+        )
+    except grpc.RpcError as rpc_error:
+        status_code = rpc_error.code()
+        details = rpc_error.details()
+        logging.error(f"gRPC error: {status_code} {details}")
+        return 500, f"gRPC error: {status_code} {details}"
+
+    return (
+        jsonify(
+            {
+                "unique_chatters": response.unique_chatters,
+                "relative_error": response.relative_error,
+            }
+        ),
+        200,
+    )
+
+
 # Returns the clips created based on spikes in chat messages in the broadcaster's chat room
 @app.route("/v1.0/clip", methods=["GET"])
 @ValidateParameters()
@@ -0,0 +1,146 @@
+import logging
+import time
+from collections import OrderedDict
+
+from prometheus_client import Gauge
+
+# Channels are captured in tier order. Pinned channels are on a tenant's watch-list and are captured
+# whatever their rank, top channels are the ones ranked above the cutoff and everything else is the
+# long tail, which is the first to be shed when the listener runs out of capacity.
+PINNED_TIER = 0
+TOP_TIER = 1
+LONG_TAIL_TIER = 2
+TIER_NAMES = {PINNED_TIER: "pinned", TOP_TIER: "top", LONG_TAIL_TIER: "long_tail"}
+
+CAPTURE_CHANNELS = Gauge(
+    "chat_capture_channels",
+    "Number of live channels per tier whose chat is being captured or was dropped",
+    ["tier", "state"],
+)
+
+
+class Channel:
+    def __init__(self, tier, captured, last_seen):
+        self.tier = tier
+        self.captured = captured
+        self.last_seen = last_seen
+
+
+class CaptureScheduler:
+    def __init__(self, capacity, budgets, top_rank_cutoff=50, offline_timeout=300):
+        # capacity is the most chat rooms this listener can be joined to at once. budgets maps each
+        # tier to the most of that capacity the tier may use.
+        self.capacity = capacity
+        self.budgets = budgets
+        self.top_rank_cutoff = top_rank_cutoff
+        # Dropped channels aren't in Redis, so we don't hear when they go offline. Forget them once
+        # the poller stops reporting them.
+        self.offline_timeout = offline_timeout
+
+        # Streamer Id -> set of tenants that pinned it
+        self.pinned = {}
+        # User login -> Channel for every live channel we've been told about
+        self.channels = {}
+        # Tier -> user login -> Channel for every captured channel, least recently seen first, so
+        # finding a channel to evict doesn't scan every channel
+        self.captured = {tier: OrderedDict() for tier in TIER_NAMES}
+
+    def apply_watch_list_changes(self, rows):
+        for tenant_id, streamer_id, removed, _ in rows:
+            tenants = self.pinned.setdefault(streamer_id, set())
+            if removed:
+                tenants.discard(tenant_id)
+                if not tenants:
+                    del self.pinned[streamer_id]
+            else:
+                tenants.add(tenant_id)
+
+    def get_tier(self, streamer_id, rank):
+        if streamer_id in self.pinned:
+            return PINNED_TIER
+        elif rank < self.top_rank_cutoff:
+            return TOP_TIER
+        return LONG_TAIL_TIER
+
+    def captured_count(self):
+        return sum(len(channels) for channels in self.captured.values())
+
+    def admit(self, streamer_id, user_login, rank):
+        # Returns whether the channel should be captured and the logins of any captured channels that
+        # were evicted to make room for it
+        now = time.monotonic()
+        tier = self.get_tier(streamer_id, rank)
+
+        channel = self.channels.get(user_login)
+        if channel is None:
+            channel = self.channels[user_login] = Channel(tier, False, now)
+        channel.last_seen = now
+
+        # A captured channel keeps its slot until it goes offline or is preempted, even if its rank
+        # has since dropped into a tier that's over budget
+        if channel.captured:
+            # Reinserting moves it to the most recently seen end
+            del self.captured[channel.tier][user_login]
+            self.captured[tier][user_login] = channel
+            channel.tier = tier
+            return True, []
+
+        channel.tier = tier
+        if len(self.captured[tier]) >= self.budgets[tier]:
+            return False, []
+
+        evicted = []
+        if self.captured_count() >= self.capacity:
+            victim = self.find_victim(tier)
+            if victim is None:
+                return False, []
+            self.drop(victim)
+            evicted.append(victim)
+
+        channel.captured = True
+        self.captured[tier][user_login] = channel
+        return True, evicted
+
+    def find_victim(self, tier):
+        # The captured channel in the lowest priority tier below tier that we heard from least recently
+        for victim_tier in sorted(TIER_NAMES, reverse=True):
+            if victim_tier <= tier:
+                break
+            if self.captured[victim_tier]:
+                return next(iter(self.captured[victim_tier]))
+        return None
+
+    def drop(self, user_login):
+        # Stop capturing a channel that's still live
+        channel = self.channels.get(user_login)
+        if channel is not None and channel.captured:
+            channel.captured = False
+            del self.captured[channel.tier][user_login]
+
+    def release(self, user_login):
+        # Forget a channel that went offline
+        self.drop(user_login)
+        self.channels.pop(user_login, None)
+
+    def update_metrics(self):
+        now = time.monotonic()
+        for user_login in [
+            user_login
+            for user_login, channel in self.channels.items()
+            if not channel.captured and now - channel.last_seen > self.offline_timeout
+        ]:
+            del self.channels[user_login]
+
+        dropped_counts = {tier: 0 for tier in TIER_NAMES}
+        for channel in self.channels.values():
+            if not channel.captured:
+                dropped_counts[channel.tier] += 1
+
+        captured_counts = {tier: len(channels) for tier, channels in self.captured.items()}
+        for tier, name in TIER_NAMES.items():
+            CAPTURE_CHANNELS.labels(tier=name, state="captured").set(captured_counts[tier])
+            CAPTURE_CHANNELS.labels(tier=name, state="dropped").set(dropped_counts[tier])
+
+        logging.info(
+            f"Capturing {self.captured_count()} of {self.capacity} channels. Captured per tier: {captured_counts}, dropped per tier: {dropped_counts}"
+        )
@@ -0,0 +1,50 @@
+from collections import defaultdict
+
+from datetime_helpers import get_month
+
+# Approximate size, in bytes, of everything in a serialized row other than the message column
+ROW_OVERHEAD_BYTES = 64
+
+
+def estimate_row_size(message_row):
+    _, _, _, message_blob = message_row
+    return ROW_OVERHEAD_BYTES + len(message_blob)
+
+
+# Splits chat rows into batches that each target a single partition, and so a single token and
+# replica set, while staying under max_batch_bytes. Batches that would hold fewer than min_batch_rows
+# rows aren't worth the batch overhead, so those rows are returned separately to be written as
+# individual statements.
+#
+# Returns a list of (rows, size in bytes) batches and a list of single rows.
+def plan_chat_batches(messages, max_batch_bytes, min_batch_rows=2):
+    partitions = defaultdict(list)
+    for message_row in messages:
+        broadcaster_id, timestamp, _, _ = message_row
+        partitions[(broadcaster_id, get_month(timestamp))].append(message_row)
+
+    batches = []
+    single_rows = []
+
+    def add_batch(rows, size):
+        if len(rows) < min_batch_rows:
+            single_rows.extend(rows)
+        else:
+            batches.append((rows, size))
+
+    for rows in partitions.values():
+        batch = []
+        batch_size = 0
+        for message_row in rows:
+            row_size = estimate_row_size(message_row)
+            if batch and batch_size + row_size > max_batch_bytes:
+                add_batch(batch, batch_size)
+                batch = []
+                batch_size = 0
+
+            batch.append(message_row)
+            batch_size += row_size
+
+        add_batch(batch, batch_size)
+
+    return batches, single_rows
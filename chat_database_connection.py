@@ -1,75 +1,369 @@
 import logging
 
 import auth.secrets as secrets
+from cassandra import ConsistencyLevel, OperationTimedOut, Unavailable, WriteTimeout
 from cassandra.auth import PlainTextAuthProvider
-from cassandra.cluster import Cluster
-from cassandra.policies import DCAwareRoundRobinPolicy, TokenAwarePolicy
-from cassandra.query import BatchStatement, BatchType, ConsistencyLevel, tuple_factory
+from cassandra.cluster import EXEC_PROFILE_DEFAULT, Cluster, ExecutionProfile, NoHostAvailable
+from cassandra.connection import ConnectionException
+from cassandra.concurrent import execute_concurrent, execute_concurrent_with_args
+from cassandra.policies import (
+    ConstantSpeculativeExecutionPolicy,
+    DCAwareRoundRobinPolicy,
+    RetryPolicy,
+    TokenAwarePolicy,
+    WriteType,
+)
+from cassandra.query import BatchStatement, BatchType, tuple_factory
+from chat_batch_planner import plan_chat_batches
+from chat_database_profiles import (
+    BULK_EXPORT_PROFILE,
+    INGEST_PROFILE,
+    INTERACTIVE_PROFILE,
+    PROFILE_FETCH_SIZES,
+)
 from datetime_helpers import get_month, get_next_month
+from prometheus_client import Histogram
+
+# Errors that mean the cluster couldn't take a write right now, rather than that it refused it, so the
+# write is worth retrying until the cluster recovers
+TRANSIENT_WRITE_ERRORS = (
+    Unavailable,
+    WriteTimeout,
+    OperationTimedOut,
+    NoHostAvailable,
+    ConnectionException,
+)
+
+
+def split_failed_writes(results, writes):
+    # writes holds the rows of each statement that was executed. Returns the rows of the writes that
+    # failed transiently and of those the database rejected outright.
+    failed_rows = []
+    rejected_rows = []
+    for (success, result), rows in zip(results, writes):
+        if not success:
+            logging.error(f"Exception: {result}")
+            if isinstance(result, TRANSIENT_WRITE_ERRORS):
+                failed_rows.extend(rows)
+            else:
+                rejected_rows.extend(rows)
+    return failed_rows, rejected_rows
+
+
+class IngestRetryPolicy(RetryPolicy):
+    # Rewriting a chat row with the same primary key and message is idempotent, so timeouts and
+    # unavailable errors are retried a few times, on another coordinator where it makes sense,
+    # rather than surfaced to the ingestor. Counter updates aren't idempotent, so they're never retried.
+    def __init__(self, max_retries=3):
+        self.max_retries = max_retries
+
+    def on_read_timeout(
+        self,
+        query,
+        consistency,
+        required_responses,
+        received_responses,
+        data_retrieved,
+        retry_num,
+    ):
+        if retry_num < self.max_retries:
+            return self.RETRY, consistency
+        return self.RETHROW, None
+
+    def on_write_timeout(
+        self,
+        query,
+        consistency,
+        write_type,
+        required_responses,
+        received_responses,
+        retry_num,
+    ):
+        if write_type == WriteType.COUNTER or retry_num >= self.max_retries:
+            return self.RETHROW, None
+        return self.RETRY, consistency
+
+    def on_unavailable(
+        self, query, consistency, required_replicas, alive_replicas, retry_num
+    ):
+        if retry_num < self.max_retries:
+            return self.RETRY_NEXT_HOST, None
+        return self.RETHROW, None
+
+    def on_request_error(self, query, consistency, error, retry_num):
+        # The coordinator may have applied the write before failing, so only retry statements that are
+        # safe to apply twice
+        if query is not None and query.is_idempotent and retry_num < self.max_retries:
+            return self.RETRY_NEXT_HOST, None
+        return self.RETHROW, None
+
+
+def build_execution_profiles():
+    # Each profile gets its own load balancing policy since the cluster populates them separately
+    def load_balancing_policy():
+        return TokenAwarePolicy(DCAwareRoundRobinPolicy())
+
+    return {
+        EXEC_PROFILE_DEFAULT: ExecutionProfile(
+            load_balancing_policy=load_balancing_policy(),
+            row_factory=tuple_factory,
+        ),
+        INGEST_PROFILE: ExecutionProfile(
+            load_balancing_policy=load_balancing_policy(),
+            retry_policy=IngestRetryPolicy(),
+            consistency_level=ConsistencyLevel.LOCAL_QUORUM,
+            request_timeout=20,
+            row_factory=tuple_factory,
+        ),
+        # Reads behind the REST API care about tail latency, so if a replica is slow to respond we
+        # send the same (idempotent) query to another one and take whichever answers first
+        INTERACTIVE_PROFILE: ExecutionProfile(
+            load_balancing_policy=load_balancing_policy(),
+            consistency_level=ConsistencyLevel.LOCAL_ONE,
+            speculative_execution_policy=ConstantSpeculativeExecutionPolicy(
+                delay=0.05, max_attempts=2
+            ),
+            request_timeout=5,
+            row_factory=tuple_factory,
+        ),
+        # Bulk exports read a lot of data but aren't in a hurry, so they use the cheapest consistency
+        # level, no speculative executions and a long timeout
+        BULK_EXPORT_PROFILE: ExecutionProfile(
+            load_balancing_policy=load_balancing_policy(),
+            consistency_level=ConsistencyLevel.LOCAL_ONE,
+            request_timeout=120,
+            row_factory=tuple_factory,
+        ),
+    }
 
 
 class DatabaseConnection:
-    def __init__(self, keyspace):
+    def __init__(
+        self, keyspace, write_profile=INGEST_PROFILE, read_profile=INTERACTIVE_PROFILE
+    ):
         auth_provider = PlainTextAuthProvider(
             secrets.get_astra_client_id(), secrets.get_astra_secret()
         )
-        load_balancing_policy = TokenAwarePolicy(DCAwareRoundRobinPolicy())
         cluster = Cluster(
             cloud=secrets.get_astra_cloud_config(),
             auth_provider=auth_provider,
-            load_balancing_policy=load_balancing_policy,
+            execution_profiles=build_execution_profiles(),
         )
         self.session = cluster.connect(keyspace)
 
+        # Each service picks the execution profiles that suit its workload. See build_execution_profiles.
+        self.write_profile = write_profile
+        self.read_profile = read_profile
+
+        self.request_latency_histogram = Histogram(
+            "cassandra_request_latency_seconds",
+            "Latency of chat database operations by execution profile",
+            ["profile", "operation"],
+        )
+
+        # Stay under Cassandra's default batch_size_warn_threshold_in_kb of 5KB
+        self.max_batch_bytes = 5 * 1024
+        self.max_concurrent_writes = 64
+        self.max_concurrent_reads = 32
+
+        self.batch_bytes_histogram = Histogram(
+            "chat_batch_size_bytes",
+            "Estimated serialized size of each chat batch written",
+            buckets=(512, 1024, 2048, 3072, 4096, 5120, 10240, 51200),
+        )
+        self.batch_rows_histogram = Histogram(
+            "chat_batch_size_rows",
+            "Number of rows in each chat write, where single row writes have 1 row",
+            buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+        )
+
     def __del__(self):
         self.close()
 
     def close(self):
         self.session.shutdown()
 
+    def time_request(self, profile, operation):
+        return self.request_latency_histogram.labels(
+            profile=profile, operation=operation
+        ).time()
+
+    def bind(self, statement, parameters, profile):
+        bound_statement = statement.bind(parameters)
+        bound_statement.fetch_size = PROFILE_FETCH_SIZES[profile]
+        return bound_statement
+
     def insert_chats(self, messages):
+        # Returns (success, failed, rejected), where failed rows hit a transient error and can be
+        # retried, and rejected rows were refused by the database and would fail the same way again
         logging.info(f"Inserting {len(messages)} message")
 
-        batch = BatchStatement(
-            consistency_level=ConsistencyLevel.QUORUM, batch_type=BatchType.UNLOGGED
+        try:
+            statement = self.session.prepare(
+                """
+                INSERT INTO twitch_chat_by_broadcaster_and_timestamp (broadcaster_id, year_month, timestamp, message_id, message_blob)
+                VALUES (?, ?, ?, ?, ?)
+                """
+            )
+        except TRANSIENT_WRITE_ERRORS as e:
+            logging.error(f"Exception: {e}")
+            return False, messages, []
+        statement.is_idempotent = True
+
+        # Messages are already encoded with chat_message_codec.encode_message
+        def get_parameters(message_row):
+            broadcaster_id, timestamp, message_id, message_blob = message_row
+            return (
+                broadcaster_id,
+                get_month(timestamp),
+                timestamp,
+                message_id,
+                message_blob,
+            )
+
+        batches, single_rows = plan_chat_batches(messages, self.max_batch_bytes)
+
+        # Each write is paired with the rows it contains so we can report which rows failed
+        writes = []
+        for rows, size in batches:
+            # Every row in the batch shares a partition key, so the token aware load balancing policy
+            # sends the batch straight to a replica that owns it
+            batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+            for message_row in rows:
+                batch.add(statement, get_parameters(message_row))
+
+            writes.append((batch, rows))
+            self.batch_bytes_histogram.observe(size)
+            self.batch_rows_histogram.observe(len(rows))
+
+        for message_row in single_rows:
+            writes.append((statement.bind(get_parameters(message_row)), [message_row]))
+            self.batch_rows_histogram.observe(1)
+
+        logging.info(
+            f"Writing {len(batches)} batches and {len(single_rows)} single rows concurrently"
         )
 
-        statement = self.session.prepare(
-            """
-            INSERT INTO twitch_chat_by_broadcaster_and_timestamp (broadcaster_id, year_month, timestamp, message_id, message)
-            VALUES (?, ?, ?, ?, ?)
-            """
+        try:
+            with self.time_request(self.write_profile, "insert_chats"):
+                results = execute_concurrent(
+                    self.session,
+                    [(write, None) for write, _ in writes],
+                    concurrency=self.max_concurrent_writes,
+                    raise_on_first_error=False,
+                    execution_profile=self.write_profile,
+                )
+        except TRANSIENT_WRITE_ERRORS as e:
+            logging.error(f"Exception: {e}")
+            return False, messages, []
+
+        failed_messages, rejected_messages = split_failed_writes(
+            results, [rows for _, rows in writes]
+        )
+        if failed_messages or rejected_messages:
+            return False, failed_messages, rejected_messages
+
+        logging.info("Messages inserted successfully")
+        return True, [], []
+
+    def insert_user_chats(self, messages):
+        # messages is a list of (broadcaster_id, user_id, timestamp, message_id, message_blob). A user
+        # rarely sends more than a few messages per batch, so these are written as single rows.
+        # Returns (success, failed, rejected) like insert_chats.
+        logging.info(f"Inserting {len(messages)} messages into the user index")
+
+        try:
+            statement = self.session.prepare(
+                """
+                INSERT INTO twitch_chat_by_user (broadcaster_id, user_id, year_month, timestamp, message_id, message_blob)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """
+            )
+        except TRANSIENT_WRITE_ERRORS as e:
+            logging.error(f"Exception: {e}")
+            return False, messages, []
+        statement.is_idempotent = True
+
+        parameters = [
+            (broadcaster_id, user_id, get_month(timestamp), timestamp, message_id, message_blob)
+            for broadcaster_id, user_id, timestamp, message_id, message_blob in messages
+        ]
+
+        try:
+            with self.time_request(self.write_profile, "insert_user_chats"):
+                results = execute_concurrent_with_args(
+                    self.session,
+                    statement,
+                    parameters,
+                    concurrency=self.max_concurrent_writes,
+                    raise_on_first_error=False,
+                    execution_profile=self.write_profile,
+                )
+        except TRANSIENT_WRITE_ERRORS as e:
+            logging.error(f"Exception: {e}")
+            return False, messages, []
+
+        failed_messages, rejected_messages = split_failed_writes(
+            results, [[message_row] for message_row in messages]
         )
+        if failed_messages or rejected_messages:
+            return False, failed_messages, rejected_messages
+
+        return True, [], []
+
+    def insert_thread_replies(self, replies):
+        # replies is a list of (broadcaster_id, thread_id, timestamp, message_id)
+        # Returns (success, failed, rejected) like insert_chats.
+        logging.info(f"Inserting {len(replies)} replies into the thread index")
 
-        for m in messages:
-            broadcaster_id, timestamp, message_id, message = m
-            month = get_month(timestamp)
-            batch.add(
-                statement, (broadcaster_id, month, timestamp, message_id, message)
+        try:
+            statement = self.session.prepare(
+                """
+                INSERT INTO chat_threads (broadcaster_id, thread_id, timestamp, message_id)
+                VALUES (?, ?, ?, ?)
+                """
             )
+        except TRANSIENT_WRITE_ERRORS as e:
+            logging.error(f"Exception: {e}")
+            return False, replies, []
+        statement.is_idempotent = True
 
         try:
-            self.session.execute(batch)
-            logging.info("Messages inserted successfully")
-            return True
-        except Exception as e:
+            with self.time_request(self.write_profile, "insert_thread_replies"):
+                results = execute_concurrent_with_args(
+                    self.session,
+                    statement,
+                    replies,
+                    concurrency=self.max_concurrent_writes,
+                    raise_on_first_error=False,
+                    execution_profile=self.write_profile,
+                )
+        except TRANSIENT_WRITE_ERRORS as e:
             logging.error(f"Exception: {e}")
-            return False
+            return False, replies, []
+
+        failed_replies, rejected_replies = split_failed_writes(
+            results, [[reply] for reply in replies]
+        )
+        if failed_replies or rejected_replies:
+            return False, failed_replies, rejected_replies
+
+        return True, [], []
 
     def get_chats(self, broadcaster_id, start, end, limit):
         logging.info(
             f"Attempting to retieve chats using the parameters: broadcaster_id: {broadcaster_id}, start: {start}, end: {end}, limit: {limit}"
         )
 
-        self.session.row_factory = tuple_factory
-
         statement = self.session.prepare(
             """
-            SELECT broadcaster_id, timestamp, message_id, message FROM twitch_chat_by_broadcaster_and_timestamp
+            SELECT broadcaster_id, timestamp, message_id, message, message_blob FROM twitch_chat_by_broadcaster_and_timestamp
             WHERE broadcaster_id=? AND year_month=? AND timestamp>=? AND timestamp<=?
             LIMIT ?
             """,
         )
+        # Reads are safe to send to more than one replica when speculative execution is enabled
+        statement.is_idempotent = True
 
         month = get_month(start)
         end_month = get_month(end)
@@ -78,18 +372,23 @@ class DatabaseConnection:
         # messages on each partition where the messages in the specified time range might live.
         while len(list_of_rows) < limit and month <= end_month:
             try:
-                rows = list(
-                    self.session.execute(
-                        statement,
-                        (
-                            broadcaster_id,
-                            month,
-                            start,
-                            end,
-                            limit - len(list_of_rows),
-                        ),
+                with self.time_request(self.read_profile, "get_chats"):
+                    rows = list(
+                        self.session.execute(
+                            self.bind(
+                                statement,
+                                (
+                                    broadcaster_id,
+                                    month,
+                                    start,
+                                    end,
+                                    limit - len(list_of_rows),
+                                ),
+                                self.read_profile,
+                            ),
+                            execution_profile=self.read_profile,
+                        )
                     )
-                )
                 logging.info(
                     f"Successfully retrieved {len(rows)} rows from the {month} partition"
                 )
@@ -105,6 +404,428 @@ class DatabaseConnection:
         logging.info(f"Returning {len(list_of_rows)} rows")
         return True, list_of_rows
 
+    def get_chats_by_user(self, broadcaster_id, user_id, start, end, limit):
+        logging.info(
+            f"Attempting to retieve chats using the parameters: broadcaster_id: {broadcaster_id}, user_id: {user_id}, start: {start}, end: {end}, limit: {limit}"
+        )
+
+        statement = self.session.prepare(
+            """
+            SELECT broadcaster_id, timestamp, message_id, message_blob FROM twitch_chat_by_user
+            WHERE broadcaster_id=? AND user_id=? AND year_month=? AND timestamp>=? AND timestamp<=?
+            LIMIT ?
+            """,
+        )
+        statement.is_idempotent = True
+
+        month = get_month(start)
+        end_month = get_month(end)
+        list_of_rows = []
+        # Like get_chats, the range might span more than one monthly partition
+        while len(list_of_rows) < limit and month <= end_month:
+            try:
+                with self.time_request(self.read_profile, "get_chats_by_user"):
+                    rows = self.session.execute(
+                        self.bind(
+                            statement,
+                            (
+                                broadcaster_id,
+                                user_id,
+                                month,
+                                start,
+                                end,
+                                limit - len(list_of_rows),
+                            ),
+                            self.read_profile,
+                        ),
+                        execution_profile=self.read_profile,
+                    )
+                    # Same shape as get_chats rows. The user index has only ever stored encoded messages.
+                    rows = [
+                        (broadcaster_id, timestamp, message_id, None, message_blob)
+                        for broadcaster_id, timestamp, message_id, message_blob in rows
+                    ]
+                logging.info(
+                    f"Successfully retrieved {len(rows)} rows from the {month} partition"
+                )
+            except Exception as e:
+                logging.error(f"Exception: {e}")
+                return False, []
+
+            list_of_rows.extend(rows)
+            month = get_next_month(month)
+
+        logging.info(f"Returning {len(list_of_rows)} rows")
+        return True, list_of_rows
+
+    def scan_uncompressed_chats(self, broadcaster_id=None, month=None):
+        # Yields (broadcaster_id, year_month, timestamp, message_id, message) for every row that still
+        # stores its message as JSON text. Without a broadcaster Id and month this is a full table
+        # scan, so the rows are paged using the read profile's fetch size.
+        if broadcaster_id is None:
+            statement = self.session.prepare(
+                """
+                SELECT broadcaster_id, year_month, timestamp, message_id, message, message_blob
+                FROM twitch_chat_by_broadcaster_and_timestamp
+                """
+            )
+            parameters = ()
+        else:
+            statement = self.session.prepare(
+                """
+                SELECT broadcaster_id, year_month, timestamp, message_id, message, message_blob
+                FROM twitch_chat_by_broadcaster_and_timestamp
+                WHERE broadcaster_id=? AND year_month=?
+                """
+            )
+            parameters = (broadcaster_id, month)
+        statement.is_idempotent = True
+
+        rows = self.session.execute(
+            self.bind(statement, parameters, self.read_profile),
+            execution_profile=self.read_profile,
+        )
+        for (
+            broadcaster_id,
+            year_month,
+            timestamp,
+            message_id,
+            message,
+            message_blob,
+        ) in rows:
+            if message is not None and message_blob is None:
+                yield broadcaster_id, year_month, timestamp, message_id, message
+
+    def replace_chat_messages(self, rows):
+        # rows is a list of (broadcaster_id, year_month, timestamp, message_id, message_blob). The old
+        # message column is removed in the same write.
+        logging.info(f"Replacing {len(rows)} messages with their encoded form")
+
+        statement = self.session.prepare(
+            """
+            UPDATE twitch_chat_by_broadcaster_and_timestamp SET message_blob=?, message=null
+            WHERE broadcaster_id=? AND year_month=? AND timestamp=? AND message_id=?
+            """
+        )
+        statement.is_idempotent = True
+
+        parameters = [
+            (message_blob, broadcaster_id, year_month, timestamp, message_id)
+            for broadcaster_id, year_month, timestamp, message_id, message_blob in rows
+        ]
+
+        try:
+            with self.time_request(self.write_profile, "replace_chat_messages"):
+                results = execute_concurrent_with_args(
+                    self.session,
+                    statement,
+                    parameters,
+                    concurrency=self.max_concurrent_writes,
+                    execution_profile=self.write_profile,
+                )
+        except Exception as e:
+            logging.error(f"Exception: {e}")
+            return False
+
+        failures = [result for success, result in results if not success]
+        for failure in failures:
+            logging.error(f"Exception: {failure}")
+
+        return not failures
+
+    def insert_chat_stats(self, stats):
+        logging.info(f"Updating {len(stats)} chat stats buckets")
+
+        counter_statement = self.session.prepare(
+            """
+            UPDATE chat_stats_by_broadcaster_and_day
+            SET message_count = message_count + ?, bits = bits + ?, emote_count = emote_count + ?
+            WHERE broadcaster_id=? AND day=? AND resolution=? AND timestamp=?
+            """
+        )
+
+        unique_chatters_statement = self.session.prepare(
+            """
+            INSERT INTO unique_chatters_by_broadcaster_and_day (broadcaster_id, day, resolution, timestamp, unique_chatters, chatters_sketch)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """
+        )
+
+        counter_parameters = []
+        unique_chatters_parameters = []
+        for row in stats:
+            (
+                broadcaster_id,
+                day,
+                resolution,
+                timestamp,
+                message_count,
+                bits,
+                emote_count,
+                unique_chatters,
+                chatters_sketch,
+            ) = row
+            counter_parameters.append(
+                (
+                    message_count,
+                    bits,
+                    emote_count,
+                    broadcaster_id,
+                    day,
+                    resolution,
+                    timestamp,
+                )
+            )
+            unique_chatters_parameters.append(
+                (broadcaster_id, day, resolution, timestamp, unique_chatters, chatters_sketch)
+            )
+
+        # Each bucket lives in a different partition, so send them concurrently rather than as a batch
+        try:
+            with self.time_request(self.write_profile, "insert_chat_stats"):
+                counter_results = execute_concurrent_with_args(
+                    self.session,
+                    counter_statement,
+                    counter_parameters,
+                    raise_on_first_error=False,
+                    execution_profile=self.write_profile,
+                )
+                unique_chatters_results = execute_concurrent_with_args(
+                    self.session,
+                    unique_chatters_statement,
+                    unique_chatters_parameters,
+                    raise_on_first_error=False,
+                    execution_profile=self.write_profile,
+                )
+        except Exception as e:
+            logging.error(f"Exception: {e}")
+            return False, stats
+
+        # Counter increments aren't idempotent, so failed rows are returned holding only the increments
+        # that failed, so retrying them doesn't count the ones that were applied twice
+        failed_stats = []
+        for row, (counter_success, counter_result), (
+            unique_chatters_success,
+            unique_chatters_result,
+        ) in zip(stats, counter_results, unique_chatters_results):
+            if not counter_success:
+                logging.error(f"Exception: {counter_result}")
+            if not unique_chatters_success:
+                logging.error(f"Exception: {unique_chatters_result}")
+
+            if counter_success and not unique_chatters_success:
+                failed_stats.append(row[:4] + (0, 0, 0) + row[7:])
+            elif not counter_success:
+                failed_stats.append(row)
+
+        return not failed_stats, failed_stats
+
+    def get_chat_stats(self, broadcaster_id, day, resolution):
+        logging.info(
+            f"Attempting to retrieve chat stats using the parameters: broadcaster_id: {broadcaster_id}, day: {day}, resolution: {resolution}"
+        )
+
+        counter_statement = self.session.prepare(
+            """
+            SELECT timestamp, message_count, bits, emote_count FROM chat_stats_by_broadcaster_and_day
+            WHERE broadcaster_id=? AND day=? AND resolution=?
+            """
+        )
+
+        unique_chatters_statement = self.session.prepare(
+            """
+            SELECT timestamp, unique_chatters FROM unique_chatters_by_broadcaster_and_day
+            WHERE broadcaster_id=? AND day=? AND resolution=?
+            """
+        )
+
+        counter_statement.is_idempotent = True
+        unique_chatters_statement.is_idempotent = True
+
+        parameters = (broadcaster_id, day, resolution)
+        try:
+            with self.time_request(self.read_profile, "get_chat_stats"):
+                # Both reads are single partition slices, so issue them in parallel
+                counter_future = self.session.execute_async(
+                    self.bind(counter_statement, parameters, self.read_profile),
+                    execution_profile=self.read_profile,
+                )
+                unique_chatters_future = self.session.execute_async(
+                    self.bind(unique_chatters_statement, parameters, self.read_profile),
+                    execution_profile=self.read_profile,
+                )
+                counter_rows = list(counter_future.result())
+                unique_chatters = dict(unique_chatters_future.result())
+        except Exception as e:
+            logging.error(f"Exception: {e}")
+            return False, []
+
+        rows = [
+            (
+                timestamp,
+                message_count or 0,
+                unique_chatters.get(timestamp, 0),
+                bits or 0,
+                emote_count or 0,
+            )
+            for timestamp, message_count, bits, emote_count in counter_rows
+        ]
+
+        logging.info(f"Returning {len(rows)} chat stats buckets")
+        return True, rows
+
+    def get_chatter_sketches(self, broadcaster_id, ranges):
+        # ranges is a list of (day, resolution, start, end). Returns the serialized unique chatter
+        # sketch of every bucket starting in those ranges, reading the ranges in parallel.
+        logging.info(
+            f"Attempting to retrieve chatter sketches using the parameters: broadcaster_id: {broadcaster_id}, ranges: {ranges}"
+        )
+
+        statement = self.session.prepare(
+            """
+            SELECT chatters_sketch FROM unique_chatters_by_broadcaster_and_day
+            WHERE broadcaster_id=? AND day=? AND resolution=? AND timestamp>=? AND timestamp<=?
+            """
+        )
+        statement.is_idempotent = True
+
+        try:
+            with self.time_request(self.read_profile, "get_chatter_sketches"):
+                results = execute_concurrent_with_args(
+                    self.session,
+                    statement,
+                    [(broadcaster_id, *parameters) for parameters in ranges],
+                    concurrency=self.max_concurrent_reads,
+                    execution_profile=self.read_profile,
+                )
+        except Exception as e:
+            logging.error(f"Exception: {e}")
+            return False, []
+
+        sketches = []
+        for success, result in results:
+            if not success:
+                logging.error(f"Exception: {result}")
+                return False, []
+            # Buckets written before sketches were stored don't have one
+            sketches.extend(sketch for (sketch,) in result if sketch is not None)
+
+        logging.info(f"Returning {len(sketches)} chatter sketches")
+        return True, sketches
+
+    def insert_emote_sketches(self, sketches, ttl_by_resolution):
+        # sketches is a list of (broadcaster_id, day, resolution, timestamp, sketch). Each replaces the
+        # previous checkpoint of its window.
+        logging.info(f"Checkpointing {len(sketches)} emote sketches")
+
+        statement = self.session.prepare(
+            """
+            INSERT INTO top_emotes_by_broadcaster_and_day (broadcaster_id, day, resolution, timestamp, sketch)
+            VALUES (?, ?, ?, ?, ?) USING TTL ?
+            """
+        )
+        statement.is_idempotent = True
+
+        parameters = [
+            (broadcaster_id, day, resolution, timestamp, sketch, ttl_by_resolution[resolution])
+            for broadcaster_id, day, resolution, timestamp, sketch in sketches
+        ]
+
+        try:
+            with self.time_request(self.write_profile, "insert_emote_sketches"):
+                results = execute_concurrent_with_args(
+                    self.session,
+                    statement,
+                    parameters,
+                    concurrency=self.max_concurrent_writes,
+                    execution_profile=self.write_profile,
+                )
+        except Exception as e:
+            logging.error(f"Exception: {e}")
+            return False
+
+        failures = [result for success, result in results if not success]
+        for failure in failures:
+            logging.error(f"Exception: {failure}")
+
+        return not failures
+
+    def get_chatter_sketches_by_bucket(self, buckets):
+        # buckets is a list of (broadcaster_id, day, resolution, timestamp). Returns whether every
+        # bucket was read, along with a dict mapping each bucket that was read to its serialized
+        # sketch, or None if it has none.
+        logging.info(f"Retrieving the chatter sketches of {len(buckets)} buckets")
+
+        statement = self.session.prepare(
+            """
+            SELECT chatters_sketch FROM unique_chatters_by_broadcaster_and_day
+            WHERE broadcaster_id=? AND day=? AND resolution=? AND timestamp=?
+            """
+        )
+        statement.is_idempotent = True
+
+        try:
+            with self.time_request(self.read_profile, "get_chatter_sketches_by_bucket"):
+                results = execute_concurrent_with_args(
+                    self.session,
+                    statement,
+                    buckets,
+                    concurrency=self.max_concurrent_reads,
+                    raise_on_first_error=False,
+                    execution_profile=self.read_profile,
+                )
+        except Exception as e:
+            logging.error(f"Exception: {e}")
+            return False, {}
+
+        sketches = {}
+        for bucket, (success, result) in zip(buckets, results):
+            if not success:
+                logging.error(f"Exception: {result}")
+                continue
+            rows = list(result)
+            sketches[bucket] = rows[0][0] if rows else None
+
+        return len(sketches) == len(buckets), sketches
+
+    def get_emote_sketches(self, broadcaster_id, ranges):
+        # ranges is a list of (day, resolution, start, end). Returns (resolution, timestamp, sketch)
+        # for every checkpointed window starting in those ranges, reading the days in parallel.
+        logging.info(
+            f"Attempting to retrieve emote sketches using the parameters: broadcaster_id: {broadcaster_id}, ranges: {ranges}"
+        )
+
+        statement = self.session.prepare(
+            """
+            SELECT resolution, timestamp, sketch FROM top_emotes_by_broadcaster_and_day
+            WHERE broadcaster_id=? AND day=? AND resolution=? AND timestamp>=? AND timestamp<=?
+            """
+        )
+        statement.is_idempotent = True
+
+        try:
+            with self.time_request(self.read_profile, "get_emote_sketches"):
+                results = execute_concurrent_with_args(
+                    self.session,
+                    statement,
+                    [(broadcaster_id, *parameters) for parameters in ranges],
+                    concurrency=self.max_concurrent_reads,
+                    execution_profile=self.read_profile,
+                )
+        except Exception as e:
+            logging.error(f"Exception: {e}")
+            return False, []
+
+        rows = []
+        for success, result in results:
+            if not success:
+                logging.error(f"Exception: {result}")
+                return False, []
+            rows.extend(result)
+
+        logging.info(f"Returning {len(rows)} emote sketches")
+        return True, rows
+
     def insert_clip(self, timestamp, clip_id, embed_url, thumbnail_url):
         logging.info(f"Inserting {clip_id}")
 
@@ -115,28 +836,230 @@ class DatabaseConnection:
             """
         )
 
+        statement.is_idempotent = True
+
         try:
-            self.session.execute(
-                statement,
-                (
-                    1,
-                    timestamp,
-                    clip_id,
-                    embed_url,
-                    thumbnail_url,
-                ),
-            )
+            with self.time_request(self.write_profile, "insert_clip"):
+                self.session.execute(
+                    statement,
+                    (
+                        1,
+                        timestamp,
+                        clip_id,
+                        embed_url,
+                        thumbnail_url,
+                    ),
+                    execution_profile=self.write_profile,
+                )
             logging.info("Clip inserted successfully")
             return True
         except Exception as e:
             logging.error(f"Exception: {e}")
             return False
 
+    def get_chats_by_key(self, keys):
+        # keys is a list of (broadcaster_id, timestamp, message_id). Each is a point read, so they're
+        # sent in parallel with at most max_concurrent_reads in flight. Rows are returned in the same
+        # order as the keys, skipping any that weren't found.
+        logging.info(f"Attempting to retrieve {len(keys)} chats by key")
+
+        statement = self.session.prepare(
+            """
+            SELECT broadcaster_id, timestamp, message_id, message, message_blob FROM twitch_chat_by_broadcaster_and_timestamp
+            WHERE broadcaster_id=? AND year_month=? AND timestamp=? AND message_id=?
+            """
+        )
+        statement.is_idempotent = True
+
+        parameters = [
+            (broadcaster_id, get_month(timestamp), timestamp, message_id)
+            for broadcaster_id, timestamp, message_id in keys
+        ]
+
+        try:
+            with self.time_request(self.read_profile, "get_chats_by_key"):
+                results = execute_concurrent_with_args(
+                    self.session,
+                    statement,
+                    parameters,
+                    concurrency=self.max_concurrent_reads,
+                    execution_profile=self.read_profile,
+                )
+        except Exception as e:
+            logging.error(f"Exception: {e}")
+            return False, []
+
+        list_of_rows = []
+        for success, result in results:
+            if not success:
+                logging.error(f"Exception: {result}")
+                return False, []
+
+            row = result.one()
+            if row is not None:
+                list_of_rows.append(row)
+
+        logging.info(f"Returning {len(list_of_rows)} rows")
+        return True, list_of_rows
+
+    def get_thread_replies(self, broadcaster_id, thread_id, limit):
+        # Returns (broadcaster_id, timestamp, message_id) keys of the thread's replies in the order they
+        # were sent, ready to pass to get_chats_by_key
+        logging.info(
+            f"Attempting to retrieve thread replies using the parameters: broadcaster_id: {broadcaster_id}, thread_id: {thread_id}, limit: {limit}"
+        )
+
+        statement = self.session.prepare(
+            """
+            SELECT timestamp, message_id FROM chat_threads
+            WHERE broadcaster_id=? AND thread_id=?
+            LIMIT ?
+            """
+        )
+        statement.is_idempotent = True
+
+        try:
+            with self.time_request(self.read_profile, "get_thread_replies"):
+                rows = self.session.execute(
+                    self.bind(statement, (broadcaster_id, thread_id, limit), self.read_profile),
+                    execution_profile=self.read_profile,
+                )
+                keys = [(broadcaster_id, timestamp, message_id) for timestamp, message_id in rows]
+        except Exception as e:
+            logging.error(f"Exception: {e}")
+            return False, []
+
+        logging.info(f"Returning {len(keys)} thread replies")
+        return True, keys
+
+    def insert_search_postings(self, rows):
+        # rows is a list of (broadcaster_id, day, term, time_window, segment_id, postings)
+        logging.info(f"Inserting {len(rows)} search postings segments")
+
+        statement = self.session.prepare(
+            """
+            INSERT INTO chat_search_postings (broadcaster_id, day, term, time_window, segment_id, postings)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """
+        )
+        statement.is_idempotent = True
+
+        try:
+            with self.time_request(self.write_profile, "insert_search_postings"):
+                results = execute_concurrent_with_args(
+                    self.session,
+                    statement,
+                    rows,
+                    concurrency=self.max_concurrent_writes,
+                    execution_profile=self.write_profile,
+                )
+        except Exception as e:
+            logging.error(f"Exception: {e}")
+            return False
+
+        failures = [result for success, result in results if not success]
+        for failure in failures:
+            logging.error(f"Exception: {failure}")
+
+        return not failures
+
+    def compact_search_postings(self, rows):
+        # rows is a list of (broadcaster_id, day, term, time_window, segment_id, postings,
+        # replaced_segment_ids). Each compacted segment is written in the same batch that deletes the
+        # segments it replaces. They're all in one partition, so the batch is applied atomically and
+        # a search never sees both or neither.
+        logging.info(f"Compacting {len(rows)} search postings segments")
+
+        insert_statement = self.session.prepare(
+            """
+            INSERT INTO chat_search_postings (broadcaster_id, day, term, time_window, segment_id, postings)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """
+        )
+        delete_statement = self.session.prepare(
+            """
+            DELETE FROM chat_search_postings
+            WHERE broadcaster_id=? AND day=? AND term=? AND time_window=? AND segment_id=?
+            """
+        )
+
+        batches = []
+        for broadcaster_id, day, term, window, segment_id, postings, replaced_segment_ids in rows:
+            batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+            batch.add(insert_statement, (broadcaster_id, day, term, window, segment_id, postings))
+            for replaced_segment_id in replaced_segment_ids:
+                batch.add(
+                    delete_statement, (broadcaster_id, day, term, window, replaced_segment_id)
+                )
+            # Rewriting the same compacted segment and deleting the same segments again is harmless
+            batch.is_idempotent = True
+            batches.append((batch, None))
+
+        try:
+            with self.time_request(self.write_profile, "compact_search_postings"):
+                results = execute_concurrent(
+                    self.session,
+                    batches,
+                    concurrency=self.max_concurrent_writes,
+                    raise_on_first_error=False,
+                    execution_profile=self.write_profile,
+                )
+        except Exception as e:
+            logging.error(f"Exception: {e}")
+            return False
+
+        failures = [result for success, result in results if not success]
+        for failure in failures:
+            logging.error(f"Exception: {failure}")
+
+        return not failures
+
+    def get_search_postings(self, broadcaster_id, terms, windows):
+        # windows is a list of (day, first_window, last_window). Returns (time_window, postings) rows
+        # for each term, reading every term and day partition in parallel.
+        logging.info(
+            f"Attempting to retrieve search postings using the parameters: broadcaster_id: {broadcaster_id}, terms: {terms}, days: {len(windows)}"
+        )
+
+        statement = self.session.prepare(
+            """
+            SELECT time_window, postings FROM chat_search_postings
+            WHERE broadcaster_id=? AND day=? AND term=? AND time_window>=? AND time_window<=?
+            """
+        )
+        statement.is_idempotent = True
+
+        reads = [
+            (term, (broadcaster_id, day, term, first_window, last_window))
+            for term in terms
+            for day, first_window, last_window in windows
+        ]
+
+        try:
+            with self.time_request(self.read_profile, "get_search_postings"):
+                results = execute_concurrent_with_args(
+                    self.session,
+                    statement,
+                    [parameters for _, parameters in reads],
+                    concurrency=self.max_concurrent_reads,
+                    execution_profile=self.read_profile,
+                )
+        except Exception as e:
+            logging.error(f"Exception: {e}")
+            return False, {}
+
+        rows_by_term = {term: [] for term in terms}
+        for (success, result), (term, _) in zip(results, reads):
+            if not success:
+                logging.error(f"Exception: {result}")
+                return False, {}
+            rows_by_term[term].extend(result)
+
+        return True, rows_by_term
+
     def get_clips(self, start, end):
         logging.info(f"Attempting to retrieve all clips {start} and {end}")
 
-        self.session.row_factory = tuple_factory
-
         statement = self.session.prepare(
             """
             SELECT timestamp, clip_id, embed_url, thumbnail_url FROM clips_by_timestamp
@@ -146,13 +1069,16 @@ class DatabaseConnection:
             """,
         )
 
+        statement.is_idempotent = True
+
         try:
-            rows = list(
-                self.session.execute(
-                    statement,
-                    (start, end),
+            with self.time_request(self.read_profile, "get_clips"):
+                rows = list(
+                    self.session.execute(
+                        self.bind(statement, (start, end), self.read_profile),
+                        execution_profile=self.read_profile,
+                    )
                 )
-            )
             logging.info(f"Successfully retrieved {len(rows)} rows")
             return True, rows
         except Exception as e:
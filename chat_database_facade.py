@@ -1,15 +1,45 @@
 import logging
+import uuid
 from concurrent import futures
 
-import chat_database_connection
 import gen.grpc.chat_database.chat_database_pb2 as chat_database_pb2
 import gen.grpc.chat_database.chat_database_pb2_grpc as chat_database_pb2_grpc
 import grpc
+import infrastructure
+import utilities
+from chat_database_profiles import INTERACTIVE_PROFILE
+from chat_message_codec import decode_message
+from chat_rollup import HOUR, MINUTE, get_bucket_ranges
+from chat_search_index import decode_postings, find_matches, get_windows, parse_query
+from datetime_helpers import get_day
+from diagnostics import record_startup, start_http_server
+from emote_sketches import DAY, SpaceSaving
+from hyperloglog import HyperLogLog
+
+
+def build_chat(broadcaster_id, timestamp, message_id, message, message_blob):
+    # Rows written before messages were encoded still hold the JSON in the message column
+    if message_blob is not None:
+        message = decode_message(broadcaster_id, timestamp, message_id, message_blob)
+
+    return chat_database_pb2.Chat(
+        broadcaster_id=broadcaster_id,
+        timestamp=timestamp,
+        message_id=str(message_id),
+        message=message,
+    )
 
 
 class ChatDatabaseServicer(chat_database_pb2_grpc.ChatDatabaseServicer):
     def __init__(self):
-        self.database = chat_database_connection.DatabaseConnection("chat_data")
+        self.database = infrastructure.connect_chat_database(
+            "chat_data", read_profile=INTERACTIVE_PROFILE
+        )
+
+        # Each day searched is another partition read per term
+        self.max_search_days = 31
+        self.max_thread_replies = 1000
+        self.max_minute_emote_range = 6 * HOUR * 1000
 
     def __del__(self):
         self.shutdown()
@@ -36,18 +66,147 @@ class ChatDatabaseServicer(chat_database_pb2_grpc.ChatDatabaseServicer):
 
         # Repackage the chats from the database response and return the bundle back to the caller
         response = chat_database_pb2.GetChatsResponse()
-        for broadcaster_id, timestamp, message_id, message in list_of_chats:
-            response.chats.append(
-                chat_database_pb2.Chat(
-                    broadcaster_id=broadcaster_id,
-                    timestamp=timestamp,
-                    message_id=str(message_id),
-                    message=message,
+        response.chats.extend(build_chat(*row) for row in list_of_chats)
+
+        return response
+
+    def GetChatsByUser(self, request, context):
+        logging.info(
+            f"GetChatsByUser called with: broadcaster_id: {request.broadcaster_id}, user_id: {request.user_id}, start: {request.start}, end: {request.end}, limit: {request.limit}"
+        )
+
+        success, list_of_chats = self.database.get_chats_by_user(
+            request.broadcaster_id,
+            request.user_id,
+            request.start,
+            request.end,
+            request.limit,
+        )
+
+        if success:
+            logging.info(f"{len(list_of_chats)} messages returned by the database")
+        else:
+            logging.error(f"There was an error querying the database")
+
+        response = chat_database_pb2.GetChatsByUserResponse()
+        response.chats.extend(build_chat(*row) for row in list_of_chats)
+
+        return response
+
+    def GetThread(self, request, context):
+        logging.info(
+            f"GetThread called with: broadcaster_id: {request.broadcaster_id}, thread_id: {request.thread_id}, thread_timestamp: {request.thread_timestamp}, limit: {request.limit}"
+        )
+
+        response = chat_database_pb2.GetThreadResponse()
+
+        if not utilities.is_guid(request.thread_id):
+            logging.error(f"Thread Id, {request.thread_id}, isn't a valid message Id")
+            return response
+        thread_id = uuid.UUID(request.thread_id)
+
+        # Every reply costs a point read, so cap how many we'll fetch
+        limit = min(request.limit or self.max_thread_replies, self.max_thread_replies)
+        success, keys = self.database.get_thread_replies(
+            request.broadcaster_id, thread_id, limit
+        )
+        if not success:
+            logging.error(f"There was an error querying the thread index")
+            return response
+
+        if request.thread_timestamp:
+            keys.insert(0, (request.broadcaster_id, request.thread_timestamp, thread_id))
+
+        # One point read per message, with a bounded number in flight
+        success, list_of_chats = self.database.get_chats_by_key(keys)
+        if success:
+            logging.info(f"{len(list_of_chats)} messages returned by the database")
+        else:
+            logging.error(f"There was an error querying the database")
+
+        response.chats.extend(build_chat(*row) for row in list_of_chats)
+
+        return response
+
+    def GetTopEmotes(self, request, context):
+        logging.info(
+            f"GetTopEmotes called with: broadcaster_id: {request.broadcaster_id}, start: {request.start}, end: {request.end}, limit: {request.limit}"
+        )
+
+        response = chat_database_pb2.GetTopEmotesResponse()
+
+        # Short ranges are answered from the minute windows they overlap. Longer ones are answered from
+        # whole days, since merging thousands of minute sketches would be slow.
+        day_milliseconds = DAY * 1000
+        resolution = MINUTE if request.end - request.start <= self.max_minute_emote_range else DAY
+        window_milliseconds = resolution * 1000
+
+        ranges = []
+        day_start = request.start - request.start % day_milliseconds
+        while day_start <= request.end:
+            ranges.append(
+                (
+                    get_day(day_start),
+                    resolution,
+                    max(request.start // window_milliseconds * window_milliseconds, day_start),
+                    min(request.end, day_start + day_milliseconds - 1),
+                )
+            )
+            day_start += day_milliseconds
+
+        if len(ranges) > self.max_search_days:
+            logging.error(f"Top emotes can cover at most {self.max_search_days} days")
+            return response
+
+        success, rows = self.database.get_emote_sketches(request.broadcaster_id, ranges)
+        if not success:
+            logging.error(f"There was an error querying the database")
+            return response
+
+        merged = SpaceSaving()
+        for _, _, sketch in rows:
+            merged.merge(SpaceSaving.deserialize(sketch))
+
+        for emote_id, name, count, error in merged.top(request.limit):
+            response.emotes.append(
+                chat_database_pb2.EmoteCount(
+                    emote_id=emote_id, name=name, count=count, error=error
                 )
             )
 
         return response
 
+    def GetUniqueChatters(self, request, context):
+        logging.info(
+            f"GetUniqueChatters called with: broadcaster_id: {request.broadcaster_id}, start: {request.start}, end: {request.end}"
+        )
+
+        response = chat_database_pb2.GetUniqueChattersResponse()
+
+        ranges = get_bucket_ranges(request.start, request.end)
+        if len({day for day, _, _, _ in ranges}) > self.max_search_days:
+            logging.error(f"Unique chatters can cover at most {self.max_search_days} days")
+            return response
+
+        success, sketches = self.database.get_chatter_sketches(request.broadcaster_id, ranges)
+        if not success:
+            logging.error(f"There was an error querying the database")
+            return response
+
+        # A chatter seen in several buckets is only counted once in the merged sketch
+        merged = None
+        for sketch in sketches:
+            if merged is None:
+                merged = HyperLogLog.deserialize(sketch)
+            else:
+                merged.merge(HyperLogLog.deserialize(sketch))
+
+        if merged is not None:
+            response.unique_chatters = round(merged.estimate())
+            response.relative_error = merged.relative_error()
+
+        return response
+
     def GetClips(self, request, context):
         logging.info(
             f"GetClips called with: start: {request.start}, end: {request.end}"
@@ -77,6 +236,103 @@ class ChatDatabaseServicer(chat_database_pb2_grpc.ChatDatabaseServicer):
 
         return response
 
+    def GetChatStats(self, request, context):
+        logging.info(
+            f"GetChatStats called with: broadcaster_id: {request.broadcaster_id}, day: {request.day}, resolution: {request.resolution}"
+        )
+
+        success, list_of_stats = self.database.get_chat_stats(
+            request.broadcaster_id,
+            request.day,
+            request.resolution,
+        )
+
+        if success:
+            logging.info(f"{len(list_of_stats)} stats buckets returned by the database")
+        else:
+            logging.error(f"There was an error querying the database")
+
+        # Repackage the stats from the database response and return the bundle back to the caller
+        response = chat_database_pb2.GetChatStatsResponse()
+        for (
+            timestamp,
+            message_count,
+            unique_chatters,
+            bits,
+            emote_count,
+        ) in list_of_stats:
+            response.stats.append(
+                chat_database_pb2.ChatStats(
+                    timestamp=timestamp,
+                    message_count=message_count,
+                    unique_chatters=unique_chatters,
+                    bits=bits,
+                    emote_count=emote_count,
+                )
+            )
+
+        return response
+
+    def SearchChats(self, request, context):
+        logging.info(
+            f"SearchChats called with: broadcaster_id: {request.broadcaster_id}, query: {request.query}, start: {request.start}, end: {request.end}, limit: {request.limit}"
+        )
+
+        response = chat_database_pb2.SearchChatsResponse()
+
+        phrases = parse_query(request.query)
+        windows = get_windows(request.start, request.end)
+        if not phrases or len(windows) > self.max_search_days:
+            logging.error(
+                f"Search must have at least one term and cover at most {self.max_search_days} days"
+            )
+            return response
+
+        # Days are read in time order and the search stops as soon as it has enough matches, so a
+        # common query doesn't read and decode the postings of the whole range
+        terms = sorted({term for phrase in phrases for term in phrase})
+        matches = []
+        for window in windows:
+            success, rows_by_term = self.database.get_search_postings(
+                request.broadcaster_id, terms, [window]
+            )
+            if not success:
+                logging.error(f"There was an error querying the search index")
+                return response
+
+            # Every term has to appear in a matching message
+            if not all(rows_by_term.values()):
+                continue
+
+            # The same message can appear in more than one segment if a flush was retried, so key the
+            # postings by message to deduplicate them
+            postings_by_term = {}
+            for term, rows in rows_by_term.items():
+                postings = postings_by_term[term] = {}
+                for time_window, data in rows:
+                    for timestamp, message_id, positions in decode_postings(time_window, data):
+                        if request.start <= timestamp <= request.end:
+                            postings[(timestamp, message_id)] = positions
+
+            matches.extend(find_matches(phrases, postings_by_term)[: request.limit - len(matches)])
+            if len(matches) >= request.limit:
+                break
+
+        logging.info(f"{len(matches)} messages matched the search")
+
+        success, list_of_chats = self.database.get_chats_by_key(
+            [
+                (request.broadcaster_id, timestamp, message_id)
+                for timestamp, message_id in matches
+            ]
+        )
+        if not success:
+            logging.error(f"There was an error querying the database")
+
+        response.chats.extend(build_chat(*row) for row in list_of_chats)
+
+        return response
+
 
 def serve():
     logging.basicConfig(
@@ -85,12 +341,15 @@ def serve():
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     )
 
+    start_http_server(9400)
+
     server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
     chat_database_pb2_grpc.add_ChatDatabaseServicer_to_server(
         ChatDatabaseServicer(), server
     )
     server.add_insecure_port("[::]:50051")
     server.start()
+    record_startup("chat_database_facade")
     server.wait_for_termination()
 
 
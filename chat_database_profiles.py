@@ -0,0 +1,13 @@
+# Names of the execution profiles each service can choose between for its reads and writes. The
+# profiles themselves are built by chat_database_connection, so services can name one without
+# importing the Cassandra driver.
+INGEST_PROFILE = "ingest"
+INTERACTIVE_PROFILE = "interactive"
+BULK_EXPORT_PROFILE = "bulk_export"
+
+# Execution profiles don't carry a fetch size, so statements run under a profile are given this one
+PROFILE_FETCH_SIZES = {
+    INGEST_PROFILE: 100,
+    INTERACTIVE_PROFILE: 100,
+    BULK_EXPORT_PROFILE: 5000,
+}
@@ -29,6 +29,33 @@ def serialize_clip_database_rows(list_of_chats):
     return [serialize_clip_database_row(message) for message in list_of_chats]
 
 
+def serialize_chat_stats_row(stats):
+    return {
+        "timestamp": stats.timestamp,
+        "message_count": stats.message_count,
+        "unique_chatters": stats.unique_chatters,
+        "bits": stats.bits,
+        "emote_count": stats.emote_count,
+    }
+
+
+def serialize_chat_stats_rows(list_of_stats):
+    return [serialize_chat_stats_row(stats) for stats in list_of_stats]
+
+
+def serialize_emote_count(emote):
+    return {
+        "emote_id": emote.emote_id,
+        "name": emote.name,
+        "count": emote.count,
+        "error": emote.error,
+    }
+
+
+def serialize_emote_counts(list_of_emotes):
+    return [serialize_emote_count(emote) for emote in list_of_emotes]
+
+
 # Concatenate all elements of the primary key and base62 encode it so we have a URL safe string for pagination
 def get_cursor(primary_key_elements):
     cursor = " ".join(str(item) for item in primary_key_elements)
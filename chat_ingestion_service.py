@@ -1,21 +1,45 @@
 import json
 import logging
+import os
+import threading
+import time
 import uuid
-from collections import defaultdict
 
-import auth.secrets as secrets
-import chat_database_connection
-import pika
+import infrastructure
+from chat_database_profiles import INGEST_PROFILE
+from chat_message_codec import encode_message
+from chat_rollup import ChatRollup
+from chat_spool import ChatSpool
 from datetime_helpers import get_month
+from diagnostics import lazy, log_hot_path, record_startup, start_http_server
+from hyperloglog import precision_for_error
+from message_deduplicator import MessageDeduplicator
+from prometheus_client import Counter
+from tracing import PUBLISHED_AT_HEADER, SENT_AT_HEADER, Tracer, now_milliseconds
+
+
+def get_partition_key(fields):
+    return f"{fields['broadcaster_id']} {get_month(fields['timestamp'])}"
+
+
+def get_primary_key(fields):
+    return " ".join(
+        [
+            get_partition_key(fields),
+            str(fields["timestamp"]),
+            str(fields["message_id"]),
+        ]
+    )
 
 
 class ChatIngestor:
     def __init__(self):
-        self.database = chat_database_connection.DatabaseConnection("chat_data")
-
-        self.message_queue_connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=secrets.get_cloudamqp_url())
+        # The database connects while we set up the message queue below
+        database = infrastructure.connect_in_background(
+            infrastructure.connect_chat_database, "chat_data", write_profile=INGEST_PROFILE
         )
+
+        self.message_queue_connection = infrastructure.connect_message_queue()
         self.channel = self.message_queue_connection.channel()
 
         # All chat messages are published to the chat exchange
@@ -27,74 +51,308 @@ class ChatIngestor:
 
         self.channel.queue_bind(exchange=self.chat_exchange, queue=self.chat_queue)
 
-        # Dictionary to hold messages until we have enough to write to the database
-        # The key is the database partition key and value is a list of messages
-        self.message_batches = defaultdict(list)
+        # Messages are written to a local spool and only acked once the spool has been fsync'd, so
+        # nothing we've acked is lost if the process dies or the database is unavailable. Each
+        # sealed spool segment becomes one batch for the database.
         self.batch_size = 1000
-        self.current_batch_size = 0
+        self.spool = ChatSpool(
+            os.environ.get("CHAT_SPOOL_DIRECTORY", "chat_spool"),
+            segment_max_records=self.batch_size,
+        )
+
+        # Rather than fsync every message, we fsync and ack in groups
+        self.sync_group_size = 250
+        self.sync_interval_seconds = 0.05
+        self.unsynced_message_count = 0
+        self.last_delivery_tag = None
+
+        # Redeliveries and listeners rejoining chat rooms produce duplicate messages, so drop any
+        # message Id we've already ingested recently before it costs us a database write. Each
+        # minute of the window gets a bloom filter sized for the capacity at the error rate.
+        self.deduplicator = MessageDeduplicator(
+            capacity_per_minute=int(os.environ.get("DEDUPLICATOR_CAPACITY_PER_MINUTE", 1000000)),
+            error_rate=float(os.environ.get("DEDUPLICATOR_ERROR_RATE", 1e-6)),
+        )
+        self.duplicate_counter = Counter(
+            "chat_duplicate_message_count",
+            "Number of duplicate chat messages dropped before ingestion",
+        )
+        self.malformed_counter = Counter(
+            "chat_malformed_message_count",
+            "Number of chat messages set aside because they couldn't be parsed",
+        )
+
+        self.tracer = Tracer("chat_ingestion")
+        # Timings of sampled messages, keyed by message Id, held until the message has been written
+        self.sampled_traces = {}
+        self.max_sampled_traces = 10000
+
+        # Per-broadcaster minute and hour level stats that are written alongside each batch. Unique
+        # chatters are counted with HyperLogLog sketches, which take 2^precision bytes at most, so a
+        # lower error rate costs more memory and storage per bucket.
+        self.chatter_sketch_error_rate = float(
+            os.environ.get("CHATTER_SKETCH_ERROR_RATE", 0.02)
+        )
+        self.chat_rollup = ChatRollup(
+            chatter_sketch_precision=precision_for_error(self.chatter_sketch_error_rate)
+        )
+
+        # How long to wait before retrying a batch the database couldn't take. This doubles on every
+        # consecutive failure up to the maximum.
+        self.min_retry_delay_seconds = 1
+        self.max_retry_delay_seconds = 60
+        self.failed_segment_counter = Counter(
+            "chat_failed_spool_segment_count",
+            "Number of spool segments set aside because they couldn't be written to the database",
+        )
+        self.rejected_counter = Counter(
+            "chat_rejected_message_count",
+            "Number of chat messages set aside because the database rejected them",
+        )
+
+        self.spool_drainer = threading.Thread(target=self.drain_spool, daemon=True)
+
+        self.database = database.result()
 
     def __del__(self):
         self.shutdown()
 
     def shutdown(self):
         self.message_queue_connection.close()
+        self.spool.close()
         self.database.close()
 
     def start_consuming_chats(self):
-        self.channel.basic_qos(prefetch_count=1)
+        self.spool_drainer.start()
+
+        # Allow a full sync group to be outstanding since messages are only acked once they're durable
+        self.channel.basic_qos(prefetch_count=self.sync_group_size)
         self.channel.basic_consume(
             queue=self.chat_queue, on_message_callback=self.handle_chat_message
         )
+        self.message_queue_connection.call_later(
+            self.sync_interval_seconds, self.sync_spool_on_interval
+        )
         logging.info("Start consuming chats from queue")
         self.channel.start_consuming()
 
     def handle_chat_message(self, ch, method, properties, body):
-        message_fields = json.loads(body.decode())
-        message_fields["message_id"] = uuid.UUID(message_fields["message_id"])
+        consumed_at = now_milliseconds()
+        headers = properties.headers or {}
+        self.tracer.observe("queue_dwell", headers.get(PUBLISHED_AT_HEADER), consumed_at)
 
-        def get_partition_key(fields):
-            return f"{fields['broadcaster_id']} {get_month(fields['timestamp'])}"
+        if (
+            self.tracer.is_sampled(properties.message_id)
+            and len(self.sampled_traces) < self.max_sampled_traces
+        ):
+            self.sampled_traces[properties.message_id] = {
+                "sent": headers.get(SENT_AT_HEADER),
+                "published": headers.get(PUBLISHED_AT_HEADER),
+                "consumed": consumed_at,
+            }
 
-        def get_primary_key(fields):
-            return " ".join(
-                [
-                    get_partition_key(fields),
-                    str(fields["timestamp"]),
-                    str(fields["message_id"]),
-                ]
-            )
+        self.spool.append(body)
+        self.unsynced_message_count += 1
+        self.last_delivery_tag = method.delivery_tag
 
-        logging.info(
-            f"Saving message, {get_primary_key(message_fields)}, to in-memory store"
-        )
+        if self.unsynced_message_count >= self.sync_group_size:
+            self.sync_spool()
 
-        # Convert the values in the message_fields dictionary to a tuple and then append it the list
-        # holding all the messages in the same partition
-        self.current_batch_size += 1
-        self.message_batches[get_partition_key(message_fields)].append(
-            tuple(message_fields[key] for key in list(message_fields))
+    def sync_spool_on_interval(self):
+        self.sync_spool()
+        self.message_queue_connection.call_later(
+            self.sync_interval_seconds, self.sync_spool_on_interval
         )
 
-        if self.current_batch_size < self.batch_size:
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-            return
+    def sync_spool(self):
+        if self.last_delivery_tag is not None:
+            with self.tracer.time_stage("spool_sync"):
+                self.spool.sync()
+            self.channel.basic_ack(delivery_tag=self.last_delivery_tag, multiple=True)
+            self.unsynced_message_count = 0
+            self.last_delivery_tag = None
+
+        # Hand the segment to the drainer once it holds a full batch or has been open long enough
+        if self.spool.should_seal():
+            self.spool.seal()
 
-        for partition_key, message_list in self.message_batches.items():
-            success = self.database.insert_chats([message for message in message_list])
+    def drain_spool(self):
+        while True:
+            for segment in self.spool.wait_for_sealed_segments(timeout=1):
+                try:
+                    rejected = self.insert_messages(self.spool.read_segment(segment))
+                    if rejected:
+                        # Kept as a segment of their own so they can be replayed like any other
+                        logging.error(
+                            f"Setting aside {len(rejected)} messages from {segment} that couldn't be inserted"
+                        )
+                        self.spool.set_aside_records(segment, rejected)
+                except Exception:
+                    # Messages keep being acked into the spool, so this thread can't be allowed to die.
+                    # Set the segment aside to be looked at and replayed by hand and move on.
+                    logging.exception(f"Failed to insert message batch from {segment}, setting it aside")
+                    self.spool.set_aside_segment(segment)
+                    self.failed_segment_counter.inc()
+                    continue
+
+                self.spool.remove_segment(segment)
+                logging.info(f"Finished inserting message batch from {segment}")
+
+    def write_with_retry(self, write, rows):
+        # Rows that failed because the database couldn't take them right now are safe in the spool, so
+        # they're retried for as long as the database is down. Returns the rows it rejected outright,
+        # which would fail the same way on every retry.
+        retry_delay = self.min_retry_delay_seconds
+        rejected_rows = []
+        while rows:
+            success, rows, rejected = write(rows)
+            rejected_rows.extend(rejected)
 
             if success:
-                logging.info(
-                    f"Inserted {len(message_list)} messages into {partition_key} successfully"
-                )
-            else:
+                logging.info(f"Inserted message batch successfully")
+            elif rows:
                 logging.error(
-                    f"There was an error inserting {len(message_list)} messages into {partition_key}"
+                    f"There was an error inserting {len(rows)} messages. Retrying in {retry_delay} seconds"
                 )
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, self.max_retry_delay_seconds)
 
-        self.message_batches = defaultdict(list)
-        self.current_batch_size = 0
-        logging.info(f"Finished inserting message batch")
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+        return rejected_rows
+
+    def parse_message(self, body):
+        # Returns the message's fields, its deserialized message and the user and thread Ids it's
+        # indexed by, raising if any of them are malformed
+        message_fields = json.loads(body.decode())
+        message_fields["message_id"] = uuid.UUID(message_fields["message_id"])
+        message = json.loads(message_fields["message"])
+
+        user_id = message["user"]["id"]
+        if user_id is not None:
+            user_id = int(user_id)
+
+        thread_id = message["reply_thread_parent_msg_id"]
+        if thread_id is not None:
+            thread_id = uuid.UUID(thread_id)
+
+        return message_fields, message, user_id, thread_id
+
+    def insert_messages(self, bodies):
+        # Returns the bodies of the messages that couldn't be inserted, because they're malformed or
+        # the database rejected them
+        messages = []
+        user_messages = []
+        thread_replies = []
+        rejected_bodies = []
+        bodies_by_id = {}
+
+        for body in bodies:
+            try:
+                message_fields, message, user_id, thread_id = self.parse_message(body)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                # A malformed message would fail the same way every time, so only that one is set aside
+                logging.error(f"Setting aside malformed message {body[:200]!r}: {e!r}")
+                self.malformed_counter.inc()
+                rejected_bodies.append(body)
+                continue
+
+            if self.deduplicator.is_duplicate(
+                message_fields["timestamp"], message_fields["message_id"]
+            ):
+                logging.debug(
+                    "Dropping duplicate message, %s",
+                    lazy(get_primary_key, message_fields),
+                )
+                self.duplicate_counter.inc()
+                self.sampled_traces.pop(str(message_fields["message_id"]), None)
+                continue
+
+            log_hot_path(
+                "Saving message, %s, to in-memory store",
+                lazy(get_primary_key, message_fields),
+            )
+
+            self.chat_rollup.append(
+                message_fields["broadcaster_id"], message_fields["timestamp"], message
+            )
+
+            # Encode the message for storage and add it to the list of messages to write. The
+            # database groups them into batches by partition.
+            broadcaster_id = message_fields["broadcaster_id"]
+            timestamp = message_fields["timestamp"]
+            message_id = message_fields["message_id"]
+            bodies_by_id[message_id] = body
+            message_blob = encode_message(
+                broadcaster_id, timestamp, message_id, message_fields["message"]
+            )
+            messages.append((broadcaster_id, timestamp, message_id, message_blob))
+
+            # The same encoded message is also written to the per-user index
+            if user_id is not None:
+                user_messages.append(
+                    (broadcaster_id, user_id, timestamp, message_id, message_blob)
+                )
+
+            # Replies are added to the index of the thread they belong to
+            if thread_id is not None:
+                thread_replies.append((broadcaster_id, thread_id, timestamp, message_id))
+
+        rejected_ids = set()
+        rejected_ids.update(
+            row[2] for row in self.write_with_retry(self.database.insert_chats, messages)
+        )
+        rejected_ids.update(
+            row[3] for row in self.write_with_retry(self.database.insert_user_chats, user_messages)
+        )
+        rejected_ids.update(
+            row[3]
+            for row in self.write_with_retry(self.database.insert_thread_replies, thread_replies)
+        )
+        rejected_bodies.extend(bodies_by_id[message_id] for message_id in rejected_ids)
+        self.rejected_counter.inc(len(rejected_ids))
+
+        written_at = now_milliseconds()
+        for _, timestamp, message_id, _ in messages:
+            if message_id in rejected_ids:
+                continue
+
+            # Measures from when the message was sent in Twitch chat to when it was durably stored
+            self.tracer.observe("end_to_end", timestamp, written_at)
+
+            timings = self.sampled_traces.pop(str(message_id), None)
+            if timings is not None:
+                timings["written"] = written_at
+                self.tracer.export(message_id, timings)
+
+        # Stats that fail to be written are retried with the next batch rather than holding this one up.
+        # Unlike the chat rows, counter increments aren't idempotent and the deduplicator starts empty,
+        # so a segment that's replayed after its stats were written, because the process died before
+        # removing it or it was set aside and moved back, has its messages counted twice in the stats.
+        self.merge_stored_sketches()
+        stats = self.chat_rollup.drain()
+        success, failed_stats = self.database.insert_chat_stats(stats)
+        if not success:
+            logging.error(
+                f"There was an error updating {len(failed_stats)} chat stats buckets. Retrying with the next batch"
+            )
+            self.chat_rollup.mark_dirty(failed_stats)
+
+        return rejected_bodies
+
+    def merge_stored_sketches(self):
+        # Writing a bucket's sketch replaces the stored one, so a bucket that was written before this
+        # process created it, because the ingestor restarted mid-bucket or a replayed segment revisits
+        # a bucket that was evicted, would otherwise lose every chatter counted before. Buckets whose
+        # sketch can't be read are held back and tried again with the next batch.
+        buckets = self.chat_rollup.get_unmerged_buckets()
+        if not buckets:
+            return
+
+        success, sketches = self.database.get_chatter_sketches_by_bucket(buckets)
+        if not success:
+            logging.error(
+                f"There was an error reading {len(buckets) - len(sketches)} stored chatter sketches. Retrying with the next batch"
+            )
+        self.chat_rollup.merge_stored_sketches(sketches)
 
 
 def main():
@@ -104,7 +362,10 @@ def main():
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     )
 
+    start_http_server(9300)
+
     session = ChatIngestor()
+    record_startup("chat_ingestion")
     session.start_consuming_chats()
 
 
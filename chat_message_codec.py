@@ -0,0 +1,144 @@
+import json
+import zlib
+
+# The message column used to hold the JSON produced by twitch_proxy.serialize_message. Messages are
+# now stored in the message_blob column in one of the formats below, identified by the first byte.
+#
+# POSITIONAL_FORMAT drops the field names along with the fields that duplicate the primary key
+# (id, sent_timestamp and room.room_id) and stores the remaining values as a JSON array in a fixed
+# order. RAW_FORMAT stores the JSON unchanged and is used for any message that doesn't have exactly
+# the shape we expect. Both are deflated with a preset dictionary of the values that appear in almost
+# every message, since a single chat message is too short for deflate to find much to reuse on its own.
+RAW_FORMAT = 0
+POSITIONAL_FORMAT = 1
+
+MESSAGE_KEYS = (
+    "text",
+    "is_me",
+    "bits",
+    "sent_timestamp",
+    "reply_parent_msg_id",
+    "reply_parent_user_id",
+    "reply_parent_user_login",
+    "reply_parent_display_name",
+    "reply_parent_msg_body",
+    "reply_thread_parent_msg_id",
+    "reply_thread_parent_user_login",
+    "emotes",
+    "id",
+    "room",
+    "user",
+)
+ROOM_KEYS = (
+    "name",
+    "is_emote_only",
+    "is_subs_only",
+    "is_followers_only",
+    "is_unique_only",
+    "follower_only_delay",
+    "room_id",
+    "slow",
+)
+USER_KEYS = (
+    "name",
+    "badge_info",
+    "badges",
+    "color",
+    "display_name",
+    "mod",
+    "subscriber",
+    "turbo",
+    "id",
+    "user_type",
+    "vip",
+)
+
+# These are restored from the primary key columns when decoding
+STORED_MESSAGE_KEYS = tuple(
+    key for key in MESSAGE_KEYS if key not in ("sent_timestamp", "id", "room", "user")
+)
+STORED_ROOM_KEYS = tuple(key for key in ROOM_KEYS if key != "room_id")
+
+# Deflate favours matches near the end of the dictionary, so the most common content goes last
+PRESET_DICTIONARY = (
+    b'{"vip":"1","moderator":"1","broadcaster":"1","premium":"1","turbo":"1","partner":"1",'
+    b'"founder":"0","sub-gifter":"1","bits":"100","no_audio":"1","no_video":"1"}'
+    b'"emotesv2_":[{"start_position":"0","end_position":"5"}]},'
+    b'"#8A2BE2","#1E90FF","#00FF7F","#9ACD32","#FF0000","#0000FF","#B22222","#DAA520","#FF4500",'
+    b'"#2E8B57","#5F9EA0","#D2691E","#FF69B4",'
+    b'[[null,false,0,null,null,null,null,null,null,null,null],[false,false,true,false,0,0],'
+    b'["",null,{"subscriber":"12"},"#FF69B4","",false,true,false,"",null,false]]'
+    b'[[null,false,0,null,null,null,null,null,null,null,null],[false,false,false,false,0,0],'
+    b'["",null,null,null,"",false,false,false,"",null,false]],['
+)
+
+COMPRESSION_LEVEL = 6
+
+
+def compress(data):
+    # Negative window bits produce a raw deflate stream without the zlib header and checksum
+    compressor = zlib.compressobj(
+        COMPRESSION_LEVEL, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, PRESET_DICTIONARY
+    )
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data):
+    decompressor = zlib.decompressobj(-15, PRESET_DICTIONARY)
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+def has_positional_shape(broadcaster_id, timestamp, message_id, fields):
+    return (
+        tuple(fields) == MESSAGE_KEYS
+        and isinstance(fields["room"], dict)
+        and isinstance(fields["user"], dict)
+        and tuple(fields["room"]) == ROOM_KEYS
+        and tuple(fields["user"]) == USER_KEYS
+        and fields["sent_timestamp"] == timestamp
+        and fields["id"] == str(message_id)
+        and fields["room"]["room_id"] == str(broadcaster_id)
+    )
+
+
+def encode_message(broadcaster_id, timestamp, message_id, message):
+    fields = json.loads(message)
+
+    if not has_positional_shape(broadcaster_id, timestamp, message_id, fields):
+        return bytes((RAW_FORMAT,)) + compress(message.encode())
+
+    values = [
+        [fields[key] for key in STORED_MESSAGE_KEYS],
+        [fields["room"][key] for key in STORED_ROOM_KEYS],
+        [fields["user"][key] for key in USER_KEYS],
+    ]
+    return bytes((POSITIONAL_FORMAT,)) + compress(
+        json.dumps(values, separators=(",", ":")).encode()
+    )
+
+
+def decode_message(broadcaster_id, timestamp, message_id, message_blob):
+    message_format = message_blob[0]
+    data = decompress(message_blob[1:])
+
+    if message_format == RAW_FORMAT:
+        return data.decode()
+
+    if message_format != POSITIONAL_FORMAT:
+        raise ValueError(f"Unknown message format {message_format}")
+
+    message_values, room_values, user_values = json.loads(data)
+
+    fields = dict(zip(STORED_MESSAGE_KEYS, message_values))
+    fields["sent_timestamp"] = timestamp
+    fields["id"] = str(message_id)
+
+    room = dict(zip(STORED_ROOM_KEYS, room_values))
+    room["room_id"] = str(broadcaster_id)
+
+    fields["room"] = {key: room[key] for key in ROOM_KEYS}
+    fields["user"] = dict(zip(USER_KEYS, user_values))
+
+    # Rebuild the message in the same key order as serialize_message so the JSON is byte for byte
+    # what was originally published
+    return json.dumps({key: fields[key] for key in MESSAGE_KEYS})
@@ -0,0 +1,191 @@
+from datetime_helpers import MILLISECONDS_PER_DAY, get_day
+from hyperloglog import HyperLogLog, hash_value
+
+# Bucket sizes, in seconds, of the per-broadcaster rollups maintained at ingest time
+MINUTE = 60
+HOUR = 3600
+RESOLUTIONS = (MINUTE, HOUR)
+
+
+def get_bucket_ranges(start, end):
+    # Returns (day, resolution, first bucket, last bucket) ranges whose buckets together cover every
+    # minute from start to end. Whole hours are covered by hour buckets and the partial hours at either
+    # end by minute buckets, so the fewest buckets are read.
+    minute = MINUTE * 1000
+    hour = HOUR * 1000
+    first_minute = start // minute * minute
+    last_minute = end // minute * minute
+    first_hour = -(-first_minute // hour) * hour
+    hours_end = (last_minute + minute) // hour * hour
+
+    if first_hour < hours_end:
+        spans = [
+            (MINUTE, first_minute, first_hour - minute),
+            (HOUR, first_hour, hours_end - hour),
+            (MINUTE, hours_end, last_minute),
+        ]
+    else:
+        spans = [(MINUTE, first_minute, last_minute)]
+
+    # Buckets are partitioned by day, so split each span at day boundaries
+    ranges = []
+    for resolution, first, last in spans:
+        day_start = first - first % MILLISECONDS_PER_DAY
+        while day_start <= last:
+            ranges.append(
+                (
+                    get_day(day_start),
+                    resolution,
+                    max(first, day_start),
+                    min(last, day_start + MILLISECONDS_PER_DAY - 1),
+                )
+            )
+            day_start += MILLISECONDS_PER_DAY
+    return ranges
+
+
+def count_emotes(emotes):
+    # emotes maps each emote Id to the list of positions it was used at in the message
+    if not emotes:
+        return 0
+    return sum(len(positions) for positions in emotes.values())
+
+
+class ChatBucket:
+    def __init__(self, chatter_sketch_precision):
+        # The additive fields only hold what has been added since the bucket was last drained since
+        # they're written as counter increments
+        self.message_count = 0
+        self.bits = 0
+        self.emote_count = 0
+        # Unique chatters can't be incremented, so keep a sketch of every chatter until the bucket is
+        # evicted. Sketches of different buckets merge, so unique chatters can be counted over any range.
+        self.chatters = HyperLogLog(chatter_sketch_precision)
+        # The stored sketch is overwritten on every write, so a bucket that may already have been
+        # written, by an earlier process or before it was evicted, merges the stored sketch in first
+        self.merged_stored_sketch = False
+
+
+class ChatRollup:
+    def __init__(self, retention_seconds=2 * HOUR, chatter_sketch_precision=12):
+        # Keyed by (broadcaster_id, resolution, bucket timestamp in milliseconds)
+        self.buckets = {}
+        self.dirty_buckets = set()
+        self.retention_milliseconds = retention_seconds * 1000
+        self.latest_timestamp = 0
+        self.chatter_sketch_precision = chatter_sketch_precision
+
+    def append(self, broadcaster_id, timestamp, message):
+        # message is the deserialized output of twitch_proxy.serialize_message
+        user_id = message["user"]["id"]
+        # Hash once for both resolutions
+        chatter_hash = hash_value(user_id) if user_id is not None else None
+        bits = message["bits"] or 0
+        emote_count = count_emotes(message["emotes"])
+
+        for resolution in RESOLUTIONS:
+            bucket_size = resolution * 1000
+            key = (broadcaster_id, resolution, timestamp // bucket_size * bucket_size)
+
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = ChatBucket(self.chatter_sketch_precision)
+
+            bucket.message_count += 1
+            bucket.bits += bits
+            bucket.emote_count += emote_count
+            if chatter_hash is not None:
+                bucket.chatters.add_hash(chatter_hash)
+            self.dirty_buckets.add(key)
+
+        self.latest_timestamp = max(self.latest_timestamp, timestamp)
+
+    def get_unmerged_buckets(self):
+        # Returns (broadcaster_id, day, resolution, timestamp) of every changed bucket whose stored
+        # sketch hasn't been merged in yet
+        return [
+            (broadcaster_id, get_day(timestamp), resolution, timestamp)
+            for broadcaster_id, resolution, timestamp in self.dirty_buckets
+            if not self.buckets[(broadcaster_id, resolution, timestamp)].merged_stored_sketch
+        ]
+
+    def merge_stored_sketches(self, sketches):
+        # sketches maps (broadcaster_id, day, resolution, timestamp) to the bucket's stored sketch, or
+        # None when nothing is stored for it
+        for (broadcaster_id, _, resolution, timestamp), sketch in sketches.items():
+            bucket = self.buckets.get((broadcaster_id, resolution, timestamp))
+            if bucket is None or bucket.merged_stored_sketch:
+                continue
+            if sketch is not None:
+                bucket.chatters.merge(HyperLogLog.deserialize(sketch))
+            bucket.merged_stored_sketch = True
+
+    def drain(self):
+        # Returns a row per bucket that changed since the last drain in the form:
+        # (broadcaster_id, day, resolution, timestamp, message_count, bits, emote_count, unique_chatters,
+        # chatters_sketch)
+        # Buckets whose stored sketch hasn't been merged in yet stay dirty until it has.
+        rows = []
+        unmerged_buckets = set()
+        for key in self.dirty_buckets:
+            broadcaster_id, resolution, timestamp = key
+            bucket = self.buckets[key]
+            if not bucket.merged_stored_sketch:
+                unmerged_buckets.add(key)
+                continue
+            rows.append(
+                (
+                    broadcaster_id,
+                    get_day(timestamp),
+                    resolution,
+                    timestamp,
+                    bucket.message_count,
+                    bucket.bits,
+                    bucket.emote_count,
+                    round(bucket.chatters.estimate()),
+                    bucket.chatters.serialize(),
+                )
+            )
+            bucket.message_count = 0
+            bucket.bits = 0
+            bucket.emote_count = 0
+
+        self.dirty_buckets = unmerged_buckets
+
+        # Forget buckets that ended long enough ago that we don't expect any more messages for them
+        cutoff = self.latest_timestamp - self.retention_milliseconds
+        self.buckets = {
+            key: bucket
+            for key, bucket in self.buckets.items()
+            if key[2] + key[1] * 1000 >= cutoff or key in unmerged_buckets
+        }
+
+        return rows
+
+    def mark_dirty(self, rows):
+        # Called with rows from drain that failed to be written so they're included in the next drain.
+        # Their increments were zeroed by the drain, so they're added back.
+        for (
+            broadcaster_id,
+            _,
+            resolution,
+            timestamp,
+            message_count,
+            bits,
+            emote_count,
+            _,
+            chatters_sketch,
+        ) in rows:
+            key = (broadcaster_id, resolution, timestamp)
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                # The drain that returned the row evicted its bucket. Its sketch already had the
+                # stored one merged in.
+                bucket = self.buckets[key] = ChatBucket(self.chatter_sketch_precision)
+                bucket.chatters = HyperLogLog.deserialize(chatters_sketch)
+                bucket.merged_stored_sketch = True
+
+            bucket.message_count += message_count
+            bucket.bits += bits
+            bucket.emote_count += emote_count
+            self.dirty_buckets.add(key)
@@ -0,0 +1,221 @@
+import re
+import uuid
+from collections import defaultdict
+
+from datetime_helpers import get_day
+from utilities import read_varint, write_varint
+
+# Postings are grouped into segments by broadcaster, day, term and a 10 minute window of message
+# timestamps, so a time range query only reads the windows it overlaps. Windows divide a day evenly,
+# so a window never spans two days.
+MILLISECONDS_PER_DAY = 24 * 60 * 60 * 1000
+WINDOW_MILLISECONDS = 10 * 60 * 1000
+
+# Longer tokens are almost always spam or URLs and would bloat the index
+MAX_TOKEN_LENGTH = 64
+
+TOKEN_PATTERN = re.compile(r"\w+")
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) <= MAX_TOKEN_LENGTH]
+
+
+def parse_query(query):
+    # Quoted text is a phrase whose tokens must appear next to each other. Every other word is a term,
+    # unless tokenizing splits it into several tokens, in which case those must be adjacent too.
+    # Every phrase must match.
+    phrases = []
+    for quoted, word in QUERY_PATTERN.findall(query):
+        tokens = tokenize(quoted or word)
+        if tokens:
+            phrases.append(tokens)
+    return phrases
+
+
+def get_windows(start, end):
+    # Returns (day, first_window, last_window) for each day between the two timestamps
+    windows = []
+    day_start = start - start % MILLISECONDS_PER_DAY
+    while day_start <= end:
+        windows.append(
+            (
+                get_day(day_start),
+                max(start, day_start) // WINDOW_MILLISECONDS,
+                min(end, day_start + MILLISECONDS_PER_DAY - 1) // WINDOW_MILLISECONDS,
+            )
+        )
+        day_start += MILLISECONDS_PER_DAY
+    return windows
+
+
+# A segment's postings are sorted by timestamp, so timestamps and positions are stored as varint
+# deltas. Message Ids are random, so they're stored as their 16 raw bytes.
+def encode_postings(window, postings):
+    buffer = bytearray()
+    write_varint(buffer, len(postings))
+
+    previous_timestamp = window * WINDOW_MILLISECONDS
+    for timestamp, message_id, positions in postings:
+        write_varint(buffer, timestamp - previous_timestamp)
+        previous_timestamp = timestamp
+        buffer += message_id.bytes
+
+        write_varint(buffer, len(positions))
+        previous_position = 0
+        for position in positions:
+            write_varint(buffer, position - previous_position)
+            previous_position = position
+
+    return bytes(buffer)
+
+
+def decode_postings(window, data):
+    postings = []
+    count, offset = read_varint(data, 0)
+
+    timestamp = window * WINDOW_MILLISECONDS
+    for _ in range(count):
+        delta, offset = read_varint(data, offset)
+        timestamp += delta
+        message_id = uuid.UUID(bytes=bytes(data[offset : offset + 16]))
+        offset += 16
+
+        position_count, offset = read_varint(data, offset)
+        positions = []
+        position = 0
+        for _ in range(position_count):
+            delta, offset = read_varint(data, offset)
+            position += delta
+            positions.append(position)
+
+        postings.append((timestamp, message_id, positions))
+
+    return postings
+
+
+class SearchIndexBuilder:
+    def __init__(self):
+        # (broadcaster_id, day, window, term) -> [(timestamp, message_id, positions)]
+        self.postings = defaultdict(list)
+        self.message_count = 0
+
+        # Every flush writes a new segment for each term and window it saw, so the segments written
+        # for a window are kept, encoded, until the window closes and they're compacted into one.
+        # (broadcaster_id, day, term, window) -> [(segment_id, postings)]
+        self.written_segments = defaultdict(list)
+        self.latest_window = 0
+
+    def append(self, broadcaster_id, timestamp, message_id, text):
+        positions_by_term = defaultdict(list)
+        for position, token in enumerate(tokenize(text)):
+            positions_by_term[token].append(position)
+
+        day = get_day(timestamp)
+        window = timestamp // WINDOW_MILLISECONDS
+        self.latest_window = max(self.latest_window, window)
+        for term, positions in positions_by_term.items():
+            self.postings[(broadcaster_id, day, window, term)].append(
+                (timestamp, message_id, positions)
+            )
+        self.message_count += 1
+
+    def drain(self):
+        # Returns (broadcaster_id, day, term, window, segment_id, postings) rows. Every row from one
+        # drain shares a segment Id so it never overwrites a segment written by an earlier drain.
+        segment_id = uuid.uuid1()
+        rows = [
+            (
+                broadcaster_id,
+                day,
+                term,
+                window,
+                segment_id,
+                encode_postings(window, sorted(postings)),
+            )
+            for (broadcaster_id, day, window, term), postings in self.postings.items()
+        ]
+
+        self.postings = defaultdict(list)
+        self.message_count = 0
+        return rows
+
+    def track_written(self, rows):
+        # Called with rows from drain once they've been written
+        for broadcaster_id, day, term, window, segment_id, postings in rows:
+            self.written_segments[(broadcaster_id, day, term, window)].append(
+                (segment_id, postings)
+            )
+
+    def compact_closed_windows(self):
+        # A window is closed once a message from two windows later has arrived, which leaves a whole
+        # window for late messages. Returns (broadcaster_id, day, term, window, segment_id, postings,
+        # replaced_segment_ids) for every term of a closed window that was written as more than one
+        # segment, where postings merges the replaced segments into one. Closed windows are forgotten.
+        compacted = []
+        closed = [key for key in self.written_segments if key[3] < self.latest_window - 1]
+        for key in closed:
+            segments = self.written_segments.pop(key)
+            if len(segments) == 1:
+                continue
+
+            broadcaster_id, day, term, window = key
+            # A retried flush can write the same message to two segments, so key by message
+            merged = {}
+            for _, postings in segments:
+                for timestamp, message_id, positions in decode_postings(window, postings):
+                    merged[(timestamp, message_id)] = positions
+
+            compacted.append(
+                (
+                    broadcaster_id,
+                    day,
+                    term,
+                    window,
+                    uuid.uuid1(),
+                    encode_postings(
+                        window,
+                        [
+                            (timestamp, message_id, positions)
+                            for (timestamp, message_id), positions in sorted(merged.items())
+                        ],
+                    ),
+                    [segment_id for segment_id, _ in segments],
+                )
+            )
+        return compacted
+
+
+def phrase_occurs(phrase, postings_by_term, key):
+    # True if the phrase's terms appear at consecutive positions in the message
+    starts = set(postings_by_term[phrase[0]][key])
+    for offset, term in enumerate(phrase[1:], 1):
+        starts &= {position - offset for position in postings_by_term[term][key]}
+        if not starts:
+            return False
+    return True
+
+
+def find_matches(phrases, postings_by_term):
+    # postings_by_term maps each term to {(timestamp, message_id): positions}. Returns the keys of the
+    # messages matching every phrase in timestamp order.
+    terms = sorted(
+        {term for phrase in phrases for term in phrase},
+        key=lambda term: len(postings_by_term.get(term, ())),
+    )
+    if not terms:
+        return []
+
+    # Intersect from the rarest term so the candidate set shrinks as fast as possible
+    candidates = set(postings_by_term.get(terms[0], ()))
+    for term in terms[1:]:
+        candidates.intersection_update(postings_by_term.get(term, ()))
+        if not candidates:
+            return []
+
+    return sorted(
+        key
+        for key in candidates
+        if all(phrase_occurs(phrase, postings_by_term, key) for phrase in phrases)
+    )
@@ -0,0 +1,132 @@
+import json
+import logging
+import uuid
+
+import infrastructure
+from chat_database_profiles import INGEST_PROFILE
+from chat_search_index import SearchIndexBuilder
+from diagnostics import record_startup, start_http_server
+
+
+class ChatSearchIndexer:
+    def __init__(self):
+        database = infrastructure.connect_in_background(
+            infrastructure.connect_chat_database, "chat_data", write_profile=INGEST_PROFILE
+        )
+
+        self.message_queue_connection = infrastructure.connect_message_queue()
+        self.channel = self.message_queue_connection.channel()
+
+        # All chat messages are published to the chat exchange
+        self.chat_exchange = "chat_fanout"
+        self.channel.exchange_declare(self.chat_exchange, exchange_type="fanout")
+
+        self.chat_queue = "chat_search_queue"
+        self.channel.queue_declare(queue=self.chat_queue, durable=True)
+
+        self.channel.queue_bind(exchange=self.chat_exchange, queue=self.chat_queue)
+
+        # Postings are accumulated in memory and written as one segment per term and window. The
+        # longer we buffer the fewer and larger the segments, at the cost of search lagging behind.
+        # Messages aren't acked until the segment holding them has been written. Once a window has
+        # closed, its segments are compacted into one so searches read a segment per term and window.
+        self.index_builder = SearchIndexBuilder()
+        self.pending_compactions = []
+        self.batch_size = 10000
+        self.flush_interval_seconds = 30
+        self.last_delivery_tag = None
+
+        self.database = database.result()
+
+    def __del__(self):
+        self.shutdown()
+
+    def shutdown(self):
+        self.message_queue_connection.close()
+        self.database.close()
+
+    def start_consuming_chats(self):
+        # Allow a full batch of messages to be outstanding since they're only acked once it's written
+        self.channel.basic_qos(prefetch_count=self.batch_size)
+        self.channel.basic_consume(
+            queue=self.chat_queue, on_message_callback=self.handle_chat_message
+        )
+        self.message_queue_connection.call_later(
+            self.flush_interval_seconds, self.flush_on_interval
+        )
+        logging.info("Start consuming chats from queue")
+        self.channel.start_consuming()
+
+    def handle_chat_message(self, ch, method, properties, body):
+        message_fields = json.loads(body.decode())
+
+        self.index_builder.append(
+            message_fields["broadcaster_id"],
+            message_fields["timestamp"],
+            uuid.UUID(message_fields["message_id"]),
+            json.loads(message_fields["message"])["text"],
+        )
+        self.last_delivery_tag = method.delivery_tag
+
+        if self.index_builder.message_count >= self.batch_size:
+            self.flush_postings()
+
+    def flush_on_interval(self):
+        self.flush_postings()
+        self.message_queue_connection.call_later(
+            self.flush_interval_seconds, self.flush_on_interval
+        )
+
+    def flush_postings(self):
+        if self.last_delivery_tag is None:
+            return
+
+        message_count = self.index_builder.message_count
+        rows = self.index_builder.drain()
+        logging.info(f"Writing {len(rows)} search segments for {message_count} messages")
+
+        if self.database.insert_search_postings(rows):
+            self.channel.basic_ack(delivery_tag=self.last_delivery_tag, multiple=True)
+            self.index_builder.track_written(rows)
+        else:
+            # The messages are redelivered and indexed into a new segment. Postings from any segments
+            # that did get written are deduplicated when searching.
+            self.channel.basic_nack(
+                delivery_tag=self.last_delivery_tag, multiple=True, requeue=True
+            )
+        self.last_delivery_tag = None
+
+        self.compact_postings()
+
+    def compact_postings(self):
+        # Compactions that fail are retried with the same segment Ids on the next flush, so a retry
+        # of one that did get written just rewrites it
+        self.pending_compactions.extend(self.index_builder.compact_closed_windows())
+        if not self.pending_compactions:
+            return
+
+        if self.database.compact_search_postings(self.pending_compactions):
+            logging.info(f"Compacted {len(self.pending_compactions)} search segments")
+            self.pending_compactions = []
+        else:
+            logging.error(
+                f"Failed to compact {len(self.pending_compactions)} search segments. Retrying with the next flush"
+            )
+
+
+def main():
+    logging.basicConfig(
+        filemode="w",
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    start_http_server(9900)
+
+    session = ChatSearchIndexer()
+    record_startup("chat_search")
+    session.start_consuming_chats()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Every record is prefixed with its length and a CRC32 of its body so a record that was only partly
+# written before a crash can be detected and ignored when the segment is replayed
+RECORD_HEADER = struct.Struct("<II")
+SEGMENT_SUFFIX = ".spool"
+# Where segments that couldn't be written to the database are moved, relative to the spool directory
+FAILED_DIRECTORY = "failed"
+
+
+# Append-only, segmented write-ahead log of raw chat message bodies. Messages are appended to the
+# open segment and made durable in groups by sync(). Once a segment is sealed it's immutable and can
+# be replayed by a drainer, which removes it after its messages have been written to the database.
+class ChatSpool:
+    def __init__(self, directory, segment_max_records=1000, segment_max_age=5):
+        self.directory = directory
+        self.segment_max_records = segment_max_records
+        self.segment_max_age = segment_max_age
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Segments left over from a previous run are all treated as sealed so they get replayed. The
+        # sequence carries on after the set aside segments too, so their names are never reused.
+        self.failed_directory = os.path.join(self.directory, FAILED_DIRECTORY)
+        existing = self.list_segments() + self.list_segments(self.failed_directory)
+        self.segment_sequence = (
+            max(map(self.get_segment_sequence, existing)) + 1 if existing else 0
+        )
+
+        self.condition = threading.Condition()
+        self.open_segment()
+
+    def close(self):
+        self.segment.flush()
+        os.fsync(self.segment.fileno())
+        self.segment.close()
+
+    def get_segment_path(self, sequence):
+        return os.path.join(self.directory, f"{sequence:020d}{SEGMENT_SUFFIX}")
+
+    def get_segment_sequence(self, path):
+        return int(os.path.basename(path)[: -len(SEGMENT_SUFFIX)])
+
+    def list_segments(self, directory=None):
+        directory = directory or self.directory
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def open_segment(self):
+        self.segment = open(self.get_segment_path(self.segment_sequence), "ab")
+        self.segment_records = 0
+        self.segment_opened_at = time.monotonic()
+
+    def append(self, body):
+        self.segment.write(RECORD_HEADER.pack(len(body), zlib.crc32(body)))
+        self.segment.write(body)
+        self.segment_records += 1
+
+    def sync(self):
+        # Group commit: everything appended since the last sync becomes durable with one fsync
+        self.segment.flush()
+        os.fsync(self.segment.fileno())
+
+    def should_seal(self):
+        return self.segment_records >= self.segment_max_records or (
+            self.segment_records > 0
+            and time.monotonic() - self.segment_opened_at >= self.segment_max_age
+        )
+
+    def seal(self):
+        self.close()
+        with self.condition:
+            self.segment_sequence += 1
+            self.open_segment()
+            self.condition.notify_all()
+
+    def wait_for_sealed_segments(self, timeout=None):
+        # Returns the paths of every sealed segment, oldest first, waiting for one to be sealed if
+        # there currently aren't any
+        with self.condition:
+            sealed = self.list_sealed_segments()
+            if not sealed:
+                self.condition.wait(timeout)
+                sealed = self.list_sealed_segments()
+            return sealed
+
+    def list_sealed_segments(self):
+        return [
+            path
+            for path in self.list_segments()
+            if self.get_segment_sequence(path) < self.segment_sequence
+        ]
+
+    def read_segment(self, path):
+        bodies = []
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return bodies
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                offset = 0
+                while offset + RECORD_HEADER.size <= len(data):
+                    length, checksum = RECORD_HEADER.unpack_from(data, offset)
+                    start = offset + RECORD_HEADER.size
+                    body = data[start : start + length]
+                    if len(body) != length or zlib.crc32(body) != checksum:
+                        logging.warning(
+                            f"Ignoring a torn record at offset {offset} in spool segment {path}"
+                        )
+                        break
+
+                    bodies.append(body)
+                    offset = start + length
+
+        return bodies
+
+    def remove_segment(self, path):
+        os.remove(path)
+
+    def set_aside_segment(self, path):
+        # Moves a segment that can't be written out of the spool so it doesn't hold up the segments
+        # behind it. It keeps its name, so moving it back replays it on the next start.
+        os.makedirs(self.failed_directory, exist_ok=True)
+        os.replace(path, os.path.join(self.failed_directory, os.path.basename(path)))
+
+    def set_aside_records(self, path, bodies):
+        # Writes just the given records of a segment to the failed directory, in the same format, so
+        # they can be replayed like a set aside segment
+        os.makedirs(self.failed_directory, exist_ok=True)
+        failed_path = os.path.join(self.failed_directory, os.path.basename(path))
+        with open(failed_path, "wb") as f:
+            for body in bodies:
+                f.write(RECORD_HEADER.pack(len(body), zlib.crc32(body)))
+                f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
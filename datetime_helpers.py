@@ -1,9 +1,20 @@
-from datetime import datetime
+from datetime import date, datetime
+from functools import lru_cache
+
+MILLISECONDS_PER_DAY = 24 * 60 * 60 * 1000
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+# Chat arrives in timestamp order, so almost every lookup hits one of a handful of recent days
+@lru_cache(maxsize=1024)
+def get_date_of_day(days_since_epoch):
+    return date.fromordinal(EPOCH_ORDINAL + days_since_epoch)
 
 
 def get_month(timestamp):
     # Timestamp is the number of milleseconds since the epoch
-    return int(datetime.utcfromtimestamp(timestamp // 1000).strftime("%Y%m"))
+    day = get_date_of_day(timestamp // MILLISECONDS_PER_DAY)
+    return day.year * 100 + day.month
 
 
 def get_next_month(year_month):
@@ -20,3 +31,9 @@ def get_next_month(year_month):
         next_month = current_date.replace(month=month + 1)
 
     return int(next_month.strftime("%Y%m"))
+
+
+def get_day(timestamp):
+    # Timestamp is the number of milleseconds since the epoch
+    day = get_date_of_day(timestamp // MILLISECONDS_PER_DAY)
+    return day.year * 10000 + day.month * 100 + day.day
@@ -0,0 +1,187 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import psutil
+from prometheus_client import Gauge, make_wsgi_app
+
+# Shared by every service. It serves the Prometheus metrics along with an opt-in sampling profiler on
+# the service's metrics port, and provides a guard for logging on hot paths.
+#
+# Set ENABLE_PROFILER=true to enable GET /debug/profile?seconds=N, which samples every thread's stack
+# for N seconds and returns them as collapsed stacks ready for flamegraph.pl or speedscope. Set
+# CONTINUOUS_PROFILER=true as well to sample from startup, in which case /debug/profile without the
+# seconds parameter returns everything sampled so far.
+#
+# Set HOT_PATH_LOG_GUARD=true to demote the per-message logs to DEBUG. They're then skipped, without
+# ever being formatted, unless DEBUG logging is enabled.
+
+
+class SamplingProfiler:
+    def __init__(self, interval_seconds=0.01):
+        self.interval_seconds = interval_seconds
+        self.stacks = Counter()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            self.sample(self.stacks)
+            time.sleep(self.interval_seconds)
+
+    def sample(self, stacks):
+        current_thread_id = threading.get_ident()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        for thread_id, frame in sys._current_frames().items():
+            # Don't profile the threads doing the profiling
+            if thread_id == current_thread_id or (
+                self.thread is not None and thread_id == self.thread.ident
+            ):
+                continue
+
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                # Use the line the function starts on so samples anywhere in a function are merged
+                frames.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+
+            # Collapsed stacks go from the root to the leaf, separated by semicolons
+            frames.append(thread_names.get(thread_id, str(thread_id)))
+            with self.lock:
+                stacks[";".join(reversed(frames))] += 1
+
+    def profile_for(self, seconds):
+        stacks = Counter()
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            self.sample(stacks)
+            time.sleep(self.interval_seconds)
+        return stacks
+
+    def snapshot(self):
+        with self.lock:
+            return Counter(self.stacks)
+
+
+def format_collapsed_stacks(stacks):
+    return "".join(
+        f"{stack} {count}\n" for stack, count in stacks.most_common()
+    ).encode()
+
+
+profiler = SamplingProfiler()
+
+
+def make_diagnostics_app():
+    metrics_app = make_wsgi_app()
+    profiler_enabled = os.environ.get("ENABLE_PROFILER", "false").lower() == "true"
+    max_profile_seconds = 60
+
+    def diagnostics_app(environ, start_response):
+        if environ.get("PATH_INFO") != "/debug/profile":
+            return metrics_app(environ, start_response)
+
+        if not profiler_enabled:
+            start_response("404 Not Found", [("Content-Type", "text/plain")])
+            return [b"Set ENABLE_PROFILER=true to enable profiling\n"]
+
+        params = parse_qs(environ.get("QUERY_STRING", ""))
+        seconds = params.get("seconds")
+        if seconds is not None:
+            try:
+                seconds = min(float(seconds[0]), max_profile_seconds)
+            except ValueError:
+                start_response("400 Bad Request", [("Content-Type", "text/plain")])
+                return [b"seconds must be a number\n"]
+            stacks = profiler.profile_for(seconds)
+        elif profiler.thread is not None:
+            stacks = profiler.snapshot()
+        else:
+            start_response("400 Bad Request", [("Content-Type", "text/plain")])
+            return [
+                b"Pass the seconds parameter or set CONTINUOUS_PROFILER=true to profile from startup\n"
+            ]
+
+        start_response("200 OK", [("Content-Type", "text/plain; charset=utf-8")])
+        return [format_collapsed_stacks(stacks)]
+
+    return diagnostics_app
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class SilentHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+# Drop-in replacement for prometheus_client.start_http_server that also serves /debug/profile
+def start_http_server(port, addr="0.0.0.0"):
+    if os.environ.get("CONTINUOUS_PROFILER", "false").lower() == "true":
+        profiler.start()
+
+    server = make_server(
+        addr,
+        port,
+        make_diagnostics_app(),
+        ThreadingWSGIServer,
+        handler_class=SilentHandler,
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
+
+
+STARTUP_SECONDS = Gauge(
+    "service_startup_seconds",
+    "Seconds from the process starting to the service being ready to consume",
+    ["service"],
+)
+
+
+# Call once the service has connected to everything and is about to start consuming. The time is
+# measured from when the process was created, so it includes the interpreter starting and imports.
+def record_startup(service):
+    seconds = time.time() - psutil.Process().create_time()
+    STARTUP_SECONDS.labels(service=service).set(seconds)
+    logging.info(f"{service} started in {seconds:.3f} seconds")
+
+
+hot_path_log_level = (
+    logging.DEBUG
+    if os.environ.get("HOT_PATH_LOG_GUARD", "false").lower() == "true"
+    else logging.INFO
+)
+
+
+# Use for logs written for every message. The message is %-formatted by logging, and only if the
+# level is enabled, so pass the values as arguments rather than building an f-string. Values that are
+# expensive to compute can be wrapped in lazy() so they're only computed if the log is written.
+def log_hot_path(message, *args):
+    if logging.root.isEnabledFor(hot_path_log_level):
+        logging.log(hot_path_log_level, message, *args)
+
+
+class lazy:
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        return str(self.func(*self.args))
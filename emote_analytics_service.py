@@ -0,0 +1,214 @@
+import collections
+import concurrent.futures
+import functools
+import json
+import logging
+
+import infrastructure
+from chat_database_profiles import INGEST_PROFILE
+from chat_rollup import MINUTE
+from datetime_helpers import get_day
+from diagnostics import record_startup, start_http_server
+from emote_sketches import DAY, EmoteWindows, SpaceSaving, get_emote_uses
+
+
+class EmoteAnalyzer:
+    def __init__(self):
+        database = infrastructure.connect_in_background(
+            infrastructure.connect_chat_database, "chat_data", write_profile=INGEST_PROFILE
+        )
+
+        self.message_queue_connection = infrastructure.connect_message_queue()
+        self.channel = self.message_queue_connection.channel()
+
+        # All chat messages are published to the chat exchange
+        self.chat_exchange = "chat_fanout"
+        self.channel.exchange_declare(self.chat_exchange, exchange_type="fanout")
+
+        self.chat_queue = "emote_analytics_queue"
+        self.channel.queue_declare(queue=self.chat_queue, durable=True)
+
+        self.channel.queue_bind(exchange=self.chat_exchange, queue=self.chat_queue)
+
+        # Top emotes per broadcaster are tracked per minute and per day. Each window is a fixed size
+        # sketch, so memory doesn't grow with the number of distinct emotes.
+        self.emote_windows = EmoteWindows(capacity=100, minute_retention=10)
+
+        # Sketches are checkpointed on an interval and messages are only acked once the checkpoint
+        # holding them is written. If a checkpoint fails the messages stay unacked and are included
+        # in the next one, so they're never counted twice.
+        self.checkpoint_interval_seconds = 10
+        self.prefetch_count = 20000
+        self.unacked_delivery_tags = collections.deque()
+        self.ttl_by_resolution = {MINUTE: 2 * DAY, DAY: 0}
+
+        # The first time we see a broadcaster on a given day we pick up from their checkpoints, so a
+        # restart doesn't reset the day's counts. Checkpoints are read on the restorer's threads so
+        # the consumer doesn't wait on Cassandra, and the broadcaster's uses are held, unacked, until
+        # the read completes. After max_restore_attempts failed reads the held messages are requeued.
+        self.restored_days = set()
+        # (broadcaster_id, day) -> [(delivery tag, timestamp, uses)]
+        self.held_uses = {}
+        self.held_delivery_tags = set()
+        self.restorer = concurrent.futures.ThreadPoolExecutor(
+            max_workers=8, thread_name_prefix="restore"
+        )
+        self.max_restore_attempts = 5
+        self.min_retry_delay_seconds = 1
+        self.max_retry_delay_seconds = 60
+
+        self.database = database.result()
+
+    def __del__(self):
+        self.shutdown()
+
+    def shutdown(self):
+        self.restorer.shutdown(wait=False)
+        self.message_queue_connection.close()
+        self.database.close()
+
+    def start_consuming_chats(self):
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+        self.channel.basic_consume(
+            queue=self.chat_queue, on_message_callback=self.handle_chat_message
+        )
+        self.message_queue_connection.call_later(
+            self.checkpoint_interval_seconds, self.checkpoint_on_interval
+        )
+        logging.info("Start consuming chats from queue")
+        self.channel.start_consuming()
+
+    def handle_chat_message(self, ch, method, properties, body):
+        self.unacked_delivery_tags.append(method.delivery_tag)
+
+        message_fields = json.loads(body.decode())
+        uses = get_emote_uses(json.loads(message_fields["message"]))
+        if not uses:
+            return
+
+        broadcaster_id = message_fields["broadcaster_id"]
+        timestamp = message_fields["timestamp"]
+        key = (broadcaster_id, get_day(timestamp))
+        if key in self.restored_days:
+            self.emote_windows.add(broadcaster_id, timestamp, uses)
+            return
+
+        held_uses = self.held_uses.get(key)
+        if held_uses is None:
+            held_uses = self.held_uses[key] = []
+            self.start_restore(key, timestamp, 1)
+        held_uses.append((method.delivery_tag, timestamp, uses))
+        self.held_delivery_tags.add(method.delivery_tag)
+
+    def start_restore(self, key, timestamp, attempt):
+        broadcaster_id, day = key
+        day_start = timestamp // (DAY * 1000) * DAY * 1000
+        minute_start = max(
+            day_start, timestamp - self.emote_windows.minute_retention * MINUTE * 1000
+        )
+        ranges = [(day, MINUTE, minute_start, timestamp), (day, DAY, day_start, day_start)]
+
+        future = self.restorer.submit(self.database.get_emote_sketches, broadcaster_id, ranges)
+        # pika connections aren't thread safe, so the result is handled on the connection's thread
+        future.add_done_callback(
+            lambda future: self.message_queue_connection.add_callback_threadsafe(
+                functools.partial(self.finish_restore, key, timestamp, attempt, future)
+            )
+        )
+
+    def finish_restore(self, key, timestamp, attempt, future):
+        broadcaster_id, _ = key
+        success, rows = future.result()
+        if not success:
+            # Starting the day from an empty sketch would overwrite its checkpoint, so the held uses
+            # are never counted without one
+            if attempt < self.max_restore_attempts:
+                retry_delay = min(
+                    self.min_retry_delay_seconds * 2 ** (attempt - 1),
+                    self.max_retry_delay_seconds,
+                )
+                logging.error(
+                    f"There was an error restoring emote sketches for {broadcaster_id}. Retrying in {retry_delay} seconds"
+                )
+                self.message_queue_connection.call_later(
+                    retry_delay,
+                    functools.partial(self.start_restore, key, timestamp, attempt + 1),
+                )
+                return
+
+            held_uses = self.held_uses.pop(key)
+            logging.error(
+                f"Failed to restore emote sketches for {broadcaster_id} after {attempt} attempts. Requeueing {len(held_uses)} messages"
+            )
+            for delivery_tag, _, _ in held_uses:
+                self.channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+                self.held_delivery_tags.discard(delivery_tag)
+                self.unacked_delivery_tags.remove(delivery_tag)
+            return
+
+        for resolution, window_timestamp, sketch in rows:
+            self.emote_windows.restore(
+                (broadcaster_id, resolution, window_timestamp),
+                SpaceSaving.deserialize(sketch),
+            )
+        self.restored_days.add(key)
+
+        held_uses = self.held_uses.pop(key)
+        for delivery_tag, use_timestamp, uses in held_uses:
+            self.emote_windows.add(broadcaster_id, use_timestamp, uses)
+            self.held_delivery_tags.discard(delivery_tag)
+
+        logging.info(
+            f"Restored {len(rows)} emote sketches for {broadcaster_id} and counted {len(held_uses)} held messages"
+        )
+
+    def checkpoint_on_interval(self):
+        self.checkpoint()
+        self.message_queue_connection.call_later(
+            self.checkpoint_interval_seconds, self.checkpoint_on_interval
+        )
+
+    def checkpoint(self):
+        if not self.unacked_delivery_tags:
+            return
+
+        rows = self.emote_windows.drain()
+        if rows and not self.database.insert_emote_sketches(
+            rows, self.ttl_by_resolution
+        ):
+            logging.error(f"Failed to checkpoint {len(rows)} emote sketches")
+            self.emote_windows.mark_dirty(rows)
+            return
+
+        # Held messages haven't been counted yet, so only the messages before the first of them are
+        # acked
+        ack_delivery_tag = None
+        while (
+            self.unacked_delivery_tags
+            and self.unacked_delivery_tags[0] not in self.held_delivery_tags
+        ):
+            ack_delivery_tag = self.unacked_delivery_tags.popleft()
+        if ack_delivery_tag is not None:
+            self.channel.basic_ack(delivery_tag=ack_delivery_tag, multiple=True)
+
+        # Days before yesterday won't be written to again
+        oldest_day = get_day(self.emote_windows.latest_timestamp - DAY * 1000)
+        self.restored_days = {key for key in self.restored_days if key[1] >= oldest_day}
+
+
+def main():
+    logging.basicConfig(
+        filemode="w",
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    start_http_server(10000)
+
+    session = EmoteAnalyzer()
+    record_startup("emote_analytics")
+    session.start_consuming_chats()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+from chat_rollup import MINUTE
+from datetime_helpers import get_day
+from utilities import read_varint, write_varint
+
+DAY = 24 * 60 * 60
+# Windows are identified by their resolution in seconds and the timestamp they start at, in the same
+# way as the chat stats buckets
+EMOTE_RESOLUTIONS = (MINUTE, DAY)
+
+
+# Space-Saving keeps the heaviest hitters of a stream in a fixed number of counters. An untracked item
+# takes over the smallest counter and inherits its count as its error, so every count is an
+# overestimate by at most its error and any item used more than 1/capacity of the time is tracked.
+class SpaceSaving:
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        # item -> [count, error, name]
+        self.counters = {}
+
+    def add(self, item, name, count=1):
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = [count, 0, name]
+        else:
+            # The capacity is small, so a scan for the minimum is cheaper than maintaining a heap
+            minimum_item = min(self.counters, key=lambda key: self.counters[key][0])
+            minimum_count = self.counters.pop(minimum_item)[0]
+            self.counters[item] = [minimum_count + count, minimum_count, name]
+
+    def minimum_count(self):
+        # Any item missing from a full sketch was used at most this many times
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def merge(self, other):
+        # Items missing from one side might have been used up to that side's minimum number of times
+        # without being tracked, so the minimum is added to both their count and their error. This
+        # keeps every count an overestimate by at most its error.
+        own_minimum = self.minimum_count()
+        other_minimum = other.minimum_count()
+
+        merged = {}
+        for item in self.counters.keys() | other.counters.keys():
+            own = self.counters.get(item)
+            theirs = other.counters.get(item)
+            count = (own[0] if own else own_minimum) + (theirs[0] if theirs else other_minimum)
+            error = (own[1] if own else own_minimum) + (theirs[1] if theirs else other_minimum)
+            merged[item] = [count, error, (own or theirs)[2]]
+
+        self.counters = dict(
+            sorted(merged.items(), key=lambda entry: entry[1][0], reverse=True)[: self.capacity]
+        )
+
+    def top(self, limit):
+        # Returns (item, name, count, error) for the most used items
+        return [
+            (item, name, count, error)
+            for item, (count, error, name) in sorted(
+                self.counters.items(), key=lambda entry: entry[1][0], reverse=True
+            )[:limit]
+        ]
+
+    def serialize(self):
+        buffer = bytearray()
+        write_varint(buffer, self.capacity)
+        write_varint(buffer, len(self.counters))
+        for item, (count, error, name) in self.counters.items():
+            for text in (item, name):
+                encoded = text.encode()
+                write_varint(buffer, len(encoded))
+                buffer += encoded
+            write_varint(buffer, count)
+            write_varint(buffer, error)
+        return bytes(buffer)
+
+    @classmethod
+    def deserialize(cls, data):
+        capacity, offset = read_varint(data, 0)
+        sketch = cls(capacity)
+
+        length, offset = read_varint(data, offset)
+        for _ in range(length):
+            texts = []
+            for _ in range(2):
+                size, offset = read_varint(data, offset)
+                texts.append(bytes(data[offset : offset + size]).decode())
+                offset += size
+            count, offset = read_varint(data, offset)
+            error, offset = read_varint(data, offset)
+            sketch.counters[texts[0]] = [count, error, texts[1]]
+
+        return sketch
+
+
+def get_emote_uses(message):
+    # message is the deserialized output of twitch_proxy.serialize_message. Returns (emote_id, name,
+    # count) for each emote in the message, where the name is the text the emote replaced.
+    emotes = message["emotes"]
+    if not emotes:
+        return []
+
+    text = message["text"]
+    uses = []
+    for emote_id, positions in emotes.items():
+        first = positions[0]
+        name = text[int(first["start_position"]) : int(first["end_position"]) + 1]
+        uses.append((emote_id, name, len(positions)))
+    return uses
+
+
+class EmoteWindows:
+    def __init__(self, capacity=100, minute_retention=10):
+        self.capacity = capacity
+        # Minute windows older than this are dropped from memory. They stay checkpointed.
+        self.minute_retention = minute_retention
+
+        # (broadcaster_id, resolution, window timestamp in milliseconds) -> SpaceSaving
+        self.windows = {}
+        self.dirty_windows = set()
+        self.latest_timestamp = 0
+
+    def get_window_keys(self, broadcaster_id, timestamp):
+        for resolution in EMOTE_RESOLUTIONS:
+            size = resolution * 1000
+            yield broadcaster_id, resolution, timestamp // size * size
+
+    def restore(self, key, sketch):
+        # Checkpointed sketches are restored before any new uses are added to the window
+        self.windows.setdefault(key, sketch)
+
+    def add(self, broadcaster_id, timestamp, uses):
+        for key in self.get_window_keys(broadcaster_id, timestamp):
+            sketch = self.windows.get(key)
+            if sketch is None:
+                sketch = self.windows[key] = SpaceSaving(self.capacity)
+
+            for emote_id, name, count in uses:
+                sketch.add(emote_id, name, count)
+            self.dirty_windows.add(key)
+
+        self.latest_timestamp = max(self.latest_timestamp, timestamp)
+
+    def drain(self):
+        # Returns (broadcaster_id, day, resolution, timestamp, sketch) for every window that changed
+        # since the last drain
+        rows = []
+        for key in self.dirty_windows:
+            broadcaster_id, resolution, timestamp = key
+            rows.append(
+                (
+                    broadcaster_id,
+                    get_day(timestamp),
+                    resolution,
+                    timestamp,
+                    self.windows[key].serialize(),
+                )
+            )
+
+        # Memory stays bounded by the number of live broadcasters, since each keeps at most
+        # minute_retention minute windows and the current day's window, each with a fixed capacity.
+        # Windows still waiting to be checkpointed are kept in case the checkpoint fails.
+        minute_cutoff = self.latest_timestamp - self.minute_retention * MINUTE * 1000
+        day_cutoff = self.latest_timestamp - DAY * 1000
+        self.windows = {
+            key: sketch
+            for key, sketch in self.windows.items()
+            if key in self.dirty_windows
+            or key[2] >= (minute_cutoff if key[1] == MINUTE else day_cutoff)
+        }
+        self.dirty_windows = set()
+
+        return rows
+
+    def mark_dirty(self, rows):
+        # Called with rows from drain that failed to be checkpointed so they're included in the next one
+        for broadcaster_id, _, resolution, timestamp, _ in rows:
+            self.dirty_windows.add((broadcaster_id, resolution, timestamp))
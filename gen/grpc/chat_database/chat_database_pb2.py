@@ -14,7 +14,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n*gen/grpc/chat_database/chat_database.proto\x12\x0c\x63hatdatabase\"V\n\x04\x43hat\x12\x16\n\x0e\x62roadcaster_id\x18\x01 \x01(\r\x12\x11\n\ttimestamp\x18\x02 \x01(\x04\x12\x12\n\nmessage_id\x18\x03 \x01(\t\x12\x0f\n\x07message\x18\x04 \x01(\t\"T\n\x0fGetChatsRequest\x12\x16\n\x0e\x62roadcaster_id\x18\x01 \x01(\r\x12\r\n\x05start\x18\x02 \x01(\x04\x12\x0b\n\x03\x65nd\x18\x03 \x01(\x04\x12\r\n\x05limit\x18\x04 \x01(\r\"5\n\x10GetChatsResponse\x12!\n\x05\x63hats\x18\x01 \x03(\x0b\x32\x12.chatdatabase.Chat\"T\n\x04\x43lip\x12\x11\n\ttimestamp\x18\x01 \x01(\x04\x12\x0f\n\x07\x63lip_id\x18\x02 \x01(\t\x12\x11\n\tembed_url\x18\x03 \x01(\t\x12\x15\n\rthumbnail_url\x18\x04 \x01(\t\"-\n\x0fGetClipsRequest\x12\r\n\x05start\x18\x01 \x01(\x04\x12\x0b\n\x03\x65nd\x18\x02 \x01(\x04\"5\n\x10GetClipsResponse\x12!\n\x05\x63lips\x18\x01 \x03(\x0b\x32\x12.chatdatabase.Clip2\xa8\x01\n\x0c\x43hatDatabase\x12K\n\x08GetChats\x12\x1d.chatdatabase.GetChatsRequest\x1a\x1e.chatdatabase.GetChatsResponse\"\x00\x12K\n\x08GetClips\x12\x1d.chatdatabase.GetClipsRequest\x1a\x1e.chatdatabase.GetClipsResponse\"\x00\x42=\n twitchchatingestor.chat.databaseB\x11\x43hatDatabaseProtoP\x01\xa2\x02\x03\x63\x64\x62\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n*gen/grpc/chat_database/chat_database.proto\x12\x0c\x63hatdatabase\"V\n\x04\x43hat\x12\x16\n\x0e\x62roadcaster_id\x18\x01 \x01(\r\x12\x11\n\ttimestamp\x18\x02 \x01(\x04\x12\x12\n\nmessage_id\x18\x03 \x01(\t\x12\x0f\n\x07message\x18\x04 \x01(\t\"T\n\x0fGetChatsRequest\x12\x16\n\x0e\x62roadcaster_id\x18\x01 \x01(\r\x12\r\n\x05start\x18\x02 \x01(\x04\x12\x0b\n\x03\x65nd\x18\x03 \x01(\x04\x12\r\n\x05limit\x18\x04 \x01(\r\"5\n\x10GetChatsResponse\x12!\n\x05\x63hats\x18\x01 \x03(\x0b\x32\x12.chatdatabase.Chat\"T\n\x04\x43lip\x12\x11\n\ttimestamp\x18\x01 \x01(\x04\x12\x0f\n\x07\x63lip_id\x18\x02 \x01(\t\x12\x11\n\tembed_url\x18\x03 \x01(\t\x12\x15\n\rthumbnail_url\x18\x04 \x01(\t\"-\n\x0fGetClipsRequest\x12\r\n\x05start\x18\x01 \x01(\x04\x12\x0b\n\x03\x65nd\x18\x02 \x01(\x04\"5\n\x10GetClipsResponse\x12!\n\x05\x63lips\x18\x01 \x03(\x0b\x32\x12.chatdatabase.Clip\"q\n\tChatStats\x12\x11\n\ttimestamp\x18\x01 \x01(\x04\x12\x15\n\rmessage_count\x18\x02 \x01(\x04\x12\x17\n\x0funique_chatters\x18\x03 \x01(\x04\x12\x0c\n\x04\x62its\x18\x04 \x01(\x04\x12\x13\n\x0b\x65mote_count\x18\x05 \x01(\x04\"N\n\x13GetChatStatsRequest\x12\x16\n\x0e\x62roadcaster_id\x18\x01 \x01(\r\x12\x0b\n\x03\x64\x61y\x18\x02 \x01(\r\x12\x12\n\nresolution\x18\x03 \x01(\r\">\n\x14GetChatStatsResponse\x12&\n\x05stats\x18\x01 \x03(\x0b\x32\x17.chatdatabase.ChatStats\"f\n\x12SearchChatsRequest\x12\x16\n\x0e\x62roadcaster_id\x18\x01 \x01(\r\x12\r\n\x05query\x18\x02 \x01(\t\x12\r\n\x05start\x18\x03 \x01(\x04\x12\x0b\n\x03\x65nd\x18\x04 \x01(\x04\x12\r\n\x05limit\x18\x05 \x01(\r\"8\n\x13SearchChatsResponse\x12!\n\x05\x63hats\x18\x01 \x03(\x0b\x32\x12.chatdatabase.Chat\"k\n\x15GetChatsByUserRequest\x12\x16\n\x0e\x62roadcaster_id\x18\x01 \x01(\r\x12\x0f\n\x07user_id\x18\x02 \x01(\x04\x12\r\n\x05start\x18\x03 \x01(\x04\x12\x0b\n\x03\x65nd\x18\x04 \x01(\x04\x12\r\n\x05limit\x18\x05 \x01(\r\";\n\x16GetChatsByUserResponse\x12!\n\x05\x63hats\x18\x01 \x03(\x0b\x32\x12.chatdatabase.Chat\"f\n\x10GetThreadRequest\x12\x16\n\x0e\x62roadcaster_id\x18\x01 \x01(\r\x12\x11\n\tthread_id\x18\x02 \x01(\t\x12\x18\n\x10thread_timestamp\x18\x03 \x01(\x04\x12\r\n\x05limit\x18\x04 \x01(\r\"6\n\x11GetThreadResponse\x12!\n\x05\x63hats\x18\x01 \x03(\x0b\x32\x12.chatdatabase.Chat\"J\n\nEmoteCount\x12\x10\n\x08\x65mote_id\x18\x01 \x01(\t\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\r\n\x05\x63ount\x18\x03 \x01(\x04\x12\r\n\x05\x65rror\x18\x04 \x01(\x04\"X\n\x13GetTopEmotesRequest\x12\x16\n\x0e\x62roadcaster_id\x18\x01 \x01(\r\x12\r\n\x05start\x18\x02 \x01(\x04\x12\x0b\n\x03\x65nd\x18\x03 \x01(\x04\x12\r\n\x05limit\x18\x04 \x01(\r\"@\n\x14GetTopEmotesResponse\x12(\n\x06\x65motes\x18\x01 \x03(\x0b\x32\x18.chatdatabase.EmoteCount\"N\n\x18GetUniqueChattersRequest\x12\x16\n\x0e\x62roadcaster_id\x18\x01 \x01(\r\x12\r\n\x05start\x18\x02 \x01(\x04\x12\x0b\n\x03\x65nd\x18\x03 \x01(\x04\"L\n\x19GetUniqueChattersResponse\x12\x17\n\x0funique_chatters\x18\x01 \x01(\x04\x12\x16\n\x0erelative_error\x18\x02 \x01(\x01\x32\xc7\x05\n\x0c\x43hatDatabase\x12K\n\x08GetChats\x12\x1d.chatdatabase.GetChatsRequest\x1a\x1e.chatdatabase.GetChatsResponse\"\x00\x12K\n\x08GetClips\x12\x1d.chatdatabase.GetClipsRequest\x1a\x1e.chatdatabase.GetClipsResponse\"\x00\x12W\n\x0cGetChatStats\x12!.chatdatabase.GetChatStatsRequest\x1a\".chatdatabase.GetChatStatsResponse\"\x00\x12T\n\x0bSearchChats\x12 .chatdatabase.SearchChatsRequest\x1a!.chatdatabase.SearchChatsResponse\"\x00\x12]\n\x0eGetChatsByUser\x12#.chatdatabase.GetChatsByUserRequest\x1a$.chatdatabase.GetChatsByUserResponse\"\x00\x12N\n\tGetThread\x12\x1e.chatdatabase.GetThreadRequest\x1a\x1f.chatdatabase.GetThreadResponse\"\x00\x12W\n\x0cGetTopEmotes\x12!.chatdatabase.GetTopEmotesRequest\x1a\".chatdatabase.GetTopEmotesResponse\"\x00\x12\x66\n\x11GetUniqueChatters\x12&.chatdatabase.GetUniqueChattersRequest\x1a\'.chatdatabase.GetUniqueChattersResponse\"\x00\x42=\n twitchchatingestor.chat.databaseB\x11\x43hatDatabaseProtoP\x01\xa2\x02\x03\x63\x64\x62\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -34,6 +34,34 @@ if _descriptor._USE_C_DESCRIPTORS == False:
   _globals['_GETCLIPSREQUEST']._serialized_end=420
   _globals['_GETCLIPSRESPONSE']._serialized_start=422
   _globals['_GETCLIPSRESPONSE']._serialized_end=475
-  _globals['_CHATDATABASE']._serialized_start=478
-  _globals['_CHATDATABASE']._serialized_end=646
+  _globals['_CHATSTATS']._serialized_start=477
+  _globals['_CHATSTATS']._serialized_end=590
+  _globals['_GETCHATSTATSREQUEST']._serialized_start=592
+  _globals['_GETCHATSTATSREQUEST']._serialized_end=670
+  _globals['_GETCHATSTATSRESPONSE']._serialized_start=672
+  _globals['_GETCHATSTATSRESPONSE']._serialized_end=734
+  _globals['_SEARCHCHATSREQUEST']._serialized_start=736
+  _globals['_SEARCHCHATSREQUEST']._serialized_end=838
+  _globals['_SEARCHCHATSRESPONSE']._serialized_start=840
+  _globals['_SEARCHCHATSRESPONSE']._serialized_end=896
+  _globals['_GETCHATSBYUSERREQUEST']._serialized_start=898
+  _globals['_GETCHATSBYUSERREQUEST']._serialized_end=1005
+  _globals['_GETCHATSBYUSERRESPONSE']._serialized_start=1007
+  _globals['_GETCHATSBYUSERRESPONSE']._serialized_end=1066
+  _globals['_GETTHREADREQUEST']._serialized_start=1068
+  _globals['_GETTHREADREQUEST']._serialized_end=1170
+  _globals['_GETTHREADRESPONSE']._serialized_start=1172
+  _globals['_GETTHREADRESPONSE']._serialized_end=1226
+  _globals['_EMOTECOUNT']._serialized_start=1228
+  _globals['_EMOTECOUNT']._serialized_end=1302
+  _globals['_GETTOPEMOTESREQUEST']._serialized_start=1304
+  _globals['_GETTOPEMOTESREQUEST']._serialized_end=1392
+  _globals['_GETTOPEMOTESRESPONSE']._serialized_start=1394
+  _globals['_GETTOPEMOTESRESPONSE']._serialized_end=1458
+  _globals['_GETUNIQUECHATTERSREQUEST']._serialized_start=1460
+  _globals['_GETUNIQUECHATTERSREQUEST']._serialized_end=1538
+  _globals['_GETUNIQUECHATTERSRESPONSE']._serialized_start=1540
+  _globals['_GETUNIQUECHATTERSRESPONSE']._serialized_end=1616
+  _globals['_CHATDATABASE']._serialized_start=1619
+  _globals['_CHATDATABASE']._serialized_end=2330
 # @@protoc_insertion_point(module_scope)
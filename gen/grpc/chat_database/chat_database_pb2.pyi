@@ -60,3 +60,139 @@ class GetClipsResponse(_message.Message):
     CLIPS_FIELD_NUMBER: _ClassVar[int]
     clips: _containers.RepeatedCompositeFieldContainer[Clip]
     def __init__(self, clips: _Optional[_Iterable[_Union[Clip, _Mapping]]] = ...) -> None: ...
+
+class ChatStats(_message.Message):
+    __slots__ = ("timestamp", "message_count", "unique_chatters", "bits", "emote_count")
+    TIMESTAMP_FIELD_NUMBER: _ClassVar[int]
+    MESSAGE_COUNT_FIELD_NUMBER: _ClassVar[int]
+    UNIQUE_CHATTERS_FIELD_NUMBER: _ClassVar[int]
+    BITS_FIELD_NUMBER: _ClassVar[int]
+    EMOTE_COUNT_FIELD_NUMBER: _ClassVar[int]
+    timestamp: int
+    message_count: int
+    unique_chatters: int
+    bits: int
+    emote_count: int
+    def __init__(self, timestamp: _Optional[int] = ..., message_count: _Optional[int] = ..., unique_chatters: _Optional[int] = ..., bits: _Optional[int] = ..., emote_count: _Optional[int] = ...) -> None: ...
+
+class GetChatStatsRequest(_message.Message):
+    __slots__ = ("broadcaster_id", "day", "resolution")
+    BROADCASTER_ID_FIELD_NUMBER: _ClassVar[int]
+    DAY_FIELD_NUMBER: _ClassVar[int]
+    RESOLUTION_FIELD_NUMBER: _ClassVar[int]
+    broadcaster_id: int
+    day: int
+    resolution: int
+    def __init__(self, broadcaster_id: _Optional[int] = ..., day: _Optional[int] = ..., resolution: _Optional[int] = ...) -> None: ...
+
+class GetChatStatsResponse(_message.Message):
+    __slots__ = ("stats",)
+    STATS_FIELD_NUMBER: _ClassVar[int]
+    stats: _containers.RepeatedCompositeFieldContainer[ChatStats]
+    def __init__(self, stats: _Optional[_Iterable[_Union[ChatStats, _Mapping]]] = ...) -> None: ...
+
+class SearchChatsRequest(_message.Message):
+    __slots__ = ("broadcaster_id", "query", "start", "end", "limit")
+    BROADCASTER_ID_FIELD_NUMBER: _ClassVar[int]
+    QUERY_FIELD_NUMBER: _ClassVar[int]
+    START_FIELD_NUMBER: _ClassVar[int]
+    END_FIELD_NUMBER: _ClassVar[int]
+    LIMIT_FIELD_NUMBER: _ClassVar[int]
+    broadcaster_id: int
+    query: str
+    start: int
+    end: int
+    limit: int
+    def __init__(self, broadcaster_id: _Optional[int] = ..., query: _Optional[str] = ..., start: _Optional[int] = ..., end: _Optional[int] = ..., limit: _Optional[int] = ...) -> None: ...
+
+class SearchChatsResponse(_message.Message):
+    __slots__ = ("chats",)
+    CHATS_FIELD_NUMBER: _ClassVar[int]
+    chats: _containers.RepeatedCompositeFieldContainer[Chat]
+    def __init__(self, chats: _Optional[_Iterable[_Union[Chat, _Mapping]]] = ...) -> None: ...
+
+class GetChatsByUserRequest(_message.Message):
+    __slots__ = ("broadcaster_id", "user_id", "start", "end", "limit")
+    BROADCASTER_ID_FIELD_NUMBER: _ClassVar[int]
+    USER_ID_FIELD_NUMBER: _ClassVar[int]
+    START_FIELD_NUMBER: _ClassVar[int]
+    END_FIELD_NUMBER: _ClassVar[int]
+    LIMIT_FIELD_NUMBER: _ClassVar[int]
+    broadcaster_id: int
+    user_id: int
+    start: int
+    end: int
+    limit: int
+    def __init__(self, broadcaster_id: _Optional[int] = ..., user_id: _Optional[int] = ..., start: _Optional[int] = ..., end: _Optional[int] = ..., limit: _Optional[int] = ...) -> None: ...
+
+class GetChatsByUserResponse(_message.Message):
+    __slots__ = ("chats",)
+    CHATS_FIELD_NUMBER: _ClassVar[int]
+    chats: _containers.RepeatedCompositeFieldContainer[Chat]
+    def __init__(self, chats: _Optional[_Iterable[_Union[Chat, _Mapping]]] = ...) -> None: ...
+
+class GetThreadRequest(_message.Message):
+    __slots__ = ("broadcaster_id", "thread_id", "thread_timestamp", "limit")
+    BROADCASTER_ID_FIELD_NUMBER: _ClassVar[int]
+    THREAD_ID_FIELD_NUMBER: _ClassVar[int]
+    THREAD_TIMESTAMP_FIELD_NUMBER: _ClassVar[int]
+    LIMIT_FIELD_NUMBER: _ClassVar[int]
+    broadcaster_id: int
+    thread_id: str
+    thread_timestamp: int
+    limit: int
+    def __init__(self, broadcaster_id: _Optional[int] = ..., thread_id: _Optional[str] = ..., thread_timestamp: _Optional[int] = ..., limit: _Optional[int] = ...) -> None: ...
+
+class GetThreadResponse(_message.Message):
+    __slots__ = ("chats",)
+    CHATS_FIELD_NUMBER: _ClassVar[int]
+    chats: _containers.RepeatedCompositeFieldContainer[Chat]
+    def __init__(self, chats: _Optional[_Iterable[_Union[Chat, _Mapping]]] = ...) -> None: ...
+
+class EmoteCount(_message.Message):
+    __slots__ = ("emote_id", "name", "count", "error")
+    EMOTE_ID_FIELD_NUMBER: _ClassVar[int]
+    NAME_FIELD_NUMBER: _ClassVar[int]
+    COUNT_FIELD_NUMBER: _ClassVar[int]
+    ERROR_FIELD_NUMBER: _ClassVar[int]
+    emote_id: str
+    name: str
+    count: int
+    error: int
+    def __init__(self, emote_id: _Optional[str] = ..., name: _Optional[str] = ..., count: _Optional[int] = ..., error: _Optional[int] = ...) -> None: ...
+
+class GetTopEmotesRequest(_message.Message):
+    __slots__ = ("broadcaster_id", "start", "end", "limit")
+    BROADCASTER_ID_FIELD_NUMBER: _ClassVar[int]
+    START_FIELD_NUMBER: _ClassVar[int]
+    END_FIELD_NUMBER: _ClassVar[int]
+    LIMIT_FIELD_NUMBER: _ClassVar[int]
+    broadcaster_id: int
+    start: int
+    end: int
+    limit: int
+    def __init__(self, broadcaster_id: _Optional[int] = ..., start: _Optional[int] = ..., end: _Optional[int] = ..., limit: _Optional[int] = ...) -> None: ...
+
+class GetTopEmotesResponse(_message.Message):
+    __slots__ = ("emotes",)
+    EMOTES_FIELD_NUMBER: _ClassVar[int]
+    emotes: _containers.RepeatedCompositeFieldContainer[EmoteCount]
+    def __init__(self, emotes: _Optional[_Iterable[_Union[EmoteCount, _Mapping]]] = ...) -> None: ...
+
+class GetUniqueChattersRequest(_message.Message):
+    __slots__ = ("broadcaster_id", "start", "end")
+    BROADCASTER_ID_FIELD_NUMBER: _ClassVar[int]
+    START_FIELD_NUMBER: _ClassVar[int]
+    END_FIELD_NUMBER: _ClassVar[int]
+    broadcaster_id: int
+    start: int
+    end: int
+    def __init__(self, broadcaster_id: _Optional[int] = ..., start: _Optional[int] = ..., end: _Optional[int] = ...) -> None: ...
+
+class GetUniqueChattersResponse(_message.Message):
+    __slots__ = ("unique_chatters", "relative_error")
+    UNIQUE_CHATTERS_FIELD_NUMBER: _ClassVar[int]
+    RELATIVE_ERROR_FIELD_NUMBER: _ClassVar[int]
+    unique_chatters: int
+    relative_error: float
+    def __init__(self, unique_chatters: _Optional[int] = ..., relative_error: _Optional[float] = ...) -> None: ...
@@ -24,6 +24,36 @@ class ChatDatabaseStub(object):
                 request_serializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetClipsRequest.SerializeToString,
                 response_deserializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetClipsResponse.FromString,
                 )
+        self.GetChatStats = channel.unary_unary(
+                '/chatdatabase.ChatDatabase/GetChatStats',
+                request_serializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetChatStatsRequest.SerializeToString,
+                response_deserializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetChatStatsResponse.FromString,
+                )
+        self.SearchChats = channel.unary_unary(
+                '/chatdatabase.ChatDatabase/SearchChats',
+                request_serializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.SearchChatsRequest.SerializeToString,
+                response_deserializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.SearchChatsResponse.FromString,
+                )
+        self.GetChatsByUser = channel.unary_unary(
+                '/chatdatabase.ChatDatabase/GetChatsByUser',
+                request_serializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetChatsByUserRequest.SerializeToString,
+                response_deserializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetChatsByUserResponse.FromString,
+                )
+        self.GetThread = channel.unary_unary(
+                '/chatdatabase.ChatDatabase/GetThread',
+                request_serializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetThreadRequest.SerializeToString,
+                response_deserializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetThreadResponse.FromString,
+                )
+        self.GetTopEmotes = channel.unary_unary(
+                '/chatdatabase.ChatDatabase/GetTopEmotes',
+                request_serializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetTopEmotesRequest.SerializeToString,
+                response_deserializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetTopEmotesResponse.FromString,
+                )
+        self.GetUniqueChatters = channel.unary_unary(
+                '/chatdatabase.ChatDatabase/GetUniqueChatters',
+                request_serializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetUniqueChattersRequest.SerializeToString,
+                response_deserializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetUniqueChattersResponse.FromString,
+                )
 
 
 class ChatDatabaseServicer(object):
@@ -41,6 +71,42 @@ class ChatDatabaseServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GetChatStats(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SearchChats(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetChatsByUser(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetThread(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetTopEmotes(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetUniqueChatters(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_ChatDatabaseServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -54,6 +120,36 @@ def add_ChatDatabaseServicer_to_server(servicer, server):
                     request_deserializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetClipsRequest.FromString,
                     response_serializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetClipsResponse.SerializeToString,
             ),
+            'GetChatStats': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetChatStats,
+                    request_deserializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetChatStatsRequest.FromString,
+                    response_serializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetChatStatsResponse.SerializeToString,
+            ),
+            'SearchChats': grpc.unary_unary_rpc_method_handler(
+                    servicer.SearchChats,
+                    request_deserializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.SearchChatsRequest.FromString,
+                    response_serializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.SearchChatsResponse.SerializeToString,
+            ),
+            'GetChatsByUser': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetChatsByUser,
+                    request_deserializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetChatsByUserRequest.FromString,
+                    response_serializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetChatsByUserResponse.SerializeToString,
+            ),
+            'GetThread': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetThread,
+                    request_deserializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetThreadRequest.FromString,
+                    response_serializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetThreadResponse.SerializeToString,
+            ),
+            'GetTopEmotes': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetTopEmotes,
+                    request_deserializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetTopEmotesRequest.FromString,
+                    response_serializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetTopEmotesResponse.SerializeToString,
+            ),
+            'GetUniqueChatters': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetUniqueChatters,
+                    request_deserializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetUniqueChattersRequest.FromString,
+                    response_serializer=gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetUniqueChattersResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'chatdatabase.ChatDatabase', rpc_method_handlers)
@@ -97,3 +193,105 @@ class ChatDatabase(object):
             gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetClipsResponse.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetChatStats(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/chatdatabase.ChatDatabase/GetChatStats',
+            gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetChatStatsRequest.SerializeToString,
+            gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetChatStatsResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def SearchChats(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/chatdatabase.ChatDatabase/SearchChats',
+            gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.SearchChatsRequest.SerializeToString,
+            gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.SearchChatsResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetChatsByUser(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/chatdatabase.ChatDatabase/GetChatsByUser',
+            gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetChatsByUserRequest.SerializeToString,
+            gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetChatsByUserResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetThread(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/chatdatabase.ChatDatabase/GetThread',
+            gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetThreadRequest.SerializeToString,
+            gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetThreadResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetTopEmotes(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/chatdatabase.ChatDatabase/GetTopEmotes',
+            gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetTopEmotesRequest.SerializeToString,
+            gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetTopEmotesResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetUniqueChatters(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/chatdatabase.ChatDatabase/GetUniqueChatters',
+            gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetUniqueChattersRequest.SerializeToString,
+            gen_dot_grpc_dot_chat__database_dot_chat__database__pb2.GetUniqueChattersResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
@@ -0,0 +1,158 @@
+import math
+from hashlib import blake2b
+
+from utilities import read_varint, write_varint
+
+# Serialized sketches start with their format and precision
+DENSE_FORMAT = 0
+SPARSE_FORMAT = 1
+
+INVERSE_POWERS_OF_TWO = [2.0**-rank for rank in range(65)]
+
+
+def hash_value(value):
+    # 64 bit hash, so every sketch agrees on which register a value lands in
+    return int.from_bytes(blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+
+def precision_for_error(error_rate):
+    # The standard error of a sketch with 2^precision registers is 1.04 / sqrt(2^precision)
+    return min(max(math.ceil(math.log2((1.04 / error_rate) ** 2)), 4), 18)
+
+
+# Estimates the number of distinct values added to it using one small register per bucket of hash
+# space. Sketches with the same precision merge by taking the larger of each register, so a count over
+# any range can be built from the sketches of the buckets in it.
+#
+# Small sketches keep only their non-zero registers in a dict. Most minute buckets see a handful of
+# chatters, so this keeps them far smaller than the 2^precision bytes of a dense sketch.
+class HyperLogLog:
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.register_count = 1 << precision
+        self.sparse_registers = {}
+        self.registers = None
+
+    def relative_error(self):
+        return 1.04 / math.sqrt(self.register_count)
+
+    def add(self, value):
+        self.add_hash(hash_value(value))
+
+    def add_hash(self, value_hash):
+        remaining_bits = 64 - self.precision
+        index = value_hash >> remaining_bits
+        # Position of the first 1 bit in what's left of the hash
+        rank = remaining_bits - (value_hash & ((1 << remaining_bits) - 1)).bit_length() + 1
+        self.set_register(index, rank)
+
+    def set_register(self, index, rank):
+        if self.registers is not None:
+            if rank > self.registers[index]:
+                self.registers[index] = rank
+        elif rank > self.sparse_registers.get(index, 0):
+            self.sparse_registers[index] = rank
+            # A dict entry costs far more than a byte, so switch once a fraction of registers are set
+            if len(self.sparse_registers) > self.register_count // 16:
+                self.densify()
+
+    def densify(self):
+        self.registers = bytearray(self.register_count)
+        for index, rank in self.sparse_registers.items():
+            self.registers[index] = rank
+        self.sparse_registers = {}
+
+    def items(self):
+        # Yields (index, rank) for every non-zero register
+        if self.registers is None:
+            yield from self.sparse_registers.items()
+        else:
+            for index, rank in enumerate(self.registers):
+                if rank:
+                    yield index, rank
+
+    def reduce(self, precision):
+        # Returns a copy with fewer registers, so sketches written with different error rates can
+        # still be merged. Folding an index's dropped low bits back into the hash recovers the rank
+        # the value would have had at the lower precision.
+        dropped_bits = self.precision - precision
+        reduced = HyperLogLog(precision)
+        for index, rank in self.items():
+            low_bits = index & ((1 << dropped_bits) - 1)
+            if low_bits:
+                rank = dropped_bits - low_bits.bit_length() + 1
+            else:
+                rank += dropped_bits
+            reduced.set_register(index >> dropped_bits, rank)
+        return reduced
+
+    def merge(self, other):
+        if other.precision > self.precision:
+            other = other.reduce(self.precision)
+        elif other.precision < self.precision:
+            reduced = self.reduce(other.precision)
+            self.__dict__.update(reduced.__dict__)
+
+        if other.registers is not None:
+            if self.registers is None:
+                self.densify()
+            self.registers = bytearray(map(max, self.registers, other.registers))
+        else:
+            for index, rank in other.items():
+                self.set_register(index, rank)
+
+    def estimate(self):
+        m = self.register_count
+        if self.registers is None:
+            zeros = m - len(self.sparse_registers)
+            total = zeros + sum(
+                INVERSE_POWERS_OF_TWO[rank] for rank in self.sparse_registers.values()
+            )
+        else:
+            zeros = self.registers.count(0)
+            total = sum(map(INVERSE_POWERS_OF_TWO.__getitem__, self.registers))
+
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / total
+
+        # Linear counting is more accurate while many registers are still empty
+        if estimate <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return estimate
+
+    def serialize(self):
+        # Sparse sketches are stored as varint deltas between register indexes followed by the rank,
+        # dense ones as a byte per register, whichever is smaller
+        nonzero = sorted(self.items())
+        if len(nonzero) * 3 < self.register_count:
+            buffer = bytearray([SPARSE_FORMAT, self.precision])
+            write_varint(buffer, len(nonzero))
+            previous_index = 0
+            for index, rank in nonzero:
+                write_varint(buffer, index - previous_index)
+                buffer.append(rank)
+                previous_index = index
+            return bytes(buffer)
+
+        if self.registers is None:
+            self.densify()
+        return bytes([DENSE_FORMAT, self.precision]) + bytes(self.registers)
+
+    @classmethod
+    def deserialize(cls, data):
+        sketch = cls(data[1])
+        if data[0] == DENSE_FORMAT:
+            sketch.registers = bytearray(data[2:])
+            return sketch
+
+        count, offset = read_varint(data, 2)
+        index = 0
+        for _ in range(count):
+            delta, offset = read_varint(data, offset)
+            index += delta
+            sketch.sparse_registers[index] = data[offset]
+            offset += 1
+
+        if count > sketch.register_count // 16:
+            sketch.densify()
+        return sketch
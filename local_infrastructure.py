@@ -0,0 +1,961 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import defaultdict, deque
+from types import SimpleNamespace
+
+
+# In-process stand-ins for RabbitMQ, Redis and the chat database, so the whole pipeline can run in one
+# process on a laptop for development and for integration and load tests. Services get them through
+# infrastructure.py when LOCAL_INFRASTRUCTURE=true. Each implements only the part of the client's API
+# that the services use, with the same return values.
+
+
+class LocalQueue:
+    def __init__(self, name, single_active_consumer=False):
+        self.name = name
+        self.single_active_consumer = single_active_consumer
+        self.messages = deque()
+        self.consumers = []
+        self.next_consumer = 0
+
+
+# Routes messages between exchanges and queues the way RabbitMQ does for the exchange types the
+# services declare. Queues hold messages until a consumer with room under its prefetch count takes
+# them, and a consumer's unacked messages go back on the queue when its channel closes.
+class LocalBroker:
+    def __init__(self):
+        self.lock = threading.RLock()
+        # exchange name -> exchange type
+        self.exchanges = {"": "direct"}
+        # exchange name -> [(is_exchange, destination, routing_key)]
+        self.bindings = defaultdict(list)
+        self.queues = {}
+
+    def declare_exchange(self, exchange, exchange_type):
+        with self.lock:
+            self.exchanges.setdefault(exchange, exchange_type)
+
+    def declare_queue(self, name, arguments=None):
+        with self.lock:
+            if name not in self.queues:
+                self.queues[name] = LocalQueue(
+                    name, bool((arguments or {}).get("x-single-active-consumer"))
+                )
+            return self.queues[name]
+
+    def bind(self, exchange, destination, routing_key="", is_exchange=False):
+        with self.lock:
+            binding = (is_exchange, destination, routing_key or "")
+            if binding not in self.bindings[exchange]:
+                self.bindings[exchange].append(binding)
+
+    def route(self, exchange, routing_key):
+        # Returns the names of the queues a message published to the exchange ends up in
+        if exchange == "":
+            return [routing_key] if routing_key in self.queues else []
+
+        exchange_type = self.exchanges.get(exchange)
+        bindings = self.bindings[exchange]
+        if exchange_type == "fanout":
+            targets = bindings
+        elif exchange_type == "x-consistent-hash":
+            # Each binding's routing key is its weight. This isn't RabbitMQ's hash ring, but it's just as
+            # stable for a fixed set of bindings, which is all the services rely on.
+            weights = [int(binding_key or 1) for _, _, binding_key in bindings]
+            if not weights:
+                return []
+            point = zlib.crc32(routing_key.encode()) % sum(weights)
+            for binding, weight in zip(bindings, weights):
+                if point < weight:
+                    targets = [binding]
+                    break
+                point -= weight
+        else:
+            targets = [binding for binding in bindings if binding[2] == routing_key]
+
+        queue_names = []
+        for is_exchange, destination, _ in targets:
+            if is_exchange:
+                queue_names.extend(self.route(destination, routing_key))
+            else:
+                queue_names.append(destination)
+        return queue_names
+
+    def publish(self, exchange, routing_key, body, properties=None):
+        message = SimpleNamespace(
+            exchange=exchange,
+            routing_key=routing_key,
+            body=body,
+            properties=properties or SimpleNamespace(headers=None, message_id=None),
+        )
+        with self.lock:
+            for queue_name in self.route(exchange, routing_key):
+                local_queue = self.queues[queue_name]
+                local_queue.messages.append(message)
+                self.dispatch(local_queue)
+
+    def dispatch(self, local_queue):
+        # Hands queued messages to consumers with room for them, round robin unless only the first
+        # consumer is active
+        while local_queue.messages and local_queue.consumers:
+            if local_queue.single_active_consumer:
+                candidates = local_queue.consumers[:1]
+            else:
+                count = len(local_queue.consumers)
+                start = local_queue.next_consumer % count
+                candidates = local_queue.consumers[start:] + local_queue.consumers[:start]
+
+            consumer = next((candidate for candidate in candidates if candidate.has_room()), None)
+            if consumer is None:
+                return
+            local_queue.next_consumer += 1
+            consumer.deliver(local_queue.name, local_queue.messages.popleft())
+
+    def add_consumer(self, queue_name, consumer):
+        with self.lock:
+            local_queue = self.declare_queue(queue_name)
+            local_queue.consumers.append(consumer)
+            self.dispatch(local_queue)
+
+    def remove_consumer(self, queue_name, consumer):
+        with self.lock:
+            local_queue = self.queues[queue_name]
+            if consumer in local_queue.consumers:
+                local_queue.consumers.remove(consumer)
+            self.dispatch(local_queue)
+
+    def requeue(self, queue_name, messages):
+        with self.lock:
+            local_queue = self.queues[queue_name]
+            local_queue.messages.extendleft(reversed(messages))
+            self.dispatch(local_queue)
+
+    def pump(self, queue_names):
+        # Called when consumers have made room by acking
+        with self.lock:
+            for queue_name in queue_names:
+                self.dispatch(self.queues[queue_name])
+
+    def is_drained(self):
+        # True once every queue that's being consumed is empty and its consumers have handled every
+        # message delivered to them. Services that ack on an interval may not have acked them yet.
+        with self.lock:
+            return all(
+                not local_queue.messages
+                and not any(consumer.is_busy() for consumer in local_queue.consumers)
+                for local_queue in self.queues.values()
+                if local_queue.consumers
+            )
+
+    def message_count(self, queue_name=None):
+        with self.lock:
+            if queue_name is not None:
+                return len(self.queues[queue_name].messages)
+            return sum(len(local_queue.messages) for local_queue in self.queues.values())
+
+
+# Shared by every connection in the process
+BROKER = LocalBroker()
+
+
+class LocalConsumer:
+    def __init__(self, channel, queue_name, callback):
+        self.channel = channel
+        self.queue_name = queue_name
+        self.callback = callback
+
+    def has_room(self):
+        return self.channel.has_room()
+
+    def is_busy(self):
+        return self.channel.undelivered > 0
+
+    def deliver(self, queue_name, message):
+        self.channel.deliver(self, queue_name, message)
+
+
+# Replaces pika.BlockingConnection. Deliveries, timers and threadsafe callbacks all run on the thread
+# that's consuming, as they do with pika.
+class LocalBlockingConnection:
+    def __init__(self, parameters=None, broker=None):
+        self.broker = broker or BROKER
+        self.events = queue.Queue()
+        self.timers = []
+        self.timer_sequence = itertools.count()
+        self.local_channel = LocalBlockingChannel(self)
+
+    def channel(self):
+        return self.local_channel
+
+    def call_later(self, delay, callback):
+        heapq.heappush(
+            self.timers, (time.monotonic() + delay, next(self.timer_sequence), callback)
+        )
+
+    def add_callback_threadsafe(self, callback):
+        self.events.put(callback)
+
+    def process_data_events(self, time_limit=0):
+        deadline = time.monotonic() + time_limit
+        while True:
+            now = time.monotonic()
+            while self.timers and self.timers[0][0] <= now:
+                heapq.heappop(self.timers)[2]()
+
+            timeout = deadline - now
+            if self.timers:
+                timeout = min(timeout, self.timers[0][0] - now)
+            try:
+                event = self.events.get(timeout=max(timeout, 0))
+            except queue.Empty:
+                if time.monotonic() >= deadline:
+                    return
+                continue
+            event()
+
+    def sleep(self, duration):
+        self.process_data_events(time_limit=duration)
+
+    def close(self):
+        self.local_channel.close()
+
+
+class LocalBlockingChannel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.broker = connection.broker
+        self.lock = threading.Lock()
+        self.prefetch_count = 0
+        self.delivery_tags = itertools.count(1)
+        # delivery tag -> (queue name, message)
+        self.unacked = {}
+        # Deliveries waiting for the consuming thread to call their callback
+        self.undelivered = 0
+        self.consumers = []
+        self.pump_counter = itertools.count()
+        self.consuming = False
+
+    def confirm_delivery(self):
+        pass
+
+    def exchange_declare(self, exchange, exchange_type="direct", **kwargs):
+        self.broker.declare_exchange(exchange, exchange_type)
+
+    def exchange_bind(self, destination, source, routing_key="", arguments=None):
+        self.broker.bind(source, destination, routing_key, is_exchange=True)
+
+    def queue_declare(self, queue, durable=False, arguments=None, **kwargs):
+        local_queue = self.broker.declare_queue(queue, arguments)
+        return SimpleNamespace(method=SimpleNamespace(message_count=len(local_queue.messages)))
+
+    def queue_bind(self, queue, exchange, routing_key=None, arguments=None):
+        self.broker.bind(exchange, queue, routing_key)
+
+    def basic_qos(self, prefetch_count=0):
+        self.prefetch_count = prefetch_count
+
+    def basic_consume(self, queue, on_message_callback, **kwargs):
+        consumer = LocalConsumer(self, queue, on_message_callback)
+        self.consumers.append(consumer)
+        self.broker.add_consumer(queue, consumer)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, **kwargs):
+        self.broker.publish(exchange, routing_key, body, properties)
+
+    def has_room(self):
+        return not self.prefetch_count or len(self.unacked) < self.prefetch_count
+
+    def deliver(self, consumer, queue_name, message):
+        # Called by the broker, from whichever thread published
+        with self.lock:
+            delivery_tag = next(self.delivery_tags)
+            self.unacked[delivery_tag] = (queue_name, message)
+            self.undelivered += 1
+
+        method = SimpleNamespace(
+            delivery_tag=delivery_tag,
+            routing_key=message.routing_key,
+            exchange=message.exchange,
+        )
+
+        def dispatch():
+            # Deliveries still waiting when the consumer was cancelled stay unacked, so they're
+            # requeued when the channel closes
+            try:
+                if consumer in self.consumers:
+                    consumer.callback(self, method, message.properties, message.body)
+            finally:
+                with self.lock:
+                    self.undelivered -= 1
+
+        self.connection.events.put(dispatch)
+
+    def settle(self, delivery_tag, multiple):
+        with self.lock:
+            if multiple:
+                tags = [tag for tag in self.unacked if tag <= delivery_tag]
+            else:
+                tags = [delivery_tag] if delivery_tag in self.unacked else []
+            return [self.unacked.pop(tag) for tag in tags]
+
+    def pump(self):
+        # Acking makes room under the prefetch count for every queue the channel consumes, not just
+        # the ones the acked messages came from. Start from a different queue each time so they take
+        # turns, as they do in RabbitMQ.
+        queue_names = [consumer.queue_name for consumer in self.consumers]
+        if not queue_names:
+            return
+        start = next(self.pump_counter) % len(queue_names)
+        with self.broker.lock:
+            for queue_name in queue_names[start:] + queue_names[:start]:
+                if not self.has_room():
+                    return
+                self.broker.dispatch(self.broker.queues[queue_name])
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self.settle(delivery_tag, multiple)
+        self.pump()
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        settled = self.settle(delivery_tag, multiple)
+        if requeue:
+            messages_by_queue = defaultdict(list)
+            for queue_name, message in settled:
+                messages_by_queue[queue_name].append(message)
+            for queue_name, messages in messages_by_queue.items():
+                self.broker.requeue(queue_name, messages)
+        self.pump()
+
+    def start_consuming(self):
+        self.consuming = True
+        while self.consuming:
+            self.connection.process_data_events(time_limit=0.1)
+
+    def stop_consuming(self):
+        for consumer in self.consumers:
+            self.broker.remove_consumer(consumer.queue_name, consumer)
+        self.consumers = []
+        self.consuming = False
+
+    def close(self):
+        self.stop_consuming()
+        with self.lock:
+            unacked, self.unacked = self.unacked, {}
+        messages_by_queue = defaultdict(list)
+        for _, (queue_name, message) in sorted(unacked.items()):
+            messages_by_queue[queue_name].append(message)
+        for queue_name, messages in messages_by_queue.items():
+            self.broker.requeue(queue_name, messages)
+
+
+# Replaces aio_pika.connect_robust and the objects it hands out. Messages are passed to each consumer
+# through an asyncio queue on the event loop that's consuming.
+async def connect_robust(url=None, broker=None, **kwargs):
+    return LocalAsyncConnection(broker or BROKER)
+
+
+class LocalAsyncConnection:
+    def __init__(self, broker):
+        self.broker = broker
+
+    async def channel(self):
+        return LocalAsyncChannel(self.broker)
+
+    async def close(self):
+        pass
+
+
+class LocalAsyncChannel:
+    def __init__(self, broker):
+        self.broker = broker
+        self.prefetch_count = 0
+
+    async def set_qos(self, prefetch_count=0):
+        self.prefetch_count = prefetch_count
+
+    async def declare_exchange(self, name, exchange_type="direct", **kwargs):
+        # Accepts aio_pika.ExchangeType or its value
+        self.broker.declare_exchange(name, getattr(exchange_type, "value", exchange_type))
+        return LocalAsyncExchange(self.broker, name)
+
+    async def declare_queue(self, name, durable=False, arguments=None, **kwargs):
+        self.broker.declare_queue(name, arguments)
+        return LocalAsyncQueue(self, name)
+
+
+class LocalAsyncExchange:
+    def __init__(self, broker, name):
+        self.broker = broker
+        self.name = name
+
+    async def publish(self, message, routing_key=""):
+        properties = SimpleNamespace(
+            headers=getattr(message, "headers", None),
+            message_id=getattr(message, "message_id", None),
+        )
+        self.broker.publish(self.name, routing_key, message.body, properties)
+
+
+class LocalAsyncQueue:
+    def __init__(self, channel, name):
+        self.channel = channel
+        self.broker = channel.broker
+        self.name = name
+
+    async def bind(self, exchange, routing_key=""):
+        self.broker.bind(getattr(exchange, "name", exchange), self.name, routing_key)
+
+    async def purge(self):
+        with self.broker.lock:
+            self.broker.queues[self.name].messages.clear()
+
+    def iterator(self):
+        return LocalQueueIterator(self)
+
+
+class LocalQueueIterator:
+    def __init__(self, local_queue):
+        self.local_queue = local_queue
+        self.broker = local_queue.broker
+        self.messages = asyncio.Queue()
+        self.loop = None
+        self.unacked = 0
+
+    def has_room(self):
+        prefetch_count = self.local_queue.channel.prefetch_count
+        return not prefetch_count or self.unacked < prefetch_count
+
+    def is_busy(self):
+        return self.unacked > 0
+
+    def deliver(self, queue_name, message):
+        # Called by the broker, from whichever thread published
+        self.unacked += 1
+        incoming = LocalIncomingMessage(self, message)
+        self.loop.call_soon_threadsafe(self.messages.put_nowait, incoming)
+
+    def settle(self, message, requeue=False):
+        # deliver runs under the broker's lock on the publishing thread, so take it here too
+        with self.broker.lock:
+            self.unacked -= 1
+        if requeue:
+            self.broker.requeue(self.local_queue.name, [message])
+        self.broker.pump([self.local_queue.name])
+
+    async def __aenter__(self):
+        self.loop = asyncio.get_running_loop()
+        self.broker.add_consumer(self.local_queue.name, self)
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        self.broker.remove_consumer(self.local_queue.name, self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.messages.get()
+
+
+class LocalIncomingMessage:
+    def __init__(self, iterator, message):
+        self.iterator = iterator
+        self.message = message
+        self.body = message.body
+        self.routing_key = message.routing_key
+        self.headers = getattr(message.properties, "headers", None) or {}
+        self.message_id = getattr(message.properties, "message_id", None)
+        self.processed = False
+
+    async def ack(self):
+        if not self.processed:
+            self.processed = True
+            self.iterator.settle(self.message)
+
+    async def reject(self, requeue=False):
+        if not self.processed:
+            self.processed = True
+            self.iterator.settle(self.message, requeue=requeue)
+
+    def process(self, requeue=False, ignore_processed=False):
+        return LocalMessageProcess(self, requeue, ignore_processed)
+
+
+class LocalMessageProcess:
+    # Acks when the block succeeds and rejects when it raises, like aio_pika's message.process()
+    def __init__(self, message, requeue, ignore_processed):
+        self.message = message
+        self.requeue = requeue
+        self.ignore_processed = ignore_processed
+
+    async def __aenter__(self):
+        return self.message
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if self.ignore_processed and self.message.processed:
+            return
+        if exc_type is None:
+            await self.message.ack()
+        else:
+            await self.message.reject(requeue=self.requeue)
+
+
+# Lua scripts can't run locally, so services register a Python version of each script they use. The
+# function is passed the store along with the script's keys and args.
+LOCAL_SCRIPTS = {}
+
+
+def register_local_script(script, function):
+    LOCAL_SCRIPTS[script] = function
+
+
+class LocalScript:
+    def __init__(self, store, script):
+        self.store = store
+        self.function = LOCAL_SCRIPTS[script]
+
+    async def __call__(self, keys=(), args=()):
+        return await self.function(self.store, list(keys), list(args))
+
+
+# Stands in for redis.RedisError. The in-process store doesn't fail, so nothing raises it.
+class LocalKeyValueStoreError(Exception):
+    pass
+
+
+# Replaces the redis.asyncio client with a dict. Keys can have a time to live, and expired keys are
+# removed and reported to expiry listeners the next time the store is used, like Redis keyspace
+# notifications. Values and members are returned as bytes, as redis-py does by default.
+class LocalKeyValueStore:
+    def __init__(self):
+        self.values = {}
+        # key -> monotonic expiry time
+        self.expiry_times = {}
+        self.expiry_heap = []
+        self.expiry_listeners = []
+
+    def add_expiry_listener(self, callback):
+        # callback is called with the name of every key that expires
+        self.expiry_listeners.append(callback)
+
+    def expire_keys(self):
+        now = time.monotonic()
+        while self.expiry_heap and self.expiry_heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self.expiry_heap)
+            # Skip entries whose key has since been given a new time to live or deleted
+            if self.expiry_times.get(key) != expires_at:
+                continue
+            del self.expiry_times[key]
+            self.values.pop(key, None)
+            for callback in self.expiry_listeners:
+                callback(key)
+
+    def set_expiry(self, key, seconds):
+        expires_at = time.monotonic() + seconds
+        self.expiry_times[key] = expires_at
+        heapq.heappush(self.expiry_heap, (expires_at, key))
+
+    @staticmethod
+    def encode(value):
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode()
+
+    async def get(self, key):
+        self.expire_keys()
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.expire_keys()
+        self.values[key] = self.encode(value)
+        self.expiry_times.pop(key, None)
+        if ex is not None:
+            self.set_expiry(key, ex)
+        return True
+
+    async def expire(self, key, seconds):
+        self.expire_keys()
+        if key not in self.values:
+            return False
+        self.set_expiry(key, seconds)
+        return True
+
+    async def delete(self, *keys):
+        self.expire_keys()
+        deleted = 0
+        for key in keys:
+            if self.values.pop(key, None) is not None:
+                deleted += 1
+            self.expiry_times.pop(key, None)
+        return deleted
+
+    async def exists(self, *keys):
+        self.expire_keys()
+        return sum(key in self.values for key in keys)
+
+    async def zadd(self, key, mapping):
+        self.expire_keys()
+        sorted_set = self.values.setdefault(key, {})
+        added = 0
+        for member, score in mapping.items():
+            member = self.encode(member)
+            added += member not in sorted_set
+            sorted_set[member] = float(score)
+        return added
+
+    async def zrem(self, key, *members):
+        self.expire_keys()
+        sorted_set = self.values.get(key, {})
+        return sum(sorted_set.pop(self.encode(member), None) is not None for member in members)
+
+    async def zscore(self, key, member):
+        self.expire_keys()
+        return self.values.get(key, {}).get(self.encode(member))
+
+    async def zrangebyscore(self, key, min, max):
+        self.expire_keys()
+        low, high = float(min), float(max)
+        return [
+            member
+            for member, score in sorted(self.values.get(key, {}).items(), key=lambda item: item[1])
+            if low <= score <= high
+        ]
+
+    async def zremrangebyscore(self, key, min, max):
+        members = await self.zrangebyscore(key, min, max)
+        return await self.zrem(key, *members)
+
+    def register_script(self, script):
+        return LocalScript(self, script)
+
+    async def close(self):
+        pass
+
+
+# Replaces chat_database_connection.DatabaseConnection with SQLite. Each Cassandra table is a table
+# here with the same primary key, and each method returns what the Cassandra version does. The
+# database is in memory unless a path is given.
+class LocalChatDatabase:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS chats (
+            broadcaster_id INTEGER, timestamp INTEGER, message_id TEXT, message_blob BLOB,
+            PRIMARY KEY (broadcaster_id, timestamp, message_id)
+        );
+        CREATE TABLE IF NOT EXISTS chats_by_user (
+            broadcaster_id INTEGER, user_id INTEGER, timestamp INTEGER, message_id TEXT, message_blob BLOB,
+            PRIMARY KEY (broadcaster_id, user_id, timestamp, message_id)
+        );
+        CREATE TABLE IF NOT EXISTS chat_threads (
+            broadcaster_id INTEGER, thread_id TEXT, timestamp INTEGER, message_id TEXT,
+            PRIMARY KEY (broadcaster_id, thread_id, timestamp, message_id)
+        );
+        CREATE TABLE IF NOT EXISTS chat_stats (
+            broadcaster_id INTEGER, day INTEGER, resolution INTEGER, timestamp INTEGER,
+            message_count INTEGER, bits INTEGER, emote_count INTEGER,
+            unique_chatters INTEGER, chatters_sketch BLOB,
+            PRIMARY KEY (broadcaster_id, day, resolution, timestamp)
+        );
+        CREATE TABLE IF NOT EXISTS emote_sketches (
+            broadcaster_id INTEGER, day INTEGER, resolution INTEGER, timestamp INTEGER, sketch BLOB,
+            expires_at REAL,
+            PRIMARY KEY (broadcaster_id, day, resolution, timestamp)
+        );
+        CREATE TABLE IF NOT EXISTS search_postings (
+            broadcaster_id INTEGER, day INTEGER, term TEXT, time_window INTEGER, segment_id TEXT,
+            postings BLOB,
+            PRIMARY KEY (broadcaster_id, day, term, time_window, segment_id)
+        );
+        CREATE TABLE IF NOT EXISTS clips (
+            timestamp INTEGER, clip_id TEXT, embed_url TEXT, thumbnail_url TEXT,
+            PRIMARY KEY (timestamp, clip_id)
+        );
+    """
+
+    def __init__(self, path=":memory:"):
+        # Every service in the process shares one connection, so guard it with a lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(self.SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        pass
+
+    def execute(self, statement, parameters=()):
+        with self.lock, self.connection:
+            return self.connection.execute(statement, parameters).fetchall()
+
+    def execute_many(self, statement, parameters):
+        with self.lock, self.connection:
+            self.connection.executemany(statement, parameters)
+
+    @staticmethod
+    def to_chat_rows(rows):
+        # Same shape as the Cassandra rows, where the old message column is always empty
+        return [
+            (broadcaster_id, timestamp, uuid.UUID(message_id), None, message_blob)
+            for broadcaster_id, timestamp, message_id, message_blob in rows
+        ]
+
+    def insert_chats(self, messages):
+        logging.info(f"Inserting {len(messages)} message")
+        self.execute_many(
+            "INSERT OR REPLACE INTO chats VALUES (?, ?, ?, ?)",
+            [
+                (broadcaster_id, timestamp, str(message_id), message_blob)
+                for broadcaster_id, timestamp, message_id, message_blob in messages
+            ],
+        )
+        return True, [], []
+
+    def insert_user_chats(self, messages):
+        self.execute_many(
+            "INSERT OR REPLACE INTO chats_by_user VALUES (?, ?, ?, ?, ?)",
+            [
+                (broadcaster_id, user_id, timestamp, str(message_id), message_blob)
+                for broadcaster_id, user_id, timestamp, message_id, message_blob in messages
+            ],
+        )
+        return True, [], []
+
+    def insert_thread_replies(self, replies):
+        self.execute_many(
+            "INSERT OR REPLACE INTO chat_threads VALUES (?, ?, ?, ?)",
+            [
+                (broadcaster_id, str(thread_id), timestamp, str(message_id))
+                for broadcaster_id, thread_id, timestamp, message_id in replies
+            ],
+        )
+        return True, [], []
+
+    def get_chats(self, broadcaster_id, start, end, limit):
+        rows = self.execute(
+            """
+            SELECT broadcaster_id, timestamp, message_id, message_blob FROM chats
+            WHERE broadcaster_id=? AND timestamp>=? AND timestamp<=?
+            ORDER BY timestamp, message_id LIMIT ?
+            """,
+            (broadcaster_id, start, end, limit),
+        )
+        return True, self.to_chat_rows(rows)
+
+    def get_chats_by_user(self, broadcaster_id, user_id, start, end, limit):
+        rows = self.execute(
+            """
+            SELECT broadcaster_id, timestamp, message_id, message_blob FROM chats_by_user
+            WHERE broadcaster_id=? AND user_id=? AND timestamp>=? AND timestamp<=?
+            ORDER BY timestamp, message_id LIMIT ?
+            """,
+            (broadcaster_id, user_id, start, end, limit),
+        )
+        return True, self.to_chat_rows(rows)
+
+    def get_chats_by_key(self, keys):
+        rows = []
+        for broadcaster_id, timestamp, message_id in keys:
+            rows.extend(
+                self.execute(
+                    """
+                    SELECT broadcaster_id, timestamp, message_id, message_blob FROM chats
+                    WHERE broadcaster_id=? AND timestamp=? AND message_id=?
+                    """,
+                    (broadcaster_id, timestamp, str(message_id)),
+                )
+            )
+        return True, self.to_chat_rows(rows)
+
+    def get_thread_replies(self, broadcaster_id, thread_id, limit):
+        rows = self.execute(
+            """
+            SELECT timestamp, message_id FROM chat_threads
+            WHERE broadcaster_id=? AND thread_id=? ORDER BY timestamp, message_id LIMIT ?
+            """,
+            (broadcaster_id, str(thread_id), limit),
+        )
+        return True, [
+            (broadcaster_id, timestamp, uuid.UUID(message_id)) for timestamp, message_id in rows
+        ]
+
+    def scan_uncompressed_chats(self, broadcaster_id=None, month=None):
+        # Messages have always been stored encoded here
+        return iter(())
+
+    def insert_chat_stats(self, stats):
+        # Counts are added to the bucket like Cassandra counters, and unique chatters overwritten
+        self.execute_many(
+            """
+            INSERT INTO chat_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (broadcaster_id, day, resolution, timestamp) DO UPDATE SET
+                message_count = message_count + excluded.message_count,
+                bits = bits + excluded.bits,
+                emote_count = emote_count + excluded.emote_count,
+                unique_chatters = excluded.unique_chatters,
+                chatters_sketch = excluded.chatters_sketch
+            """,
+            stats,
+        )
+        return True, []
+
+    def get_chat_stats(self, broadcaster_id, day, resolution):
+        rows = self.execute(
+            """
+            SELECT timestamp, message_count, unique_chatters, bits, emote_count FROM chat_stats
+            WHERE broadcaster_id=? AND day=? AND resolution=? ORDER BY timestamp
+            """,
+            (broadcaster_id, day, resolution),
+        )
+        return True, rows
+
+    def get_chatter_sketches(self, broadcaster_id, ranges):
+        sketches = []
+        for day, resolution, start, end in ranges:
+            sketches.extend(
+                sketch
+                for (sketch,) in self.execute(
+                    """
+                    SELECT chatters_sketch FROM chat_stats
+                    WHERE broadcaster_id=? AND day=? AND resolution=? AND timestamp>=? AND timestamp<=?
+                    """,
+                    (broadcaster_id, day, resolution, start, end),
+                )
+                if sketch is not None
+            )
+        return True, sketches
+
+    def get_chatter_sketches_by_bucket(self, buckets):
+        sketches = {}
+        for bucket in buckets:
+            rows = self.execute(
+                """
+                SELECT chatters_sketch FROM chat_stats
+                WHERE broadcaster_id=? AND day=? AND resolution=? AND timestamp=?
+                """,
+                bucket,
+            )
+            sketches[bucket] = rows[0][0] if rows else None
+        return True, sketches
+
+    def insert_emote_sketches(self, sketches, ttl_by_resolution):
+        now = time.time()
+        self.execute_many(
+            "INSERT OR REPLACE INTO emote_sketches VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    broadcaster_id,
+                    day,
+                    resolution,
+                    timestamp,
+                    sketch,
+                    # A time to live of 0 means the row never expires
+                    now + ttl_by_resolution[resolution] if ttl_by_resolution[resolution] else None,
+                )
+                for broadcaster_id, day, resolution, timestamp, sketch in sketches
+            ],
+        )
+        return True
+
+    def get_emote_sketches(self, broadcaster_id, ranges):
+        rows = []
+        for day, resolution, start, end in ranges:
+            rows.extend(
+                self.execute(
+                    """
+                    SELECT resolution, timestamp, sketch FROM emote_sketches
+                    WHERE broadcaster_id=? AND day=? AND resolution=? AND timestamp>=? AND timestamp<=?
+                    AND (expires_at IS NULL OR expires_at > ?)
+                    """,
+                    (broadcaster_id, day, resolution, start, end, time.time()),
+                )
+            )
+        return True, rows
+
+    def insert_search_postings(self, rows):
+        self.execute_many(
+            "INSERT OR REPLACE INTO search_postings VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (broadcaster_id, day, term, window, str(segment_id), postings)
+                for broadcaster_id, day, term, window, segment_id, postings in rows
+            ],
+        )
+        return True
+
+    def compact_search_postings(self, rows):
+        with self.lock, self.connection:
+            for broadcaster_id, day, term, window, segment_id, postings, replaced in rows:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO search_postings VALUES (?, ?, ?, ?, ?, ?)",
+                    (broadcaster_id, day, term, window, str(segment_id), postings),
+                )
+                self.connection.executemany(
+                    """
+                    DELETE FROM search_postings
+                    WHERE broadcaster_id=? AND day=? AND term=? AND time_window=? AND segment_id=?
+                    """,
+                    [
+                        (broadcaster_id, day, term, window, str(replaced_segment_id))
+                        for replaced_segment_id in replaced
+                    ],
+                )
+        return True
+
+    def get_search_postings(self, broadcaster_id, terms, windows):
+        rows_by_term = {term: [] for term in terms}
+        for term in terms:
+            for day, first_window, last_window in windows:
+                rows_by_term[term].extend(
+                    self.execute(
+                        """
+                        SELECT time_window, postings FROM search_postings
+                        WHERE broadcaster_id=? AND day=? AND term=? AND time_window>=? AND time_window<=?
+                        """,
+                        (broadcaster_id, day, term, first_window, last_window),
+                    )
+                )
+        return True, rows_by_term
+
+    def insert_clip(self, timestamp, clip_id, embed_url, thumbnail_url):
+        self.execute(
+            "INSERT OR REPLACE INTO clips VALUES (?, ?, ?, ?)",
+            (timestamp, clip_id, embed_url, thumbnail_url),
+        )
+        return True
+
+    def get_clips(self, start, end):
+        rows = self.execute(
+            """
+            SELECT timestamp, clip_id, embed_url, thumbnail_url FROM clips
+            WHERE timestamp>=? AND timestamp<=? ORDER BY timestamp DESC LIMIT 100
+            """,
+            (start, end),
+        )
+        return True, rows
+
+
+# Every service in the process shares one key value store and one chat database, like they'd share
+# Redis and Cassandra
+KEY_VALUE_STORE = LocalKeyValueStore()
+CHAT_DATABASE = None
+CHAT_DATABASE_LOCK = threading.Lock()
+
+
+def get_key_value_store():
+    return KEY_VALUE_STORE
+
+
+def get_chat_database():
+    global CHAT_DATABASE
+    with CHAT_DATABASE_LOCK:
+        if CHAT_DATABASE is None:
+            # Set LOCAL_CHAT_DATABASE_PATH to keep the chat database between runs
+            CHAT_DATABASE = LocalChatDatabase(
+                path=os.environ.get("LOCAL_CHAT_DATABASE_PATH", ":memory:")
+            )
+        return CHAT_DATABASE
@@ -0,0 +1,40 @@
+import pybloomfilter
+
+
+# Remembers the Ids of recently ingested messages so redelivered or replayed messages can be dropped.
+# Messages are tracked in one bloom filter per minute of their sent timestamp. A duplicate always has
+# the same timestamp as the original, so only that minute's filter needs to be checked, and memory
+# stays bounded because filters older than the window are discarded.
+class MessageDeduplicator:
+    def __init__(self, window_minutes=10, capacity_per_minute=1000000, error_rate=1e-6):
+        self.window_minutes = window_minutes
+        self.capacity_per_minute = capacity_per_minute
+        # A false positive drops a message that isn't a duplicate, so keep this very low
+        self.error_rate = error_rate
+        self.filters = {}
+        self.latest_minute = 0
+
+    def is_duplicate(self, timestamp, message_id):
+        minute = timestamp // 60000
+
+        # Messages older than the window can't be checked. Let them through since writing the same
+        # row to Cassandra twice is idempotent.
+        if minute <= self.latest_minute - self.window_minutes:
+            return False
+
+        bloom_filter = self.filters.get(minute)
+        if bloom_filter is None:
+            bloom_filter = self.filters[minute] = pybloomfilter.BloomFilter(
+                self.capacity_per_minute, self.error_rate
+            )
+
+            if minute > self.latest_minute:
+                self.latest_minute = minute
+                self.filters = {
+                    m: f
+                    for m, f in self.filters.items()
+                    if m > self.latest_minute - self.window_minutes
+                }
+
+        # add returns whether the Id was already in the filter
+        return bloom_filter.add(message_id.bytes)
@@ -0,0 +1,82 @@
+import argparse
+import logging
+
+import chat_database_connection
+from chat_database_profiles import BULK_EXPORT_PROFILE, INGEST_PROFILE
+from chat_message_codec import encode_message
+
+
+# Rewrites rows that still store their message as JSON text into the encoded message_blob format.
+# Rows are read with the bulk export profile so the scan doesn't compete with interactive reads.
+def migrate(database, broadcaster_id, month, batch_size):
+    migrated = 0
+    text_bytes = 0
+    encoded_bytes = 0
+    batch = []
+
+    def flush():
+        if not database.replace_chat_messages(batch):
+            logging.error(f"Failed to migrate a batch of {len(batch)} messages")
+
+    for (
+        row_broadcaster_id,
+        year_month,
+        timestamp,
+        message_id,
+        message,
+    ) in database.scan_uncompressed_chats(broadcaster_id, month):
+        message_blob = encode_message(row_broadcaster_id, timestamp, message_id, message)
+        batch.append((row_broadcaster_id, year_month, timestamp, message_id, message_blob))
+
+        migrated += 1
+        text_bytes += len(message.encode())
+        encoded_bytes += len(message_blob)
+
+        if len(batch) >= batch_size:
+            flush()
+            batch = []
+            logging.info(f"Migrated {migrated} messages")
+
+    if batch:
+        flush()
+
+    if migrated:
+        logging.info(
+            f"Migrated {migrated} messages from {text_bytes} bytes to {encoded_bytes} bytes ({text_bytes / max(encoded_bytes, 1):.2f}x smaller)"
+        )
+    else:
+        logging.info("No messages needed migrating")
+
+
+def main():
+    logging.basicConfig(
+        filemode="w",
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Encode chat messages still stored as JSON text into the message_blob column"
+    )
+    parser.add_argument(
+        "--broadcaster-id",
+        type=int,
+        help="Only migrate this broadcaster. Requires --month. Defaults to the whole table.",
+    )
+    parser.add_argument(
+        "--month", type=int, help="Month of the partition to migrate in the format YYYYMM"
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    if (args.broadcaster_id is None) != (args.month is None):
+        parser.error("--broadcaster-id and --month must be used together")
+
+    database = chat_database_connection.DatabaseConnection(
+        "chat_data", write_profile=INGEST_PROFILE, read_profile=BULK_EXPORT_PROFILE
+    )
+    migrate(database, args.broadcaster_id, args.month, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ from concurrent import futures
 import gen.grpc.rate_limiter.rate_limiter_pb2 as rate_limiter_pb2
 import gen.grpc.rate_limiter.rate_limiter_pb2_grpc as rate_limiter_pb2_grpc
 import grpc
+from diagnostics import start_http_server
 
 
 class Window:
@@ -47,6 +48,8 @@ def serve():
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     )
 
+    start_http_server(9800)
+
     server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
     rate_limiter_pb2_grpc.add_RateLimiterServicer_to_server(
         RateLimiterServicer(limit=20), server
@@ -1,41 +1,171 @@
 import logging
+from contextlib import contextmanager
 
 import auth.secrets as secrets
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 
 
 class DatabaseConnection:
-    def __init__(self):
-        self.session = psycopg2.connect(secrets.get_neon_url())
+    def __init__(self, max_connections=4):
+        # The consumer and the background observation writer each need their own connection
+        self.pool = ThreadedConnectionPool(1, max_connections, secrets.get_neon_url())
 
     def __del__(self):
         self.close()
 
     def close(self):
-        self.session.close()
+        self.pool.closeall()
+
+    @contextmanager
+    def connection(self):
+        session = self.pool.getconn()
+        try:
+            yield session
+        finally:
+            self.pool.putconn(session)
 
     def insert_streamers(self, streamer_ids):
         logging.info(f"Inserting {len(streamer_ids)} streamer Ids")
 
-        with self.session.cursor() as cursor:
+        with self.connection() as session, session.cursor() as cursor:
             try:
-                cursor.executemany(
-                    "INSERT INTO Streamer (streamer_id) VALUES (%s) ON CONFLICT DO NOTHING",
-                    streamer_ids,
+                # Send the whole batch as a single array parameter so it's one statement and one round trip
+                cursor.execute(
+                    "INSERT INTO Streamer (streamer_id) SELECT unnest(%s::bigint[]) ON CONFLICT DO NOTHING",
+                    (list(streamer_ids),),
                 )
-                self.session.commit()
+                session.commit()
+                return True
             except psycopg2.Error as e:
                 logging.error(f"Error inserting streamers: {e}")
+                session.rollback()
+                return False
+
+    def upsert_streamer_observations(self, observed_at, observations):
+        # observations is a list of (streamer_id, user_login, rank) tuples from a single poll with at
+        # most one entry per streamer. observed_at is a timezone aware datetime.
+        logging.info(f"Upserting {len(observations)} streamer observations")
+
+        if not observations:
+            return True
+
+        streamer_ids, user_logins, ranks = (list(column) for column in zip(*observations))
+        # 0 is Monday at midnight UTC, 167 is Sunday at 11pm UTC
+        hour_of_week = observed_at.weekday() * 24 + observed_at.hour
+
+        with self.connection() as session, session.cursor() as cursor:
+            try:
+                # Both rollups are updated by one statement so a poll costs a single round trip
+                cursor.execute(
+                    """
+                    WITH observations AS (
+                        SELECT * FROM unnest(%(streamer_ids)s::bigint[], %(user_logins)s::text[], %(ranks)s::int[])
+                            AS o(streamer_id, user_login, rank)
+                    ), stats AS (
+                        INSERT INTO StreamerStats (streamer_id, user_login, first_seen, last_seen, peak_rank, polls_seen)
+                        SELECT streamer_id, user_login, %(observed_at)s, %(observed_at)s, rank, 1 FROM observations
+                        ON CONFLICT (streamer_id) DO UPDATE SET
+                            user_login = EXCLUDED.user_login,
+                            last_seen = GREATEST(StreamerStats.last_seen, EXCLUDED.last_seen),
+                            peak_rank = LEAST(StreamerStats.peak_rank, EXCLUDED.peak_rank),
+                            polls_seen = StreamerStats.polls_seen + 1
+                    )
+                    INSERT INTO StreamerHours (streamer_id, hour_of_week, polls_seen, best_rank)
+                    SELECT streamer_id, %(hour_of_week)s, 1, rank FROM observations
+                    ON CONFLICT (streamer_id, hour_of_week) DO UPDATE SET
+                        polls_seen = StreamerHours.polls_seen + 1,
+                        best_rank = LEAST(StreamerHours.best_rank, EXCLUDED.best_rank)
+                    """,
+                    {
+                        "streamer_ids": streamer_ids,
+                        "user_logins": user_logins,
+                        "ranks": ranks,
+                        "observed_at": observed_at,
+                        "hour_of_week": hour_of_week,
+                    },
+                )
+                session.commit()
+                return True
+            except psycopg2.Error as e:
+                logging.error(f"Error upserting streamer observations: {e}")
+                session.rollback()
+                return False
+
+    def get_streamer_stats(self, streamer_ids):
+        with self.connection() as session, session.cursor() as cursor:
+            try:
+                cursor.execute(
+                    """
+                    SELECT streamer_id, user_login, first_seen, last_seen, peak_rank, polls_seen FROM StreamerStats
+                    WHERE streamer_id = ANY(%s::bigint[])
+                    """,
+                    (list(streamer_ids),),
+                )
+                rows = cursor.fetchall()
+                session.commit()
+                return True, rows
+            except psycopg2.Error as e:
+                logging.error(f"Error executing query: {e}")
+                session.rollback()
+                return False, []
+
+    def get_streamer_hours(self, streamer_id):
+        with self.connection() as session, session.cursor() as cursor:
+            try:
+                cursor.execute(
+                    """
+                    SELECT hour_of_week, polls_seen, best_rank FROM StreamerHours
+                    WHERE streamer_id = %s
+                    ORDER BY hour_of_week
+                    """,
+                    (streamer_id,),
+                )
+                rows = cursor.fetchall()
+                session.commit()
+                return True, rows
+            except psycopg2.Error as e:
+                logging.error(f"Error executing query: {e}")
+                session.rollback()
+                return False, []
 
-    def get_streamers(self):
-        with self.session.cursor() as cursor:
+    def get_watch_list_changes(self, since=None):
+        # Returns every watch-list row changed at or after since, or the whole table when since is None.
+        # Rows are (tenant_id, streamer_id, removed, updated_at) in the order they changed.
+        with self.connection() as session, session.cursor() as cursor:
             try:
-                cursor.execute("SELECT streamer_id FROM Streamer")
+                cursor.execute(
+                    """
+                    SELECT tenant_id, streamer_id, removed_at IS NOT NULL, updated_at FROM WatchList
+                    WHERE %(since)s::timestamptz IS NULL OR updated_at >= %(since)s
+                    ORDER BY updated_at
+                    """,
+                    {"since": since},
+                )
                 rows = cursor.fetchall()
+                session.commit()
+                return True, rows
             except psycopg2.Error as e:
                 logging.error(f"Error executing query: {e}")
-                return []
+                session.rollback()
+                return False, []
 
-            logging.info(f"Retrieved {len(rows)} streamer Ids")
+    def get_streamers(self, fetch_size=10000):
+        count = 0
+        with self.connection() as session:
+            try:
+                # Naming the cursor makes it a server-side cursor, so rows are streamed fetch_size at a time
+                # instead of the whole table being loaded into memory
+                with session.cursor(name="get_streamers") as cursor:
+                    cursor.itersize = fetch_size
+                    cursor.execute("SELECT streamer_id FROM Streamer")
+                    for (streamer_id,) in cursor:
+                        count += 1
+                        yield streamer_id
+            except psycopg2.Error as e:
+                logging.error(f"Error executing query: {e}")
+            finally:
+                # Server-side cursors live inside a transaction, so end it once we're done reading
+                session.rollback()
 
-            return rows
+        logging.info(f"Retrieved {count} streamer Ids")
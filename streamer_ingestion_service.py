@@ -1,21 +1,36 @@
 import json
 import logging
+import os
+import queue
+import threading
+from datetime import datetime, timezone
 
-import auth.secrets as secrets
-import pika
+import infrastructure
 import pybloomfilter
 import streamer_database_connection
+from diagnostics import record_startup, start_http_server
 
 
 class StreamerIngestor:
     def __init__(self):
-        self.database = streamer_database_connection.DatabaseConnection()
-
-        self.bloom_filter = pybloomfilter.BloomFilter(10000000, 0.01)
+        database = infrastructure.connect_in_background(
+            streamer_database_connection.DatabaseConnection
+        )
 
-        self.message_queue_connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=secrets.get_cloudamqp_url())
+        # The bloom filter is backed by a memory-mapped file so it survives restarts. If the file
+        # already exists we reopen it instead of rebuilding it from the Streamer table.
+        self.bloom_filter_path = os.environ.get(
+            "STREAMER_BLOOM_FILTER_PATH", "streamer_bloom_filter.bloom"
         )
+        self.bloom_filter_is_new = not os.path.exists(self.bloom_filter_path)
+        if self.bloom_filter_is_new:
+            self.bloom_filter = pybloomfilter.BloomFilter(
+                10000000, 0.01, self.bloom_filter_path
+            )
+        else:
+            self.bloom_filter = pybloomfilter.BloomFilter.open(self.bloom_filter_path)
+
+        self.message_queue_connection = infrastructure.connect_message_queue()
         self.channel = self.message_queue_connection.channel()
 
         # The broadcaster exchange is updated with all live streamers periodically. We bind our own
@@ -30,44 +45,139 @@ class StreamerIngestor:
             exchange=self.broadcaster_exchange, queue=self.broadcaster_queue
         )
 
+        # New streamers are buffered across messages and inserted in a single statement. Messages
+        # aren't acked until the batch they belong to has been written.
+        self.new_streamers = set()
+        self.last_delivery_tag = None
+        self.unacked_message_count = 0
+        self.batch_size = 1000
+        self.flush_interval_seconds = 5
+
+        # Every live streamer is also recorded as an observation so we can track when they were last
+        # live, their peak rank and the hours they usually stream. Observations are keyed by streamer
+        # Id so a streamer appears at most once per flush, keeping the best rank we saw.
+        self.observations = {}
+
+        self.database = database.result()
+
+        # Observations are handed to a background thread to write so the database round trip doesn't
+        # delay acks. If the writer falls behind and its queue fills, flushes hold their acks until
+        # there's room, so the poller's messages back up in RabbitMQ rather than observations being
+        # lost.
+        self.observation_queue = queue.Queue(maxsize=16)
+        self.observation_writer = threading.Thread(
+            target=self.write_observations, daemon=True
+        )
+        self.observation_writer.start()
+
     def __del__(self):
         self.shutdown()
 
     def shutdown(self):
         self.message_queue_connection.close()
         self.database.close()
+        self.bloom_filter.close()
 
     def initialize_bloom_filter(self):
-        streamers = self.database.get_streamers()
-        logging.info(f"Initializing the bloom filter with {len(streamers)} streamers")
-        self.bloom_filter.update(streamers)
+        if not self.bloom_filter_is_new:
+            logging.info(
+                f"Reusing the bloom filter in {self.bloom_filter_path} with ~{self.bloom_filter.approx_len} streamers"
+            )
+            return
+
+        logging.info("Initializing the bloom filter from the streamer database")
+        self.bloom_filter.update(self.database.get_streamers())
+        self.bloom_filter.sync()
 
     def start_consuming_streamers(self):
-        self.channel.basic_qos(prefetch_count=1)
+        # Allow a full batch of messages to be outstanding since they're only acked once the batch is written
+        self.channel.basic_qos(prefetch_count=self.batch_size)
         self.channel.basic_consume(
             queue=self.broadcaster_queue,
             on_message_callback=self.handle_live_streamers,
         )
+        self.message_queue_connection.call_later(
+            self.flush_interval_seconds, self.flush_on_interval
+        )
         logging.info("Start consuming streamers from queue")
         self.channel.start_consuming()
 
     def handle_live_streamers(self, ch, method, properties, body):
-        streamers = json.loads(body.decode())
+        user_id, user_login, rank = json.loads(body.decode())
+
+        logging.debug("Received live streamer %s", user_login)
 
-        logging.info(f"Received {len(streamers)} live streamers")
+        observation = self.observations.get(user_id)
+        if observation is None or rank < observation[2]:
+            self.observations[user_id] = (user_id, user_login, rank)
 
         # Use the bloom filter to determine which streamers haven't been seen before
-        new_streamers = []
-        for user_id, _ in streamers:
-            if user_id not in self.bloom_filter:
-                new_streamers.append((user_id,))
-                self.bloom_filter.add(user_id)
+        if user_id not in self.bloom_filter:
+            self.new_streamers.add(user_id)
 
-        logging.info(f"Inserting {len(new_streamers)} new live streamers")
+        self.last_delivery_tag = method.delivery_tag
+        self.unacked_message_count += 1
 
-        self.database.insert_streamers(new_streamers)
+        if self.unacked_message_count >= self.batch_size:
+            self.flush_new_streamers()
 
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+    def flush_on_interval(self):
+        # Make sure a partial batch doesn't sit unacked when the poller is between polls
+        self.flush_new_streamers()
+        self.message_queue_connection.call_later(
+            self.flush_interval_seconds, self.flush_on_interval
+        )
+
+    def flush_new_streamers(self):
+        if self.last_delivery_tag is None:
+            return
+
+        # Only this thread adds to the queue, so once there's room here the put below won't block.
+        # Until then the observations keep merging and the interval flush tries again.
+        if self.observation_queue.full():
+            logging.warning(
+                f"Holding {self.unacked_message_count} streamer messages because the observation writer is behind"
+            )
+            return
+
+        if self.new_streamers:
+            logging.info(f"Inserting {len(self.new_streamers)} new live streamers")
+
+            if not self.database.insert_streamers(self.new_streamers):
+                # Put the messages back on the queue so the batch is retried
+                self.channel.basic_nack(
+                    delivery_tag=self.last_delivery_tag, multiple=True, requeue=True
+                )
+                # The observations are redelivered with the messages, so drop them to avoid counting
+                # them twice
+                self.observations = {}
+                self.new_streamers = set()
+                self.last_delivery_tag = None
+                self.unacked_message_count = 0
+                return
+
+            # Only record the streamers once they're in the database, and flush the memory-mapped
+            # file so the filter on disk stays in step with the table
+            self.bloom_filter.update(self.new_streamers)
+            self.bloom_filter.sync()
+
+        self.queue_observations()
+        self.channel.basic_ack(delivery_tag=self.last_delivery_tag, multiple=True)
+        self.new_streamers = set()
+        self.last_delivery_tag = None
+        self.unacked_message_count = 0
+
+    def queue_observations(self):
+        if not self.observations:
+            return
+
+        self.observation_queue.put((datetime.now(timezone.utc), list(self.observations.values())))
+        self.observations = {}
+
+    def write_observations(self):
+        while True:
+            observed_at, observations = self.observation_queue.get()
+            self.database.upsert_streamer_observations(observed_at, observations)
 
 
 def main():
@@ -77,8 +187,11 @@ def main():
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     )
 
+    start_http_server(9700)
+
     session = StreamerIngestor()
     session.initialize_bloom_filter()
+    record_startup("streamer_ingestion")
     session.start_consuming_streamers()
 
 
@@ -0,0 +1,33 @@
+import pytest
+from bench.microbenchmarks import build_benchmarks, check_equivalent
+from chat_database_utilities import get_cursor, get_primary_key_elements
+
+# The per-message functions that were rewritten for speed must keep returning exactly what the
+# versions they replaced did, over the same corpora the microbenchmarks time them on
+
+
+@pytest.fixture(scope="module")
+def benchmarks():
+    return build_benchmarks(5000)
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "get_month",
+        "get_day",
+        "is_guid",
+        "serialize_message",
+        "base62_encode",
+        "base62_decode",
+    ],
+)
+def test_matches_reference(benchmarks, name):
+    function, reference, corpus = benchmarks[name]
+    check_equivalent(name, function, reference, corpus)
+
+
+def test_cursor_round_trip(benchmarks):
+    _, _, cursors = benchmarks["get_primary_key_elements"]
+    for cursor in cursors:
+        assert get_cursor(get_primary_key_elements(cursor)) == cursor
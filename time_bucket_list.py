@@ -33,6 +33,19 @@ class RunningVariance:
     def standard_deviation(self):
         return self.variance() ** 0.5
 
+    def get_state(self):
+        # (count, mean, sum of squared differences from the mean), which is all that's needed to
+        # carry on from where this left off
+        return self.n, self.newM, self.newS
+
+    @classmethod
+    def from_state(cls, n, mean, squared_differences):
+        running_variance = cls()
+        running_variance.n = n
+        running_variance.oldM = running_variance.newM = mean
+        running_variance.oldS = running_variance.newS = squared_differences
+        return running_variance
+
 
 import logging
 
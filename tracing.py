@@ -0,0 +1,73 @@
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+
+from prometheus_client import Histogram
+
+# Headers stamped onto AMQP messages as they move through the pipeline. All of them are milliseconds
+# since the epoch, the same unit as the chat message timestamps.
+SENT_AT_HEADER = "x-sent-at"
+PUBLISHED_AT_HEADER = "x-published-at"
+DETECTED_AT_HEADER = "x-detected-at"
+# Messages derived from a chat message, like anomalies, carry its Id so they're sampled and exported
+# under its trace
+TRACE_ID_HEADER = "x-trace-id"
+
+# Shared by every service so they can all live in one process, with the service as a label
+STAGE_LATENCY = Histogram(
+    "pipeline_stage_latency_seconds",
+    "Time spent in each stage of the chat pipeline",
+    ["service", "stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+
+
+def now_milliseconds():
+    return int(time.time() * 1000)
+
+
+class Tracer:
+    def __init__(self, service):
+        self.service = service
+
+        # Set TRACE_SAMPLE_RATE to a value between 0 and 1 to write that fraction of messages' timings
+        # to TRACE_EXPORT_PATH as JSON lines. Sampling is keyed on the trace Id, so every service
+        # samples the same messages and their spans can be joined.
+        self.sample_rate = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))
+        self.export_file = None
+        if self.sample_rate > 0:
+            export_path = os.environ.get("TRACE_EXPORT_PATH", f"{service}_traces.jsonl")
+            self.export_file = open(export_path, "a")
+            logging.info(
+                f"Exporting {self.sample_rate:.2%} of {service} traces to {export_path}"
+            )
+
+        self.lock = threading.Lock()
+
+    def observe(self, stage, start, end):
+        # start and end are milliseconds since the epoch. Messages from before tracing was added
+        # won't have every header, so missing timings are skipped.
+        if start is None or end is None:
+            return
+
+        STAGE_LATENCY.labels(service=self.service, stage=stage).observe(
+            max(end - start, 0) / 1000
+        )
+
+    def time_stage(self, stage):
+        return STAGE_LATENCY.labels(service=self.service, stage=stage).time()
+
+    def is_sampled(self, trace_id):
+        if self.export_file is None or trace_id is None:
+            return False
+        return zlib.crc32(str(trace_id).encode()) % 10000 < self.sample_rate * 10000
+
+    def export(self, trace_id, timings):
+        # timings maps each event in the message's life, e.g. sent or consumed, to when it happened
+        span = {"trace_id": str(trace_id), "service": self.service, "timings": timings}
+        with self.lock:
+            self.export_file.write(json.dumps(span) + "\n")
+            self.export_file.flush()
@@ -2,12 +2,14 @@ import asyncio
 import concurrent.futures
 import json
 import logging
-import sys
+import os
+import time
 
-import auth.secrets as secrets
+import infrastructure
 import pika
 import twitch_proxy
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from diagnostics import record_startup, start_http_server
 from twitchAPI.type import TwitchAPIException
 
 
@@ -15,9 +17,7 @@ class TwitchAPIPoller:
     def __init__(self):
         self.twitch_session = twitch_proxy.TwitchAPIConnection()
 
-        self.message_queue_connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=secrets.get_cloudamqp_url())
-        )
+        self.message_queue_connection = infrastructure.connect_message_queue()
         self.channel = self.message_queue_connection.channel()
         self.channel.confirm_delivery()
 
@@ -28,25 +28,95 @@ class TwitchAPIPoller:
 
         self.streamer_allows_clipping = {}
 
+        # Twitch caches are 1 to 3 minutes stale, so it doesn't make sense to poll any more frequently than that
+        self.poll_interval_minutes = 2
+
+        # Probing whether a streamer allows clipping creates a clip, so only do it for the channels near
+        # the top of the directory. Everyone further down is published unless we already know they have
+        # clipping disabled.
+        self.clip_probe_limit = 100
+
+        # Maximum number of pages the crawler can fetch ahead of the publisher
+        self.crawl_prefetch_pages = 4
+
+        # pika's BlockingConnection isn't thread safe, so all crawl publishes go through a single thread.
+        # This lets the event loop keep fetching pages while a page is being published.
+        self.publish_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
     def __del__(self):
         self.shutdown()
 
     def shutdown(self):
+        self.publish_executor.shutdown()
         self.message_queue_connection.close()
         self.twitch_session.close()
 
     async def authenticate(self):
         await self.twitch_session.authenticate()
 
-    def start_polling_online_streamers(self):
-        # Twitch caches are 1 to 3 minutes stale, so it doesn't make sense to poll any more frequently than that
+    def start_polling_online_streamers(self, crawl_all=False):
         scheduler = AsyncIOScheduler()
-        scheduler.add_job(self.get_top_streamers, "interval", minutes=2, args=(100,))
+        if crawl_all:
+            scheduler.add_job(
+                self.get_all_streamers, "interval", minutes=self.poll_interval_minutes
+            )
+        else:
+            scheduler.add_job(
+                self.get_top_streamers,
+                "interval",
+                minutes=self.poll_interval_minutes,
+                args=(100,),
+            )
         scheduler.start()
 
     async def get_all_streamers(self):
         logging.info("Retrieving all currently live streamers")
-        await self.get_online_streamers(sys.maxint)
+        start = time.monotonic()
+
+        pages = asyncio.Queue(maxsize=self.crawl_prefetch_pages)
+        crawler = asyncio.create_task(self.twitch_session.crawl_online_streamers(pages))
+        loop = asyncio.get_running_loop()
+
+        rank = 0
+        try:
+            while True:
+                page = await pages.get()
+                if page is None:
+                    break
+
+                messages = []
+                for streamer in page:
+                    if not await self.allows_clipping(
+                        streamer, probe=rank < self.clip_probe_limit
+                    ):
+                        continue
+
+                    messages.append(self.serialize_streamer(streamer, rank))
+                    rank += 1
+
+                # Publish on the executor so the crawler can fetch the next page in the meantime
+                await loop.run_in_executor(
+                    self.publish_executor, self.publish_streamers, messages
+                )
+
+            # The crawler ends the queue with None however it finishes, so wait for it to find out
+            # whether it failed part way through
+            try:
+                await crawler
+            except Exception as e:
+                logging.error(
+                    f"Crawling live streamers failed after publishing {rank} of them: {e}"
+                )
+                return
+        finally:
+            crawler.cancel()
+
+        elapsed = time.monotonic() - start
+        logging.info(f"Published {rank} live streamers in {elapsed:.1f} seconds")
+        if elapsed > self.poll_interval_minutes * 60:
+            logging.warning(
+                f"Crawling all live streamers took longer than the {self.poll_interval_minutes} minute poll interval"
+            )
 
     async def get_top_streamers(self, n):
         logging.info(f"Retrieving top {n} currently live streamers")
@@ -58,29 +128,48 @@ class TwitchAPIPoller:
         counter = 0
         # Keep track of which streamers have clipping disabled.
         async for streamer in streamers:
-            user_id = streamer.user_id
-            user_login = streamer.user_login
-
-            # Check if we have already determined the clipping status for this streamer
-            allows_clipping = self.streamer_allows_clipping.get(user_id)
-
-            if allows_clipping is None:
-                try:
-                    await self.twitch_session.create_clip(user_id)
-                    self.streamer_allows_clipping[user_id] = True
-                except TwitchAPIException:
-                    self.streamer_allows_clipping[user_id] = False
-                    logging.info(
-                        f"Skipping {user_login} because they have clipping disabled."
-                    )
-                    continue
-            elif not allows_clipping:
-                logging.debug(
-                    f"Skipping {user_login} because we know they have clipping disabled."
-                )
+            if not await self.allows_clipping(streamer):
                 continue
 
-            message = json.dumps((int(streamer.user_id), streamer.user_login, counter))
+            self.publish_streamers([self.serialize_streamer(streamer, counter)])
+
+            counter += 1
+            if counter == batch_size:
+                return
+
+    async def allows_clipping(self, streamer, probe=True):
+        user_id = streamer.user_id
+        user_login = streamer.user_login
+
+        # Check if we have already determined the clipping status for this streamer
+        allows_clipping = self.streamer_allows_clipping.get(user_id)
+
+        if allows_clipping is None:
+            if not probe:
+                return True
+
+            try:
+                await self.twitch_session.create_clip(user_id)
+                self.streamer_allows_clipping[user_id] = True
+            except TwitchAPIException:
+                self.streamer_allows_clipping[user_id] = False
+                logging.info(
+                    f"Skipping {user_login} because they have clipping disabled."
+                )
+                return False
+        elif not allows_clipping:
+            logging.debug(
+                f"Skipping {user_login} because we know they have clipping disabled."
+            )
+            return False
+
+        return True
+
+    def serialize_streamer(self, streamer, rank):
+        return json.dumps((int(streamer.user_id), streamer.user_login, rank))
+
+    def publish_streamers(self, messages):
+        for message in messages:
             self.channel.basic_publish(
                 exchange=self.broadcaster_exchange,
                 routing_key="",
@@ -90,10 +179,6 @@ class TwitchAPIPoller:
                 ),
             )
 
-            counter += 1
-            if counter == batch_size:
-                return
-
 
 async def main():
     logging.basicConfig(
@@ -102,9 +187,15 @@ async def main():
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     )
 
+    start_http_server(9600)
+
     session = TwitchAPIPoller()
     await session.authenticate()
-    session.start_polling_online_streamers()
+    record_startup("twitch_polling")
+    # Set POLL_ALL_STREAMERS to crawl the whole live directory instead of just the top 100 streams
+    session.start_polling_online_streamers(
+        crawl_all=os.environ.get("POLL_ALL_STREAMERS", "false").lower() == "true"
+    )
 
     await asyncio.sleep(float("inf"))
 
@@ -2,19 +2,31 @@ import asyncio
 import json
 import logging
 import uuid
+from typing import TYPE_CHECKING
+
 import auth.secrets as secrets
+import infrastructure
 import pika
 import utilities
+from tracing import PUBLISHED_AT_HEADER, SENT_AT_HEADER, Tracer, now_milliseconds
 
 from prometheus_client import Counter
-from twitchAPI.chat import Chat, ChatMessage
-from twitchAPI.oauth import UserAuthenticator
-from twitchAPI.twitch import Twitch
-from twitchAPI.type import AuthScope, ChatEvent
-from twitchAPI.helper import first
+
+if TYPE_CHECKING:
+    from twitchAPI.chat import ChatMessage
+
+
+def import_twitch_api():
+    # twitchAPI and the aiohttp stack under it take around half a second to import, so they're only
+    # imported once something talks to Twitch. Services call this on a worker thread to have it done
+    # while their connections are opening.
+    import twitchAPI.chat
+    import twitchAPI.helper
+    import twitchAPI.twitch
+    import twitchAPI.type
 
 
-def is_valid_message(msg: ChatMessage):
+def is_valid_message(msg: "ChatMessage"):
     # Only validate the fields we a need to insert the message into the database
     if msg is None:
         logging.warning("msg is None")
@@ -38,52 +50,51 @@ def is_valid_message(msg: ChatMessage):
     return True
 
 
-def serialize_message(msg: ChatMessage):
-    room = {
-        "name": msg.room.name,
-        "is_emote_only": msg.room.is_emote_only,
-        "is_subs_only": msg.room.is_subs_only,
-        "is_followers_only": msg.room.is_followers_only,
-        "is_unique_only": msg.room.is_unique_only,
-        "follower_only_delay": msg.room.follower_only_delay,
-        "room_id": msg.room.room_id,
-        "slow": msg.room.slow,
-    }
-
-    user = {
-        "name": msg.user.name,
-        "badge_info": msg.user.badge_info,
-        "badges": msg.user.badges,
-        "color": msg.user.color,
-        "display_name": msg.user.display_name,
-        "mod": msg.user.mod,
-        "subscriber": msg.user.subscriber,
-        "turbo": msg.user.turbo,
-        "id": msg.user.id,
-        "user_type": msg.user.user_type,
-        "vip": msg.user.vip,
-    }
-
-    message = {
-        "text": msg.text,
-        "is_me": msg.is_me,
-        "bits": msg.bits,
-        "sent_timestamp": msg.sent_timestamp,
-        "reply_parent_msg_id": msg.reply_parent_msg_id,
-        "reply_parent_user_id": msg.reply_parent_user_id,
-        "reply_parent_user_login": msg.reply_parent_user_login,
-        "reply_parent_display_name": msg.reply_parent_display_name,
-        "reply_parent_msg_body": msg.reply_parent_msg_body,
-        "reply_thread_parent_msg_id": msg.reply_thread_parent_msg_id,
-        "reply_thread_parent_user_login": msg.reply_thread_parent_user_login,
-        "emotes": msg.emotes,
-        "id": msg.id,
-    }
-
-    message["room"] = room
-    message["user"] = user
-
-    return json.dumps(message)
+def serialize_message(msg: "ChatMessage"):
+    # Built as a single literal since this runs for every chat message. The key order is part of the
+    # stored format, so keep room and user last.
+    room = msg.room
+    user = msg.user
+    return json.dumps(
+        {
+            "text": msg.text,
+            "is_me": msg.is_me,
+            "bits": msg.bits,
+            "sent_timestamp": msg.sent_timestamp,
+            "reply_parent_msg_id": msg.reply_parent_msg_id,
+            "reply_parent_user_id": msg.reply_parent_user_id,
+            "reply_parent_user_login": msg.reply_parent_user_login,
+            "reply_parent_display_name": msg.reply_parent_display_name,
+            "reply_parent_msg_body": msg.reply_parent_msg_body,
+            "reply_thread_parent_msg_id": msg.reply_thread_parent_msg_id,
+            "reply_thread_parent_user_login": msg.reply_thread_parent_user_login,
+            "emotes": msg.emotes,
+            "id": msg.id,
+            "room": {
+                "name": room.name,
+                "is_emote_only": room.is_emote_only,
+                "is_subs_only": room.is_subs_only,
+                "is_followers_only": room.is_followers_only,
+                "is_unique_only": room.is_unique_only,
+                "follower_only_delay": room.follower_only_delay,
+                "room_id": room.room_id,
+                "slow": room.slow,
+            },
+            "user": {
+                "name": user.name,
+                "badge_info": user.badge_info,
+                "badges": user.badges,
+                "color": user.color,
+                "display_name": user.display_name,
+                "mod": user.mod,
+                "subscriber": user.subscriber,
+                "turbo": user.turbo,
+                "id": user.id,
+                "user_type": user.user_type,
+                "vip": user.vip,
+            },
+        }
+    )
 
 
 class TwitchAPIConnection:
@@ -94,15 +105,15 @@ class TwitchAPIConnection:
         self.write_lock = asyncio.Lock()
         self.channel_lock = asyncio.Lock()
 
+        self.tracer = Tracer("chat_listener")
+
         self.message_counter = Counter(
             "streamer_message_count",
             "Number of messages per streamer",
             ["broadcaster_id"],
         )
 
-        self.message_queue_connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=secrets.get_cloudamqp_url())
-        )
+        self.message_queue_connection = infrastructure.connect_message_queue()
         self.channel = self.message_queue_connection.channel()
         self.channel.confirm_delivery()
 
@@ -132,6 +143,9 @@ class TwitchAPIConnection:
         await self.twitch_session.close()
 
     async def authenticate(self):
+        from twitchAPI.twitch import Twitch
+        from twitchAPI.type import AuthScope
+
         self.twitch_session = await Twitch(
             secrets.get_twitch_api_client_id(), secrets.get_twitch_api_secret()
         )
@@ -142,6 +156,9 @@ class TwitchAPIConnection:
         )
 
     async def initialize_chat(self):
+        from twitchAPI.chat import Chat
+        from twitchAPI.type import ChatEvent
+
         self.chat = await Chat(self.twitch_session)
         self.chat.register_event(ChatEvent.MESSAGE, self.on_message)
         self.chat.start()
@@ -175,7 +192,7 @@ class TwitchAPIConnection:
             return
         logging.info(f"Left {streamer_name}'s chat room")
 
-    async def on_message(self, msg: ChatMessage):
+    async def on_message(self, msg: "ChatMessage"):
         if not is_valid_message(msg):
             logging.warning(
                 "Skipping message as it does not contain the necessary fields"
@@ -196,7 +213,10 @@ class TwitchAPIConnection:
         message = json.dumps(message_fields)
 
         logging.debug(
-            f"Message {message_fields['message_id']} posted in chat room {message_fields['broadcaster_id']} at {message_fields['timestamp']}"
+            "Message %s posted in chat room %s at %s",
+            message_fields["message_id"],
+            message_fields["broadcaster_id"],
+            message_fields["timestamp"],
         )
 
         self.message_counter.labels(
@@ -205,17 +225,32 @@ class TwitchAPIConnection:
 
         try:
             async with self.channel_lock:
+                # Stamp the hop timings into the headers so downstream services can measure how long
+                # the message spent in each stage. The message Id doubles as the trace Id.
+                published_at = now_milliseconds()
+                # The fanout exchange ignores the routing key, but consumers that partition chat by
+                # broadcaster hash on it
                 self.channel.basic_publish(
                     exchange=self.chat_exchange,
-                    routing_key="",
+                    routing_key=str(message_fields["broadcaster_id"]),
                     body=message,
                     properties=pika.BasicProperties(
-                        delivery_mode=pika.DeliveryMode.Persistent
+                        delivery_mode=pika.DeliveryMode.Persistent,
+                        message_id=message_fields["message_id"],
+                        headers={
+                            SENT_AT_HEADER: message_fields["timestamp"],
+                            PUBLISHED_AT_HEADER: published_at,
+                        },
                     ),
                 )
 
+            self.tracer.observe("publish", message_fields["timestamp"], published_at)
+
             logging.debug(
-                f"Published message, {message_fields['message_id']}, which was posted in chat room {message_fields['broadcaster_id']} at {message_fields['timestamp']}, to the message queue"
+                "Published message, %s, which was posted in chat room %s at %s, to the message queue",
+                message_fields["message_id"],
+                message_fields["broadcaster_id"],
+                message_fields["timestamp"],
             )
         except Exception as e:
             logging.error(f"Publishing message error: {e}")
@@ -231,10 +266,34 @@ class TwitchAPIConnection:
         )
         return streamers
 
+    async def crawl_online_streamers(self, pages, page_size=100):
+        # Helix caps the page size at 100. The generator returned by get_streams follows the pagination
+        # cursor for us and, whenever a response reports Ratelimit-Remaining as 0, sleeps until
+        # Ratelimit-Reset before the next request, so draining it respects the rate limit.
+        logging.info(f"Crawling all currently live streamers")
+        page = []
+        try:
+            async for streamer in self.twitch_session.get_streams(
+                first=page_size, stream_type="live"
+            ):
+                page.append(streamer)
+                if len(page) == page_size:
+                    # The queue is bounded, so we never get more than a few pages ahead of the consumer
+                    await pages.put(page)
+                    page = []
+
+            if page:
+                await pages.put(page)
+        finally:
+            # Let the consumer know there are no more pages, even if the crawl failed part way through
+            await pages.put(None)
+
     async def create_clip(self, broadcaster_id):
         response = await self.twitch_session.create_clip(broadcaster_id)
         return response.id
 
     async def get_clip(self, clip_id):
+        from twitchAPI.helper import first
+
         clip = await first(self.twitch_session.get_clips(clip_id=clip_id))
         return clip.id, clip.embed_url, clip.thumbnail_url
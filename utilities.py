@@ -1,8 +1,18 @@
 import base62
+import re
 import uuid
 
+# The canonical hyphenated form, which is what Twitch sends for message Ids
+GUID_PATTERN = re.compile(
+    r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+)
+
 
 def is_guid(string):
+    if GUID_PATTERN.fullmatch(string):
+        return True
+
+    # uuid.UUID accepts a few other spellings, like braces or no hyphens, so let it decide the rest
     try:
         uuid.UUID(string)
         return True
@@ -10,9 +20,70 @@ def is_guid(string):
         return False
 
 
+# base62.encodebytes and base62.decodebytes are quadratic in the length of the input, which makes
+# them the slowest part of handling a cursor. These produce exactly the same output, including the
+# library's "0" prefix encoding of leading null bytes.
+BASE62_CHARSET = base62.CHARSET_DEFAULT
+BASE62_VALUES = {character: value for value, character in enumerate(BASE62_CHARSET)}
+
+
+def base62_value(character):
+    try:
+        return BASE62_VALUES[character]
+    except KeyError:
+        raise ValueError(f"base62: Invalid character ({character})")
+
+
 def base62_encode(string):
-    return base62.encodebytes(string.encode())
+    data = string.encode()
+    value = data.lstrip(b"\0")
+
+    full_runs, remainder = divmod(len(data) - len(value), len(BASE62_CHARSET) - 1)
+    zero_padding = f"0{BASE62_CHARSET[-1]}" * full_runs
+    if remainder:
+        zero_padding += f"0{BASE62_CHARSET[remainder]}"
+
+    if not value:
+        return zero_padding
+
+    n = int.from_bytes(value, "big")
+    digits = []
+    while n > 0:
+        n, r = divmod(n, 62)
+        digits.append(BASE62_CHARSET[r])
+    digits.reverse()
+
+    return zero_padding + "".join(digits)
 
 
 def base62_decode(string):
-    return base62.decodebytes(string).decode()
+    leading_null_bytes = b""
+    while string.startswith("0") and len(string) >= 2:
+        leading_null_bytes += b"\0" * base62_value(string[1])
+        string = string[2:]
+
+    n = 0
+    for character in string:
+        n = n * 62 + base62_value(character)
+
+    return (leading_null_bytes + n.to_bytes((n.bit_length() + 7) // 8, "big")).decode()
+
+
+# Unsigned LEB128 varints, used to keep index postings and sketches compact
+def write_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append(value & 0x7F | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7